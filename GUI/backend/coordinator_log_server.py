@@ -7,16 +7,22 @@ from cassandra_interface import fetch_and_broadcast_data
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from fastapi.responses import JSONResponse
-from collections import deque
+from collections import deque, OrderedDict
 from cassandra.query import dict_factory
 from cassandra.cluster import Cluster
 from fastapi import Request
 import subprocess
 import os
 import json
-from log_parser import parse_log_line
+import itertools
+from log_ingest import ingest_stream, INGEST_STATS
+from log_hub import LogHub, LogFilter, FILTER_FIELDS
+from log_store import LogStore, LogQuery
+from db_snapshots import SnapshotRecorder, load_state, checkpoints
 from collections import defaultdict
-from lib.logger_utils import get_logger
+from lib.metrics import read_frames, decode_labels, summarize, Histogram, METRICS_PORT, HIST_MAGIC
+from lib.performance_monitor import new_trace_id
+from datetime import datetime
 from fastapi import Body
 from fastapi import FastAPI, HTTPException
 from cassandra.cluster import Cluster
@@ -30,13 +36,16 @@ from cassandra_interface import fetch_and_broadcast_data
 
 # Organized structured log buffers
 logs_by_type_and_source = defaultdict(lambda: defaultdict(lambda: deque(maxlen=MAX_LOG_BUFFER_SIZE)))
-logger_snapshot = get_logger("Database", "Snapshot")
 
 
 # === Config ===
 TCP_LOG_PORT = 5000
+TCP_METRICS_PORT = METRICS_PORT
 HTTP_PORT = 8000
 MAX_LOG_BUFFER_SIZE = 1000
+MAX_TRACES = 500                 # join/leave requests kept for /api/traces
+MAX_SPANS_PER_TRACE = 2000
+MAX_METRIC_SAMPLES = 5000        # raw samples kept for /api/metrics/samples
 
 # === State ===
 app = FastAPI()
@@ -45,7 +54,9 @@ app.include_router(heartbeat_api.router)
 log_buffer = deque(maxlen=MAX_LOG_BUFFER_SIZE)
 
 log_buffer_lock = asyncio.Lock()
-websocket_lock = asyncio.Lock()
+log_hub = LogHub()
+log_store = LogStore()
+snapshot_recorder = SnapshotRecorder()
 
 # === Serve Frontend ===
 BASE_DIR = os.path.dirname(__file__)
@@ -55,21 +66,6 @@ app.mount("/static", StaticFiles(directory=FRONTEND_DIR), name="static")
 # Global tracked process (if any)
 _HB_PROCESS = None
 
-class WebSocketClient:
-    def __init__(self, websocket):
-        self.websocket = websocket
-        self.filters = {"type": None, "source": None}
-
-def matches_filter(entry, filters):
-    if not filters:
-        return True
-    if filters["type"] and entry.get("type") != filters["type"]:
-        return False
-    if filters["source"] and entry.get("source") != filters["source"]:
-        return False
-    return True
-
-active_websocket: WebSocketClient | None = None
 
 
 
@@ -87,6 +83,7 @@ async def trigger_db_update(payload: dict = Body(...)):
 
     try:
         print(f"[DB Trigger] Received update request for table: {table}")
+        snapshot_recorder.mark_dirty(table)
         await fetch_and_broadcast_data(table)
         return {"status": "ok", "table": table}
     except Exception as e:
@@ -112,22 +109,30 @@ def get_index():
     return FileResponse(os.path.join(FRONTEND_DIR, "index.html"))
 
 # === WebSocket for logs ===
+def _parse_since(value):
+    # seqs start at 1: no seq seen yet means no replay
+    try:
+        since = int(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+    return since if since is not None and since > 0 else None
+
+
 @app.websocket("/ws/logs")
 async def websocket_log_stream(websocket: WebSocket):
-    global active_websocket
+    """
+    Log stream for one viewer, fed by log_hub in frames of
+    {"type": "logs", "logs": [...], "dropped": n}.
+    Filter fields (type, source, level, node) and `since` (last seq seen, to
+    resume after a reconnect) can be given as query parameters or sent later as
+    {"subscribe": {...}, "since": seq}.
+    """
     await websocket.accept()
-    print("[WebSocket] GUI client connected")
-
-    client = WebSocketClient(websocket)
-
-    async with websocket_lock:
-        active_websocket = client
-
-    # Send historical logs matching filter
-    async with log_buffer_lock:
-        for entry in log_buffer:
-            if matches_filter(entry, client.filters):
-                await websocket.send_text(json.dumps(entry))
+    params = websocket.query_params
+    client = log_hub.connect(websocket,
+                             LogFilter.from_dict({k: params.get(k) for k in FILTER_FIELDS}),
+                             _parse_since(params.get("since")))
+    print(f"[WebSocket] GUI client {client.id} connected ({len(log_hub.clients)} total)")
 
     try:
         while True:
@@ -135,16 +140,22 @@ async def websocket_log_stream(websocket: WebSocket):
             try:
                 parsed = json.loads(msg)
                 if isinstance(parsed, dict) and "subscribe" in parsed:
-                    client.filters["type"] = parsed["subscribe"].get("type")
-                    client.filters["source"] = parsed["subscribe"].get("source")
-                    print(f"[WebSocket] Client updated filters: {client.filters}")
+                    log_hub.subscribe(client, LogFilter.from_dict(parsed["subscribe"]),
+                                      _parse_since(parsed.get("since")))
+                    print(f"[WebSocket] Client {client.id} updated filters: {client.filter.describe()}")
             except Exception as e:
                 print(f"[WebSocket] Failed to parse message: {e}")
     except WebSocketDisconnect:
-        print("[WebSocket] GUI client disconnected")
-        async with websocket_lock:
-            if active_websocket == client:
-                active_websocket = None
+        pass
+    finally:
+        log_hub.disconnect(client)
+        print(f"[WebSocket] GUI client {client.id} disconnected ({len(log_hub.clients)} total)")
+
+
+@app.get("/api/log-clients")
+def get_log_clients():
+    """Connected log viewers with their filters, queue depth and dropped entries."""
+    return log_hub.stats()
 
 
 @app.websocket("/ws/db")
@@ -249,29 +260,7 @@ async def handle_tcp_client(reader: asyncio.StreamReader, writer: asyncio.Stream
     addr = writer.get_extra_info("peername")
     print(f"[TCP] Connection from {addr}")
     try:
-        while True:
-            data = await reader.readline()
-            if not data:
-                break
-
-            line = data.decode().strip()
-            if not line:  # Skip empty lines
-                continue
-
-            print(f"[DEBUG] Raw TCP log received: {repr(line)}")
-            
-            # Try to parse as structured log
-            parsed = parse_log_line(line)
-            if parsed:
-                await add_log_entry(parsed)
-            else:
-                # Treat as raw Console log
-                await add_log_entry({
-                    "type": "Console",
-                    "source": "Access Point" if "Access Point" in line else "Coordinator",
-                    "message": line
-                })
-
+        await ingest_stream(reader, add_log_entries)
     except Exception as e:
         print(f"[TCP] Error with {addr}: {e}")
     finally:
@@ -280,63 +269,245 @@ async def handle_tcp_client(reader: asyncio.StreamReader, writer: asyncio.Stream
         await writer.wait_closed()
 
 
-async def add_log_entry(entry: dict):
-    print("[DEBUG] Parsed log entry:", entry)
-    log_type = entry.get("type", "Console")
-    source = entry.get("source", "UNKNOWN").upper()
+@app.get("/api/ingest-stats")
+def get_ingest_stats():
+    """Log ingestion throughput (lines, bytes, batches, lines/s since start)."""
+    return INGEST_STATS.snapshot()
 
-    # Store in per-source/type buffer
-    logs_by_type_and_source[log_type][source].append(entry)
 
-    # Still add to flat buffer for legacy GUI stream
+async def add_log_entries(entries: list):
+    """Store a batch of parsed log entries and forward it to the GUI."""
+    for entry in entries:
+        logs_by_type_and_source[entry.get("type", "Console")][entry.get("source", "UNKNOWN").upper()].append(entry)
+
+    # Flat buffer of recent entries, in arrival order
     async with log_buffer_lock:
-        log_buffer.append(entry)
+        log_buffer.extend(entries)
 
-    # Send over WebSocket
-    await send_log_to_websocket(entry)
+    log_store.append(entries)
+    log_hub.publish(entries)
 
 
-async def send_log_to_websocket(entry: dict):
-    global active_websocket
-    async with websocket_lock:
-        if active_websocket:
-            try:
-                #if matches_filter(entry, active_websocket.filters):
-                if entry.get("type") in ["Console", "Metric"]: 
-                    raw_source = entry.get("source", "UNKNOWN").upper()
-
-                    # Normalize to frontend-expected values
-                    if raw_source == "ACCESS POINT":
-                        normalized_source = "AP"
-                    elif raw_source == "COORDINATOR":
-                        normalized_source = "COORDINATOR"
-                    else:
-                        normalized_source = raw_source  # Fallback
-
-                    payload = {
-                        "type": "log",
-                        "log_type": entry.get("type", "Console"),
-                        "source": normalized_source,
-                        "message": entry.get("message")
-                    }
-
-                    print(f"[WebSocket] Sending log to frontend: {payload}")
-                    await active_websocket.websocket.send_text(json.dumps(payload))
+def _parse_time(value):
+    """Epoch seconds or an ISO date/time in the server's local time."""
+    if value in (None, ""):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid time {value!r}")
 
-            except Exception as e:
-                print(f"[WebSocket] Error sending log: {e}")
-                active_websocket = None
 
+@app.get("/api/logs")
+def query_logs(start: str | None = None, end: str | None = None, type: str | None = None,
+               source: str | None = None, level: str | None = None, node: str | None = None,
+               cursor: str | None = None, limit: int = 100):
+    """
+    Stored log entries in [start, end), oldest first, read from the on-disk
+    store page by page: pass the returned `next` as `cursor` for the next page.
+    """
+    q = LogQuery(start=_parse_time(start), end=_parse_time(end), type=type, source=source, level=level, node=node)
+    try:
+        entries, next_cursor = log_store.query(q, cursor=cursor, limit=limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor {cursor!r}")
+    return {"entries": entries, "next": next_cursor}
+
+
+@app.get("/api/logs/stats")
+def get_log_store_stats():
+    return log_store.stats()
+
+
+# === Metric channel (binary frames from lib/metrics.py) ===
+# latest cumulative histogram snapshot per sending process:
+# (peer host, pid) -> {(component, name): Histogram}; daemons sharing a host do not overwrite each other
+metric_histograms: dict[tuple[str, int], dict] = {}
+# raw samples, newest last: (seq, host, ts_ns, duration_ns, component, name, labels bytes).
+# They are rendered only when the performance view polls for them, not stored or fanned out as logs.
+metric_samples: deque = deque(maxlen=MAX_METRIC_SAMPLES)
+_metric_sample_seq = itertools.count(1)
+
+
+async def handle_metric_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    addr = writer.get_extra_info("peername")
+    print(f"[METRICS] Connection from {addr}")
+    try:
+        async for magic, items in read_frames(reader):
+            if magic == HIST_MAGIC:
+                pid, histograms = items
+                metric_histograms.setdefault((addr[0], pid), {}).update(histograms)
+                continue
+            for ts_ns, duration_ns, component, name, labels in items:
+                metric_samples.append((next(_metric_sample_seq), addr[0], ts_ns, duration_ns, component, name, labels))
+                if b"trace=" in labels:
+                    decoded = decode_labels(labels)
+                    record_trace_span(decoded["trace"], addr[0], ts_ns, duration_ns, component, name, decoded)
+    except Exception as e:
+        print(f"[METRICS] Error with {addr}: {e}")
+    finally:
+        print(f"[METRICS] Connection closed: {addr}")
+        writer.close()
+
+
+def format_metric_sample(ts_ns, duration_ns, component, name, labels) -> dict:
+    """One raw sample as the metric log line the performance view shows."""
+    duration = duration_ns / 1e9
+    timestamp = datetime.fromtimestamp(ts_ns / 1e9).strftime('%Y-%m-%d %H:%M:%S')
+    labels = decode_labels(labels)
+    kind = "Code block" if labels.get("kind") == "block" else "Function"
+    self_ns = int(labels.get("self_ns", duration_ns))
+    nested = f", self {self_ns / 1e6:.2f} ms" if self_ns != duration_ns else ""
+    if labels.get("trace"):
+        nested += f", trace {labels['trace']}"
+    return {
+        "source": component,
+        "timestamp": timestamp,
+        "message": f"{kind} '{name}' executed in {duration:.6f} seconds "
+                   f"({duration * 1000:.2f} ms{nested}) at {timestamp}",
+    }
+
+
+@app.get("/api/metrics/samples")
+async def get_metric_samples(since: int = 0, limit: int = 200):
+    """
+    The newest raw samples after seq `since` (at most `limit`, oldest first),
+    formatted on request. Pass the returned `next` as `since` on the next poll.
+    """
+    selected = []
+    for seq, _host, ts_ns, duration_ns, component, name, labels in reversed(metric_samples):
+        if seq <= since or len(selected) >= limit:
+            break
+        selected.append(format_metric_sample(ts_ns, duration_ns, component, name, labels))
+    selected.reverse()
+    return {"samples": selected, "next": metric_samples[-1][0] if metric_samples else 0}
+
+
+@app.get("/api/metrics")
+def get_metric_histograms(host: str | None = None):
+    """
+    Latency distribution (count, mean, p50/p90/p99, max in ms) per function,
+    merged over all daemons or limited to one sender `host`.
+    """
+    merged = {}
+    for (peer, _pid), histograms in list(metric_histograms.items()):
+        if host and peer != host:
+            continue
+        for key, h in list(histograms.items()):
+            merged.setdefault(key, Histogram()).merge(h)
+    return summarize(merged)
+
+
+# === Request traces (spans labelled trace=<id> by lib/performance_monitor.py) ===
+# trace id -> spans from every daemon that handled the join/leave, oldest trace evicted first
+traces: "OrderedDict[str, list]" = OrderedDict()
+
+
+def record_trace_span(trace_id, host, ts_ns, duration_ns, component, name, labels):
+    spans = traces.get(trace_id)
+    if spans is None:
+        spans = traces[trace_id] = []
+        while len(traces) > MAX_TRACES:
+            traces.popitem(last=False)
+    if len(spans) >= MAX_SPANS_PER_TRACE:
+        return
+    spans.append({
+        "host": host,
+        "pid": labels.get("pid", ""),
+        "span": labels.get("span", "0"),
+        "parent": labels.get("parent", "0"),
+        "component": component,
+        "name": name,
+        "kind": labels.get("kind", "function"),
+        # samples are stamped when the call returns
+        "start_ns": ts_ns - duration_ns,
+        "duration_ns": duration_ns,
+        "self_ns": int(labels.get("self_ns", duration_ns)),
+    })
+
+
+def build_waterfall(trace_id, spans):
+    """
+    Spans of one trace ordered by start time, with offsets relative to the first
+    one and the nesting depth inside each process. Offsets across hosts are only
+    as good as their clock sync. `by_component` sums self time per component,
+    i.e. which hop the request spent its time in.
+    """
+    t0 = min(s["start_ns"] for s in spans)
+    t1 = max(s["start_ns"] + s["duration_ns"] for s in spans)
+    keyed = {(s["host"], s["pid"], s["span"]): s for s in spans}
+
+    def depth(s):
+        d = 0
+        while d < 64:
+            s = keyed.get((s["host"], s["pid"], s["parent"]))
+            if s is None:
+                break
+            d += 1
+        return d
+
+    by_component = defaultdict(float)
+    rows = []
+    for s in sorted(spans, key=lambda s: (s["start_ns"], -s["duration_ns"])):
+        by_component[s["component"]] += s["self_ns"] / 1e6
+        rows.append({
+            "host": s["host"],
+            "component": s["component"],
+            "name": s["name"],
+            "kind": s["kind"],
+            "depth": depth(s),
+            "offset_ms": round((s["start_ns"] - t0) / 1e6, 3),
+            "duration_ms": round(s["duration_ns"] / 1e6, 3),
+            "self_ms": round(s["self_ns"] / 1e6, 3),
+        })
+    return {
+        "trace_id": trace_id,
+        "started": datetime.fromtimestamp(t0 / 1e9).strftime('%Y-%m-%d %H:%M:%S'),
+        "duration_ms": round((t1 - t0) / 1e6, 3),
+        "by_component": {k: round(v, 3) for k, v in sorted(by_component.items(), key=lambda kv: -kv[1])},
+        "spans": rows,
+    }
+
+
+@app.get("/api/traces")
+def list_traces(limit: int = 50):
+    """Most recent traced join/leave requests, newest first."""
+    out = []
+    for trace_id in list(reversed(traces))[:limit]:
+        spans = list(traces.get(trace_id, ()))
+        if not spans:
+            continue
+        t0 = min(s["start_ns"] for s in spans)
+        t1 = max(s["start_ns"] + s["duration_ns"] for s in spans)
+        out.append({
+            "trace_id": trace_id,
+            "started": datetime.fromtimestamp(t0 / 1e9).strftime('%Y-%m-%d %H:%M:%S'),
+            "duration_ms": round((t1 - t0) / 1e6, 3),
+            "spans": len(spans),
+            "components": sorted({s["component"] for s in spans}),
+        })
+    return out
+
+
+@app.get("/api/traces/{trace_id}")
+def get_trace(trace_id: str):
+    """Waterfall of one join/leave request across AP, coordinator, node manager, DB and switches."""
+    spans = list(traces.get(trace_id, ()))
+    if not spans:
+        raise HTTPException(status_code=404, detail=f"Unknown trace {trace_id}")
+    return build_waterfall(trace_id, spans)
+
+
+async def start_metrics_server():
+    server = await asyncio.start_server(handle_metric_client, "0.0.0.0", TCP_METRICS_PORT)
+    print(f"[METRICS] Listening for metric samples on port {TCP_METRICS_PORT}...")
+    async with server:
+        await server.serve_forever()
 
-async def send_json_to_websocket(payload: dict):
-    global active_websocket
-    async with websocket_lock:
-        if active_websocket:
-            try:
-                await active_websocket.send_text(json.dumps(payload))
-            except Exception as e:
-                print(f"[WebSocket] Error sending JSON payload: {e}")
-                active_websocket = None
 
 async def start_tcp_server():
     server = await asyncio.start_server(handle_tcp_client, "0.0.0.0", TCP_LOG_PORT)
@@ -349,31 +520,18 @@ async def periodic_db_fetch():
         await fetch_and_broadcast_data()
         await asyncio.sleep(1)
 
-async def send_db_snapshot():
-    while True:
-        try:
-            cluster = Cluster(["127.0.0.1"])
-            session = cluster.connect("ks_swarm")
-            session.row_factory = dict_factory
+@app.get("/api/db-history")
+def get_db_history(at: str | None = None):
+    """Database tables as recorded at time `at` (latest if omitted), from checkpoints and change records."""
+    state = load_state(_parse_time(at), snapshot_recorder.directory)
+    if state is None:
+        raise HTTPException(status_code=404, detail="No database checkpoint recorded before that time")
+    return state
 
-            tables = ["art"] + [
-                row["table_name"]
-                for row in session.execute("SELECT table_name FROM system_schema.tables WHERE keyspace_name = 'ks_swarm'")
-                if row["table_name"].startswith("swarm_table")
-            ]
 
-            snapshot = {}
-
-            for table in tables:
-                rows = session.execute(f"SELECT * FROM {table}")
-                snapshot[table] = [dict(row) for row in rows]
-
-            logger_snapshot.info(json.dumps(snapshot, default=str))
-
-        except Exception as e:
-            logger_snapshot.error(f"Failed to fetch DB snapshot: {e}")
-
-        await asyncio.sleep(5)
+@app.get("/api/db-history/stats")
+def get_db_history_stats():
+    return {**snapshot_recorder.stats(), "checkpoints": checkpoints(snapshot_recorder.directory)}
 
 
 @app.post("/request-join")
@@ -393,10 +551,11 @@ async def request_join(request: Request):
     if not swarm:
         return {"success": False, "error": "No swarm selected"}
 
-    print(f"[JOIN REQUEST] Node UUID: {uuid}, Target Swarm: {swarm}, Heartbeat: {heartbeat}")
+    trace_id = new_trace_id()
+    print(f"[JOIN REQUEST] Node UUID: {uuid}, Target Swarm: {swarm}, Heartbeat: {heartbeat}, Trace: {trace_id}")
 
     # --- Validate heartbeat parameters if heartbeat is enabled ---
-    args = ["python3", "../../tests/ac_request_nodes_to_join.py", uuid, "--swarm", swarm]
+    args = ["python3", "../../tests/ac_request_nodes_to_join.py", uuid, "--swarm", swarm, "--trace-id", trace_id]
 
     if heartbeat:
         print(f"[HEARTBEAT PARAMETERS] length={hb_length}, window={hb_window}, interval={hb_interval}")
@@ -422,9 +581,9 @@ async def request_join(request: Request):
         print("[SCRIPT RETURN CODE]:", result.returncode)
 
         if result.returncode != 0:
-            return {"success": False, "error": result.stderr or "Script failed"}
+            return {"success": False, "error": result.stderr or "Script failed", "trace_id": trace_id}
 
-        return {"success": True, "output": result.stdout.strip()}
+        return {"success": True, "output": result.stdout.strip(), "trace_id": trace_id}
 
     except Exception as e:
         print("[ERROR] Exception while executing join script:", e)
@@ -488,7 +647,10 @@ async def request_leave(request: Request):
         args = ["python3", "../../tests/ac_request_nodes_to_leave.py"]
         args.extend(node_ids)
 
-        result = subprocess.run(args, capture_output=True, text=True, timeout=20)
+        trace_id = new_trace_id()
+        print(f"[LEAVE REQUEST] Node UUIDs: {node_ids}, Trace: {trace_id}")
+        result = subprocess.run(args, capture_output=True, text=True, timeout=20,
+                                env={**os.environ, "SE_TRACE_ID": trace_id})
 
         if result.returncode != 0:
             return {"success": False, "error": result.stderr or "Script failed"}
@@ -510,13 +672,13 @@ async def request_leave(request: Request):
             try:
                 stop_result = await stop_heartbeat_server()
                 msg = stop_result.get("output", "Heartbeat server stopped.") if isinstance(stop_result, dict) else "Heartbeat server stopped."
-                return {"success": True, "output": f"{result.stdout.strip()} | {msg}"}
+                return {"success": True, "output": f"{result.stdout.strip()} | {msg}", "trace_id": trace_id}
             except Exception as e:
                 print(f"[HB-API] ⚠️ Failed to stop heartbeat server automatically: {e}")
                 return {"success": True, "output": f"{result.stdout.strip()} | Warning: failed to stop heartbeat server."}
 
         # --- Step 4: Swarm not empty → normal success ---
-        return {"success": True, "output": result.stdout.strip()}
+        return {"success": True, "output": result.stdout.strip(), "trace_id": trace_id}
 
     except Exception as e:
         print(f"[HB-API] ❌ Error in request_leave: {e}")
@@ -599,10 +761,11 @@ async def start_heartbeat_server(data: dict):
 async def main():
     print("[System] Starting Coordinator Log Server...")
     asyncio.create_task(start_tcp_server())
+    asyncio.create_task(start_metrics_server())
     # asyncio.create_task(periodic_db_fetch())
     
     asyncio.create_task(fetch_and_broadcast_data())
-    asyncio.create_task(send_db_snapshot())
+    asyncio.create_task(snapshot_recorder.run())
 
     config = uvicorn.Config(app, host="0.0.0.0", port=HTTP_PORT, log_level="info")
     server = uvicorn.Server(config)
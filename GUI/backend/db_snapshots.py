@@ -0,0 +1,226 @@
+import os
+import json
+import time
+import asyncio
+import fnmatch
+import threading
+
+# Database history for the GUI: instead of dumping every table every few
+# seconds, keep the last seen rows in memory and write only the differences
+# as change records, plus a compacted checkpoint (the full state) now and then.
+#
+#   <dir>/checkpoint-<epoch>.json   {"ts": ..., "tables": {table: [row, ...]}}
+#   <dir>/changes-<epoch>.jsonl     {"ts", "table", "op": "upsert"|"delete", "key", "row"} since that checkpoint
+#
+# Tables reported through /trigger-db-update are re-read on the next tick; all
+# tracked tables are re-read every SNAPSHOT_RESCAN seconds in case a trigger was
+# missed. One Cassandra session is kept open and reused.
+SNAPSHOT_DIR        = os.environ.get("SE_GUI_SNAPSHOT_DIR", os.path.join(os.path.dirname(__file__), "db_snapshots"))
+SNAPSHOT_HOSTS      = os.environ.get("SE_GUI_SNAPSHOT_HOSTS", "127.0.0.1").split(",")
+SNAPSHOT_KEYSPACE   = os.environ.get("SE_GUI_SNAPSHOT_KEYSPACE", "ks_swarm")
+SNAPSHOT_TABLES     = os.environ.get("SE_GUI_SNAPSHOT_TABLES", "art,swarm_table*")   # fnmatch patterns
+SNAPSHOT_INTERVAL   = float(os.environ.get("SE_GUI_SNAPSHOT_INTERVAL", "5"))        # seconds between ticks
+SNAPSHOT_RESCAN     = float(os.environ.get("SE_GUI_SNAPSHOT_RESCAN", "60"))         # full re-read of all tables
+SNAPSHOT_CHECKPOINT = float(os.environ.get("SE_GUI_SNAPSHOT_CHECKPOINT", "300"))    # compacted checkpoint
+SNAPSHOT_KEEP       = int(os.environ.get("SE_GUI_SNAPSHOT_KEEP", "12"))             # checkpoints kept on disk
+
+
+def _row_json(row: dict) -> str:
+    return json.dumps(row, sort_keys=True, default=str)
+
+
+class SnapshotRecorder:
+    def __init__(self, directory: str = SNAPSHOT_DIR, hosts=SNAPSHOT_HOSTS, keyspace: str = SNAPSHOT_KEYSPACE,
+                 tables: str = SNAPSHOT_TABLES):
+        self.directory = directory
+        self.hosts = hosts
+        self.keyspace = keyspace
+        self.patterns = [p.strip() for p in tables.split(",") if p.strip()]
+        self.cluster = None
+        self.session = None
+        self.tables: list[str] = []
+        self.primary_keys: dict[str, list[str]] = {}
+        self.state: dict[str, dict[str, str]] = {}      # table -> key json -> row json
+        self.dirty: set[str] = set()
+        # mark_dirty runs on the event loop, tick() in a worker thread
+        self._dirty_lock = threading.Lock()
+        self.changes_written = 0
+        self.checkpoints_written = 0
+        self._changes = None
+        self._next_rescan = 0.0
+        self._next_checkpoint = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    # ---------------- Cassandra ----------------
+    def _connect(self):
+        if self.session is not None:
+            return self.session
+        from cassandra.cluster import Cluster
+        from cassandra.query import dict_factory
+        self.cluster = Cluster(self.hosts)
+        self.session = self.cluster.connect(self.keyspace)
+        self.session.row_factory = dict_factory
+        return self.session
+
+    def _disconnect(self):
+        if self.cluster is not None:
+            try:
+                self.cluster.shutdown()
+            except Exception:
+                pass
+        self.cluster = self.session = None
+
+    def _refresh_tables(self):
+        rows = self.session.execute(
+            "SELECT table_name FROM system_schema.tables WHERE keyspace_name = %s", (self.keyspace,))
+        names = sorted(r["table_name"] for r in rows)
+        self.tables = [t for t in names if any(fnmatch.fnmatch(t, p) for p in self.patterns)]
+        meta = self.cluster.metadata.keyspaces.get(self.keyspace)
+        for t in self.tables:
+            table_meta = meta.tables.get(t) if meta else None
+            self.primary_keys[t] = [c.name for c in table_meta.primary_key] if table_meta else []
+
+    def _read_table(self, table: str) -> dict[str, str]:
+        key_cols = self.primary_keys.get(table)
+        rows = {}
+        for row in self.session.execute(f"SELECT * FROM {table}"):
+            key = {c: row.get(c) for c in key_cols} if key_cols else row
+            rows[_row_json(key)] = _row_json(row)
+        return rows
+
+    # ---------------- change records ----------------
+    def mark_dirty(self, table: str | None = None):
+        """Re-read `table` (all tables if None) on the next tick."""
+        with self._dirty_lock:
+            if table:
+                self.dirty.add(table)
+            else:
+                self.dirty.update(self.tables)
+
+    def _diff(self, table: str, rows: dict[str, str], ts: float) -> list[dict]:
+        old = self.state.get(table, {})
+        records = []
+        for key, row in rows.items():
+            if old.get(key) != row:
+                records.append({"ts": ts, "table": table, "op": "upsert", "key": json.loads(key), "row": json.loads(row)})
+        for key in old.keys() - rows.keys():
+            records.append({"ts": ts, "table": table, "op": "delete", "key": json.loads(key)})
+        self.state[table] = rows
+        return records
+
+    def _write_changes(self, records: list[dict]):
+        if not records or self._changes is None:
+            return
+        self._changes.write("".join(json.dumps(r, default=str) + "\n" for r in records))
+        self._changes.flush()
+        self.changes_written += len(records)
+
+    def _write_checkpoint(self, ts: float):
+        stamp = int(ts)
+        path = os.path.join(self.directory, f"checkpoint-{stamp}.json")
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"ts": ts, "tables": {t: [json.loads(r) for r in rows.values()]
+                                            for t, rows in self.state.items()}}, f)
+        os.replace(tmp, path)
+        if self._changes is not None:
+            self._changes.close()
+        self._changes = open(os.path.join(self.directory, f"changes-{stamp}.jsonl"), "a")
+        self.checkpoints_written += 1
+        for old in checkpoints(self.directory)[:-SNAPSHOT_KEEP]:
+            for name in (f"checkpoint-{old}.json", f"changes-{old}.jsonl"):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+
+    def tick(self, now: float | None = None):
+        """One pass: re-read dirty tables (all when a rescan is due), record changes, checkpoint if due."""
+        now = time.time() if now is None else now
+        with self._dirty_lock:
+            dirty, self.dirty = self.dirty, set()
+        try:
+            self._connect()
+            rescan = now >= self._next_rescan or not self.tables
+            if rescan:
+                self._refresh_tables()
+                self._next_rescan = now + SNAPSHOT_RESCAN
+                tables = set(self.tables) | set(self.state)
+            else:
+                tables = dirty & (set(self.tables) | set(self.state))
+            records = []
+            for table in sorted(tables):
+                rows = self._read_table(table) if table in self.tables else {}
+                records.extend(self._diff(table, rows, now))
+                if not rows:
+                    self.state.pop(table, None)
+        except Exception as e:
+            print(f"[SNAPSHOT] Failed to read {self.keyspace}: {e}")
+            with self._dirty_lock:
+                self.dirty |= dirty
+            self._disconnect()
+            return
+        if now >= self._next_checkpoint:
+            self._write_checkpoint(now)
+            self._next_checkpoint = now + SNAPSHOT_CHECKPOINT
+            print(f"[SNAPSHOT] Checkpoint of {len(self.state)} table(s), "
+                  f"{sum(len(r) for r in self.state.values())} row(s)")
+        else:
+            self._write_changes(records)
+
+    async def run(self):
+        while True:
+            await asyncio.to_thread(self.tick)
+            await asyncio.sleep(SNAPSHOT_INTERVAL)
+
+    def stats(self) -> dict:
+        with self._dirty_lock:
+            pending = sorted(self.dirty)
+        return {"tables": self.tables, "rows": {t: len(r) for t, r in self.state.items()},
+                "changes_written": self.changes_written, "checkpoints_written": self.checkpoints_written,
+                "pending_dirty": pending, "connected": self.session is not None}
+
+
+def checkpoints(directory: str = SNAPSHOT_DIR) -> list[int]:
+    return sorted(int(name[len("checkpoint-"):-len(".json")]) for name in os.listdir(directory)
+                  if name.startswith("checkpoint-") and name.endswith(".json"))
+
+
+def load_state(at: float | None = None, directory: str = SNAPSHOT_DIR) -> dict | None:
+    """Table contents at time `at` (latest if None): nearest checkpoint before it plus its change records."""
+    stamps = [s for s in checkpoints(directory) if at is None or s <= at]
+    if not stamps:
+        return None
+    stamp = stamps[-1]
+    with open(os.path.join(directory, f"checkpoint-{stamp}.json")) as f:
+        checkpoint = json.load(f)
+    tables = {t: {_row_json(r): r for r in rows} for t, rows in checkpoint["tables"].items()}
+    keys: dict[str, dict[str, str]] = {}
+    ts = checkpoint["ts"]
+    try:
+        with open(os.path.join(directory, f"changes-{stamp}.jsonl")) as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                rec = json.loads(line)
+                if at is not None and rec["ts"] > at:
+                    break
+                ts = rec["ts"]
+                table = tables.setdefault(rec["table"], {})
+                index = keys.get(rec["table"])
+                if index is None:
+                    # key json -> row json of the checkpoint rows, built on first use
+                    index = keys[rec["table"]] = {}
+                    for row_id, row in table.items():
+                        index[_row_json({k: row.get(k) for k in rec["key"]})] = row_id
+                key = _row_json(rec["key"])
+                old = index.pop(key, None)
+                if old is not None:
+                    table.pop(old, None)
+                if rec["op"] == "upsert":
+                    row_id = _row_json(rec["row"])
+                    table[row_id] = rec["row"]
+                    index[key] = row_id
+    except FileNotFoundError:
+        pass
+    return {"ts": ts, "tables": {t: list(rows.values()) for t, rows in tables.items() if rows}}
@@ -2,17 +2,20 @@
 
 
 import os
-import re
+import sys
 import signal
 import asyncio
 import subprocess
+from datetime import datetime
 from collections import deque, defaultdict
 from typing import Dict, Set, Optional
 
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 from cassandra.cluster import Cluster
 from cassandra.query import dict_factory
-import aiofiles
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from lib.heartbeat.events import follow_events
 
 router = APIRouter()
 
@@ -34,15 +37,14 @@ SCRIPT_DIR = SCRIPT_FILE_PATH.parent
 # =================================================
 # =============== Configuration ===================
 # =================================================
-# IMPORTANT: must match the path used by heartbeat_server.py
-LOG_FILE = SCRIPT_DIR / "../../coordinator/logs/coordinator_hb_server.log"
-
 # Path to the heartbeat server script
 HB_SCRIPT = SCRIPT_DIR / "../../coordinator/heartbeat_server.py"
 
-# Tail behavior / history size
-TAIL_INTERVAL = 1.0   # seconds between file reads
-HISTORY_LIMIT = 150   # number of lines to keep per UUID
+# Event stream of the heartbeat server as host:port, same setting as the coordinator's
+# (the server listens on SE_CO_HB_EVENT_PORT, see lib/heartbeat/server.py); empty disables
+HB_EVENTS_ADDRESS = os.environ.get("SE_CO_HB_EVENTS", "127.0.0.1:5009")
+RECONNECT_INTERVAL = 2.0   # seconds between attempts while the server is down
+HISTORY_LIMIT = 150        # number of lines to keep per UUID
 
 # Launch logging for the server process (stdout/stderr from launcher, not the server's own log)
 LAUNCH_LOG = SCRIPT_DIR / "../../coordinator/logs/hb_launch.log"
@@ -257,16 +259,30 @@ _ws_by_uuid: Dict[str, Set[WebSocket]] = defaultdict(set)
 # In-memory history buffer per UUID
 _history_by_uuid: Dict[str, deque] = defaultdict(lambda: deque(maxlen=HISTORY_LIMIT))
 
-# Regex matcher for heartbeat log UUIDs (robust to formats like "client=SN010003" or "node: SN010003")
-_UUID_RE = re.compile(r"(?:\b(?:client|node)\b\s*[:=]\s*)?(SN\d{6})", re.IGNORECASE)
+# Background event-stream task (one shared across all WS clients)
+_events_task: Optional[asyncio.Task] = None
+
 
-# Background tail task (one shared across all WS clients)
-_tail_task: Optional[asyncio.Task] = None
+def _format_event(ev: dict) -> str:
+    """Render a heartbeat event as the log-style line the heartbeat view displays."""
+    ts = datetime.fromtimestamp(ev["ts"]).strftime("%Y-%m-%d %H:%M:%S")
+    node, kind = ev["node"], ev["type"]
+    if kind == "heartbeat":
+        text = f"[HB] OK client={node} i={ev.get('i')} from {ev.get('peer')}"
+    elif kind == "dead":
+        text = f"[ALERT] {node} DEAD (no heartbeat for > {ev.get('timeout')}s)"
+    elif kind == "rollover":
+        text = f"[HB] ROLLOVER client={node} at i={ev.get('last_i')}"
+    elif kind == "registered":
+        text = f"[PK] Stored public key for {node}"
+    else:  # alive / recovered
+        text = f"[HB] {kind.upper()} client={node}"
+    return f"{ts} {text}"
 
 
 async def _dispatch_to_subscribers(node_uuid: str, line: str):
     """
-    Send one log line to all active WebSocket subscribers of `node_uuid`.
+    Send one line to all active WebSocket subscribers of `node_uuid`.
     """
     node_uuid = node_uuid.upper()
     conns = _ws_by_uuid.get(node_uuid)
@@ -286,51 +302,35 @@ async def _dispatch_to_subscribers(node_uuid: str, line: str):
         print(f"[HB-API] Pruned {len(dead)} WS for {node_uuid}; {len(conns)} remain")
 
 
-async def _tail_heartbeat_log():
+async def _follow_heartbeat_events():
     """
-    Continuously read the heartbeat_server log file and stream lines
-    to WebSocket clients filtered by UUID.
-    If the log file doesn't exist yet, waits until it appears.
+    Subscribe to the heartbeat server's event stream and fan events out to the
+    WebSocket clients of each node. Reconnects while the server is not running.
     """
-    print(f"[HB-API] Log tail started: {LOG_FILE}")
-
-    # Wait for log file to exist
-    while not os.path.exists(LOG_FILE):
-        print(f"[HB-API] Waiting for log file {LOG_FILE} ...")
-        await asyncio.sleep(2)
-
-    # Tail from end
-    async with aiofiles.open(LOG_FILE, mode="r") as f:
-        await f.seek(0, os.SEEK_END)
-        while True:
-            line = await f.readline()
-            if not line:
-                await asyncio.sleep(TAIL_INTERVAL)
-                continue
-
-            msg = line.strip()
-            if not msg:
-                continue
-
-            # Extract node UUID (if any)
-            m = _UUID_RE.search(msg)
-            if not m:
-                continue
-
-            node_uuid = m.group(1).upper()
+    host, port = HB_EVENTS_ADDRESS.rsplit(":", 1)
+    print(f"[HB-API] Event stream follower started: {HB_EVENTS_ADDRESS}")
+    while True:
+        try:
+            async for ev in follow_events(host, int(port)):
+                node_uuid = ev["node"].upper()
+                line = _format_event(ev)
 
-            # Save to short history buffer
-            _history_by_uuid[node_uuid].append(msg)
+                # Save to short history buffer
+                _history_by_uuid[node_uuid].append(line)
 
-            # Dispatch to connected clients
-            await _dispatch_to_subscribers(node_uuid, msg)
+                # Dispatch to connected clients
+                if node_uuid in _ws_by_uuid:
+                    await _dispatch_to_subscribers(node_uuid, line)
+        except (OSError, asyncio.TimeoutError, ValueError):
+            pass
+        await asyncio.sleep(RECONNECT_INTERVAL)
 
 
 @router.websocket("/ws/heartbeat_logs/{uuid}")
 async def websocket_endpoint(ws: WebSocket, uuid: str):
     """
     WebSocket endpoint:
-      - Subscribes to log updates for a given node UUID.
+      - Subscribes to heartbeat events for a given node UUID.
       - Replays recent logs for that node (if any).
       - Keeps connection alive and streams new lines.
     """
@@ -339,10 +339,10 @@ async def websocket_endpoint(ws: WebSocket, uuid: str):
     _ws_by_uuid[uuid].add(ws)
     print(f"[HB-API] WS connected -> {uuid} | total={len(_ws_by_uuid[uuid])}")
 
-    # Start the shared log-tail task (if not already running)
-    global _tail_task
-    if _tail_task is None or _tail_task.done():
-        _tail_task = asyncio.create_task(_tail_heartbeat_log())
+    # Start the shared event-stream task (if not already running)
+    global _events_task
+    if HB_EVENTS_ADDRESS and (_events_task is None or _events_task.done()):
+        _events_task = asyncio.create_task(_follow_heartbeat_events())
 
     # Replay cached history to new client
     try:
@@ -0,0 +1,179 @@
+import json
+import asyncio
+import itertools
+from collections import deque
+
+# Log fan-out to the GUI: every entry gets a sequence number and is kept in a
+# bounded history; each WebSocket viewer has its own filter, a bounded queue
+# that drops the oldest entries when the browser falls behind, and a sender
+# task that ships the queue as one frame per LOG_BATCH_INTERVAL. publish() never
+# awaits, so a slow tab only loses its own entries and never blocks ingestion.
+LOG_BATCH_INTERVAL = 0.05      # seconds between frames to one client
+LOG_CLIENT_QUEUE   = 5000      # entries queued per client before dropping the oldest
+LOG_HISTORY_SIZE   = 10000     # entries kept for resume
+LOG_SEND_TIMEOUT   = 10.0      # a client that cannot take a frame for this long is disconnected
+FILTER_FIELDS      = ("type", "source", "level", "node")
+
+
+def _as_set(value, upper=False):
+    if value in (None, "", []):
+        return None
+    if isinstance(value, str):
+        value = value.split(",")
+    values = {str(v).strip() for v in value if str(v).strip()}
+    if upper:
+        values = {v.upper() for v in values}
+    return values or None
+
+
+def normalize_source(source: str) -> str:
+    """Source names as the frontend expects them (ACCESS POINT -> AP)."""
+    source = (source or "UNKNOWN").upper()
+    return "AP" if source == "ACCESS POINT" else source
+
+
+class LogFilter:
+    """
+    Server-side filter of one viewer. Every field takes a value, a list or a
+    comma-separated string; empty means "any". `node` matches node UUIDs
+    mentioned in the message.
+    """
+    def __init__(self, type=None, source=None, level=None, node=None):
+        self.types = _as_set(type)
+        sources = _as_set(source, upper=True)
+        self.sources = {normalize_source(s) for s in sources} if sources else None
+        self.levels = _as_set(level, upper=True)
+        self.nodes = _as_set(node)
+
+    @classmethod
+    def from_dict(cls, d: dict | None) -> "LogFilter":
+        d = d or {}
+        return cls(**{k: d.get(k) for k in FILTER_FIELDS})
+
+    def matches(self, payload: dict) -> bool:
+        if self.types and payload["log_type"] not in self.types:
+            return False
+        if self.sources and payload["source"] not in self.sources:
+            return False
+        if self.levels and (payload.get("level") or "").upper() not in self.levels:
+            return False
+        if self.nodes:
+            message = payload.get("message") or ""
+            if not any(node in message for node in self.nodes):
+                return False
+        return True
+
+    def describe(self) -> dict:
+        return {k: sorted(v) if v else None for k, v in
+                zip(FILTER_FIELDS, (self.types, self.sources, self.levels, self.nodes))}
+
+
+class LogClient:
+    _ids = itertools.count(1)
+
+    def __init__(self, websocket, log_filter: LogFilter, queue_size: int = LOG_CLIENT_QUEUE):
+        self.id = next(self._ids)
+        self.websocket = websocket
+        self.filter = log_filter
+        self.queue: deque = deque(maxlen=queue_size)
+        self.dropped = 0           # dropped since the last frame, reported to the client
+        self.dropped_total = 0
+        self.sent = 0
+        self.closed = False
+        self._wakeup = asyncio.Event()
+        self.task = None
+
+    def offer(self, payload: dict):
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+            self.dropped_total += 1
+        self.queue.append(payload)
+        self._wakeup.set()
+
+    async def run(self):
+        """Send queued entries as {"type": "logs", "logs": [...], "dropped": n} frames."""
+        try:
+            while not self.closed:
+                await self._wakeup.wait()
+                await asyncio.sleep(LOG_BATCH_INTERVAL)
+                self._wakeup.clear()
+                if not self.queue:
+                    continue
+                logs = list(self.queue)
+                self.queue.clear()
+                frame = {"type": "logs", "logs": logs, "dropped": self.dropped}
+                self.dropped = 0
+                await asyncio.wait_for(self.websocket.send_text(json.dumps(frame)), LOG_SEND_TIMEOUT)
+                self.sent += len(logs)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"[LogHub] Client {self.id} send failed, disconnecting: {e!r}")
+            self.closed = True
+            try:
+                await self.websocket.close()
+            except Exception:
+                pass
+
+    def stats(self) -> dict:
+        return {"id": self.id, "queued": len(self.queue), "sent": self.sent,
+                "dropped": self.dropped_total, "filter": self.filter.describe()}
+
+
+class LogHub:
+    def __init__(self, history_size: int = LOG_HISTORY_SIZE):
+        self.seq = 0
+        self.history: deque = deque(maxlen=history_size)
+        self.clients: set[LogClient] = set()
+
+    def publish(self, entries):
+        """Number the entries, keep them for resume and queue them to every matching client."""
+        clients = [c for c in self.clients if not c.closed]
+        for entry in entries:
+            self.seq += 1
+            payload = {
+                "type": "log",
+                "seq": self.seq,
+                "log_type": entry.get("type", "Console"),
+                "source": normalize_source(entry.get("source")),
+                "level": entry.get("level"),
+                "timestamp": entry.get("timestamp"),
+                "message": entry.get("message"),
+            }
+            self.history.append(payload)
+            for client in clients:
+                if client.filter.matches(payload):
+                    client.offer(payload)
+
+    def replay(self, client: LogClient, since: int):
+        """Queue retained entries newer than `since`; a gap is reported as dropped entries."""
+        oldest = self.history[0]["seq"] if self.history else self.seq + 1
+        if since + 1 < oldest:
+            client.dropped += oldest - since - 1
+        for payload in self.history:
+            if payload["seq"] > since and client.filter.matches(payload):
+                client.offer(payload)
+
+    def connect(self, websocket, log_filter: LogFilter, since: int | None = None) -> LogClient:
+        client = LogClient(websocket, log_filter)
+        if since is not None:
+            self.replay(client, since)
+        self.clients.add(client)
+        client.task = asyncio.create_task(client.run())
+        return client
+
+    def subscribe(self, client: LogClient, log_filter: LogFilter, since: int | None = None):
+        client.filter = log_filter
+        if since is not None:
+            client.queue.clear()
+            self.replay(client, since)
+
+    def disconnect(self, client: LogClient):
+        client.closed = True
+        self.clients.discard(client)
+        if client.task is not None:
+            client.task.cancel()
+
+    def stats(self) -> dict:
+        return {"seq": self.seq, "history": len(self.history),
+                "clients": [c.stats() for c in list(self.clients)]}
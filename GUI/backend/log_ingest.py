@@ -0,0 +1,104 @@
+import time
+import asyncio
+
+from log_parser import parse_log_line
+
+# Log lines arrive as newline-terminated text from lib/logger_utils.SocketStreamHandler,
+# which already writes them in batches; read them the same way.
+READ_CHUNK = 64 * 1024          # bytes per reader.read()
+MAX_PENDING_LINE = 1024 * 1024  # a "line" without newline longer than this is taken as is
+
+
+class IngestStats:
+    """Counters of the log ingestion path, exposed by the log server as /api/ingest-stats."""
+    def __init__(self):
+        self.started = time.monotonic()
+        self.connections = 0
+        self.bytes = 0
+        self.lines = 0
+        self.unparsed = 0
+        self.batches = 0
+        self.max_batch = 0
+
+    def add_batch(self, nbytes: int, nlines: int, unparsed: int):
+        self.bytes += nbytes
+        self.lines += nlines
+        self.unparsed += unparsed
+        self.batches += 1
+        if nlines > self.max_batch:
+            self.max_batch = nlines
+
+    def snapshot(self) -> dict:
+        uptime = max(time.monotonic() - self.started, 1e-9)
+        return {
+            "uptime_s": round(uptime, 1),
+            "connections": self.connections,
+            "bytes": self.bytes,
+            "lines": self.lines,
+            "unparsed": self.unparsed,
+            "batches": self.batches,
+            "avg_batch": round(self.lines / self.batches, 1) if self.batches else 0,
+            "max_batch": self.max_batch,
+            "lines_per_s": round(self.lines / uptime, 1),
+        }
+
+
+INGEST_STATS = IngestStats()
+
+
+def raw_entry(line: str) -> dict:
+    """Unstructured line, shown as a Console log of the daemon it mentions."""
+    return {
+        "type": "Console",
+        "source": "Access Point" if "Access Point" in line else "Coordinator",
+        "message": line,
+    }
+
+
+def parse_batch(lines) -> tuple[list, int]:
+    """Parse decoded lines; returns (entries, number of lines that did not match the log format)."""
+    entries = []
+    unparsed = 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        parsed = parse_log_line(line)
+        if parsed is None:
+            unparsed += 1
+            parsed = raw_entry(line)
+        entries.append(parsed)
+    return entries, unparsed
+
+
+async def ingest_stream(reader: asyncio.StreamReader, handle_batch, stats: IngestStats = INGEST_STATS):
+    """
+    Read log lines from `reader` in chunks until EOF and hand every chunk's
+    parsed entries to `await handle_batch(entries)` in one call.
+    """
+    stats.connections += 1
+    pending = b""
+    try:
+        while True:
+            data = await reader.read(READ_CHUNK)
+            if not data:
+                break
+            data = pending + data
+            cut = data.rfind(b"\n")
+            if cut < 0:
+                if len(data) < MAX_PENDING_LINE:
+                    pending = data
+                    continue
+                cut = len(data) - 1
+            pending = data[cut + 1:]
+            lines = data[:cut + 1].decode(errors="replace").split("\n")
+            entries, unparsed = parse_batch(lines)
+            stats.add_batch(cut + 1, len(entries), unparsed)
+            if entries:
+                await handle_batch(entries)
+        if pending.strip():
+            entries, unparsed = parse_batch([pending.decode(errors="replace")])
+            stats.add_batch(len(pending), len(entries), unparsed)
+            await handle_batch(entries)
+    finally:
+        stats.connections -= 1
@@ -18,13 +18,54 @@ LOG_PATTERN = re.compile(
     """, re.VERBOSE
 )
 
+TIMESTAMP_LEN = 19   # YYYY-MM-DD HH:MM:SS
+TIMESTAMP_SEPARATORS = ((4, "-"), (7, "-"), (10, " "), (13, ":"), (16, ":"))
+TIMESTAMP_DIGITS = ((0, 4), (5, 7), (8, 10), (11, 13), (14, 16), (17, 19))
+
+
+def _valid_timestamp(timestamp: str) -> bool:
+    return (len(timestamp) == TIMESTAMP_LEN
+            and all(timestamp[i] == sep for i, sep in TIMESTAMP_SEPARATORS)
+            and all(timestamp[a:b].isdigit() for a, b in TIMESTAMP_DIGITS))
+
+
+def _parse_prefix(line: str):
+    """
+    Fast path for lines exactly as lib/logger_utils formats them. Returns None
+    for anything else (leading spaces, quotes, odd spacing) so the caller can
+    fall back to LOG_PATTERN.
+    """
+    if not line.startswith("["):
+        return None
+    end_type = line.find("] [", 1)
+    if end_type < 0:
+        return None
+    end_source = line.find("] ", end_type + 3)
+    if end_source < 0:
+        return None
+    ts_start = end_source + 2
+    ts_end = ts_start + TIMESTAMP_LEN
+    timestamp = line[ts_start:ts_end]
+    if not _valid_timestamp(timestamp) or line[ts_end:ts_end + 2] != " [":
+        return None
+    end_level = line.find("]:", ts_end + 2)
+    if end_level < 0:
+        return None
+    log_type = line[1:end_type]
+    source = line[end_type + 3:end_source]
+    level = line[ts_end + 2:end_level]
+    message = line[end_level + 2:].lstrip()
+    if not (log_type.isalnum() and level.isalpha() and message and source.replace(" ", "").isalnum()):
+        return None
+    if message[-1] in "'\"":
+        return None
+    return {"type": log_type, "source": source, "timestamp": timestamp, "level": level, "message": message}
+
+
 def parse_log_line(line: str):
     line = line.strip()
-    match = LOG_PATTERN.match(line)
-    if match:
-        parsed = match.groupdict()
-        print("[Parser] MATCHED:", parsed)  # <-- Diagnostic
+    parsed = _parse_prefix(line)
+    if parsed is not None:
         return parsed
-    else:
-        print("[Parser] NO MATCH for line:", repr(line))  # <-- Diagnostic
-        return None
+    match = LOG_PATTERN.match(line)
+    return match.groupdict() if match else None
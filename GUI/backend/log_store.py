@@ -0,0 +1,334 @@
+import os
+import re
+import json
+import time
+import queue
+import calendar
+import threading
+
+# Append-only log store for the GUI log server.
+#
+# Entries go to one segment file per UTC hour (<YYYYmmddHH>.log, one JSON
+# object per line). Every block of up to INDEX_BLOCK_ENTRIES lines gets one
+# line in <YYYYmmddHH>.idx: byte range, time range, entry count and the sets of
+# types, sources, levels and node UUIDs it contains. A range query reads the
+# small index, skips blocks that cannot match and streams the remaining lines
+# from disk, so segments are never loaded whole. Writes happen on a background
+# thread; retention removes whole segments by age and total size.
+LOG_STORE_DIR        = os.environ.get("SE_GUI_LOG_DIR", os.path.join(os.path.dirname(__file__), "log_store"))
+LOG_RETENTION_HOURS  = float(os.environ.get("SE_GUI_LOG_RETENTION_HOURS", "168"))
+LOG_STORE_MAX_MB     = float(os.environ.get("SE_GUI_LOG_MAX_MB", "1024"))
+LOG_STORE_QUEUE      = 10000        # batches waiting for the writer thread
+INDEX_BLOCK_ENTRIES  = 512
+INDEX_BLOCK_SECONDS  = 2.0          # a partially filled block is indexed after this long
+RETENTION_INTERVAL   = 60.0
+SEGMENT_SECONDS      = 3600
+QUERY_MAX_LIMIT      = 1000
+
+NODE_UUID_RE = re.compile(r"\bSN[0-9A-Fa-f]{6}\b")
+
+
+def segment_name(ts: float) -> str:
+    return time.strftime("%Y%m%d%H", time.gmtime(ts))
+
+
+def segment_start(name: str) -> float:
+    return calendar.timegm(time.strptime(name, "%Y%m%d%H"))
+
+
+class _Block:
+    __slots__ = ("offset", "length", "count", "t0", "t1", "types", "sources", "levels", "nodes", "opened")
+
+    def __init__(self, offset):
+        self.offset = offset
+        self.length = 0
+        self.count = 0
+        self.t0 = self.t1 = None
+        self.types, self.sources, self.levels, self.nodes = set(), set(), set(), set()
+        self.opened = time.monotonic()
+
+    def add(self, record: dict, nbytes: int):
+        ts = record["ts"]
+        if self.t0 is None:
+            self.t0 = ts
+        self.t1 = ts
+        self.count += 1
+        self.length += nbytes
+        self.types.add(record.get("type") or "")
+        self.sources.add((record.get("source") or "").upper())
+        self.levels.add((record.get("level") or "").upper())
+        self.nodes.update(NODE_UUID_RE.findall(record.get("message") or ""))
+
+    def to_json(self) -> str:
+        return json.dumps({"o": self.offset, "n": self.length, "c": self.count, "t0": self.t0, "t1": self.t1,
+                           "ty": sorted(self.types), "so": sorted(self.sources),
+                           "lv": sorted(self.levels), "nd": sorted(self.nodes)})
+
+
+class LogQuery:
+    """Time range [start, end) in epoch seconds plus optional exact-match filters."""
+    def __init__(self, start=None, end=None, type=None, source=None, level=None, node=None):
+        self.start = start
+        self.end = end
+        self.type = type
+        self.source = source.upper() if source else None
+        self.level = level.upper() if level else None
+        self.node = node
+
+    def block_may_match(self, b: dict) -> bool:
+        # blocks without sets (the not yet indexed tail) always have to be read
+        if b.get("t1") is not None:
+            if self.start is not None and b["t1"] < self.start:
+                return False
+            if self.end is not None and b["t0"] >= self.end:
+                return False
+        if self.type and "ty" in b and self.type not in b["ty"]:
+            return False
+        if self.source and "so" in b and self.source not in b["so"]:
+            return False
+        if self.level and "lv" in b and self.level not in b["lv"]:
+            return False
+        if self.node and "nd" in b and self.node not in b["nd"]:
+            return False
+        return True
+
+    def matches(self, r: dict) -> bool:
+        if self.start is not None and r["ts"] < self.start:
+            return False
+        if self.end is not None and r["ts"] >= self.end:
+            return False
+        if self.type and r.get("type") != self.type:
+            return False
+        if self.source and (r.get("source") or "").upper() != self.source:
+            return False
+        if self.level and (r.get("level") or "").upper() != self.level:
+            return False
+        if self.node and self.node not in (r.get("message") or ""):
+            return False
+        return True
+
+
+class LogStore:
+    def __init__(self, directory: str = LOG_STORE_DIR, retention_hours: float = LOG_RETENTION_HOURS,
+                 max_bytes: float = LOG_STORE_MAX_MB * 1024 * 1024):
+        self.directory = directory
+        self.retention_hours = retention_hours
+        self.max_bytes = max_bytes
+        self.queue: queue.Queue = queue.Queue(maxsize=LOG_STORE_QUEUE)
+        self.written = 0
+        self.dropped = 0
+        self.removed_segments = 0
+        self._segment = None
+        self._file = None
+        self._index = None
+        self._block = None
+        self._next_retention = 0.0
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="log-store", daemon=True)
+        self._thread.start()
+
+    # ---------------- write path (caller side) ----------------
+    def append(self, entries):
+        """Queue parsed log entries for writing; never blocks the caller."""
+        try:
+            self.queue.put_nowait((time.time(), list(entries)))
+        except queue.Full:
+            self.dropped += len(entries)
+
+    def close(self):
+        self.queue.put(None)
+        self._thread.join(timeout=5)
+
+    # ---------------- writer thread ----------------
+    def _path(self, segment, ext):
+        return os.path.join(self.directory, f"{segment}.{ext}")
+
+    def _run(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=INDEX_BLOCK_SECONDS)
+            except queue.Empty:
+                item = ()
+            try:
+                if item is None:
+                    self._close_segment()
+                    return
+                if item:
+                    self._write(*item)
+                if self._block is not None and self._block.count and \
+                        time.monotonic() - self._block.opened >= INDEX_BLOCK_SECONDS:
+                    self._close_block()
+                if time.monotonic() >= self._next_retention:
+                    self._next_retention = time.monotonic() + RETENTION_INTERVAL
+                    self.apply_retention()
+            except Exception as e:
+                print(f"[LogStore] Write error: {e!r}")
+
+    def _write(self, ts, entries):
+        segment = segment_name(ts)
+        if segment != self._segment:
+            self._open_segment(segment)
+        for entry in entries:
+            record = {"ts": ts, "type": entry.get("type"), "source": entry.get("source"),
+                      "level": entry.get("level"), "timestamp": entry.get("timestamp"),
+                      "message": entry.get("message")}
+            data = (json.dumps(record) + "\n").encode()
+            self._file.write(data)
+            self._block.add(record, len(data))
+            if self._block.count >= INDEX_BLOCK_ENTRIES:
+                self._close_block()
+        self._file.flush()
+        self.written += len(entries)
+
+    def _open_segment(self, segment):
+        self._close_segment()
+        path = self._path(segment, "log")
+        self._file = open(path, "ab")
+        self._index = open(self._path(segment, "idx"), "a")
+        self._segment = segment
+        self._block = _Block(self._file.tell())
+        # index what a previous run wrote after its last indexed block
+        indexed = 0
+        for b in self._read_index(segment):
+            indexed = b["o"] + b["n"]
+        if indexed < self._block.offset:
+            self._reindex_tail(path, indexed, self._block.offset)
+
+    def _reindex_tail(self, path, start, end):
+        block = _Block(start)
+        with open(path, "rb") as f:
+            f.seek(start)
+            pos = start
+            while pos < end:
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    break
+                pos += len(line)
+                try:
+                    block.add(json.loads(line), len(line))
+                except ValueError:
+                    block.length += len(line)
+        if block.length:
+            self._index.write(block.to_json() + "\n")
+            self._index.flush()
+        self._block = _Block(start + block.length)
+
+    def _close_block(self):
+        if self._block is None or not self._block.count:
+            return
+        self._index.write(self._block.to_json() + "\n")
+        self._index.flush()
+        self._block = _Block(self._block.offset + self._block.length)
+
+    def _close_segment(self):
+        if self._file is None:
+            return
+        self._close_block()
+        self._file.close()
+        self._index.close()
+        self._file = self._index = self._block = self._segment = None
+
+    def apply_retention(self, now: float | None = None):
+        """Delete segments older than the retention period, then the oldest ones above the size cap."""
+        now = time.time() if now is None else now
+        segments = self.segments()
+        current = segment_name(now)
+        sizes = {s: os.path.getsize(self._path(s, "log")) for s in segments}
+        total = sum(sizes.values())
+        for s in segments:
+            if s == current or s == self._segment:
+                break
+            expired = segment_start(s) + SEGMENT_SECONDS < now - self.retention_hours * 3600
+            if not expired and total <= self.max_bytes:
+                break
+            for ext in ("log", "idx"):
+                try:
+                    os.remove(self._path(s, ext))
+                except FileNotFoundError:
+                    pass
+            total -= sizes[s]
+            self.removed_segments += 1
+
+    # ---------------- read path ----------------
+    def segments(self) -> list[str]:
+        return sorted(name[:-4] for name in os.listdir(self.directory)
+                      if name.endswith(".log") and name[:-4].isdigit())
+
+    def _read_index(self, segment):
+        try:
+            with open(self._path(segment, "idx")) as f:
+                for line in f:
+                    if line.endswith("\n"):
+                        yield json.loads(line)
+        except FileNotFoundError:
+            return
+
+    def _blocks(self, segment):
+        """Indexed blocks of a segment followed by its not yet indexed tail."""
+        end = 0
+        for b in self._read_index(segment):
+            end = b["o"] + b["n"]
+            yield b
+        try:
+            size = os.path.getsize(self._path(segment, "log"))
+        except FileNotFoundError:
+            return
+        if size > end:
+            yield {"o": end, "n": size - end, "t0": None, "t1": None}
+
+    def query(self, q: LogQuery, cursor: str | None = None, limit: int = 100):
+        """
+        Entries matching `q` in write order, at most `limit`. Returns
+        (entries, next_cursor); pass next_cursor back to get the next page,
+        None means the range is exhausted.
+        """
+        limit = max(1, min(limit, QUERY_MAX_LIMIT))
+        cur_segment, cur_offset = None, 0
+        if cursor:
+            cur_segment, _, offset = cursor.partition(":")
+            cur_offset = int(offset or 0)
+        results = []
+        for segment in self.segments():
+            if cur_segment and segment < cur_segment:
+                continue
+            start = segment_start(segment)
+            if q.end is not None and start >= q.end:
+                break
+            if q.start is not None and start + SEGMENT_SECONDS <= q.start:
+                continue
+            min_offset = cur_offset if segment == cur_segment else 0
+            with open(self._path(segment, "log"), "rb") as f:
+                for b in self._blocks(segment):
+                    block_end = b["o"] + b["n"]
+                    if block_end <= min_offset or not q.block_may_match(b):
+                        continue
+                    pos = max(b["o"], min_offset)
+                    f.seek(pos)
+                    while pos < block_end:
+                        line = f.readline()
+                        if not line.endswith(b"\n"):
+                            break
+                        pos += len(line)
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            continue
+                        if q.matches(record):
+                            results.append(record)
+                            if len(results) >= limit:
+                                return results, f"{segment}:{pos}"
+        return results, None
+
+    def stats(self) -> dict:
+        segments = self.segments()
+        return {
+            "directory": self.directory,
+            "segments": len(segments),
+            "oldest": segments[0] if segments else None,
+            "bytes": sum(os.path.getsize(self._path(s, "log")) for s in segments),
+            "written": self.written,
+            "dropped": self.dropped,
+            "queued": self.queue.qsize(),
+            "removed_segments": self.removed_segments,
+            "retention_hours": self.retention_hours,
+        }
@@ -6,6 +6,12 @@ let apPerfLogs = [];
 let hasCoordinatorPerfLog = false;
 let hasAPPerfLog = false;
 
+// Binary metric samples are formatted by the server only when asked for:
+// they are polled from /api/metrics/samples while this view is open.
+const METRIC_POLL_MS = 2000;
+let metricSampleSeq = 0;
+let metricPoll = null;
+
 export function loadPerformanceView() {
   const container = document.getElementById("view-container");
   if (!container) {
@@ -31,8 +37,28 @@ export function loadPerformanceView() {
     <div id="ap-perf-logs" class="log-box">
       ${apPerfLogs.length === 0 ? '<span class="placeholder">Waiting for logs...</span>' : ''}
     </div>
+
+    <h2>Latency by Function</h2>
+    <div class="log-toolbar">
+      <button id="refresh-latency">Refresh</button>
+    </div>
+    <div id="latency-table" class="log-box">
+      <span class="placeholder">No latency data loaded.</span>
+    </div>
+
+    <h2>Join / Leave Traces</h2>
+    <div class="log-toolbar">
+      <button id="refresh-traces">Refresh</button>
+    </div>
+    <div id="trace-list" class="log-box">
+      <span class="placeholder">No traces loaded.</span>
+    </div>
+    <div id="trace-waterfall" class="log-box"></div>
   `;
 
+  document.getElementById('refresh-traces').addEventListener('click', loadTraceList);
+  document.getElementById('refresh-latency').addEventListener('click', loadLatencyTable);
+
     // === Toolbar Buttons ===
 
   // COORDINATOR PERFORMANCE
@@ -84,6 +110,50 @@ export function loadPerformanceView() {
     });
     hasAPPerfLog = true;
   }
+
+  loadLatencyTable();
+  if (metricPoll === null) {
+    pollMetricSamples();
+    metricPoll = setInterval(pollMetricSamples, METRIC_POLL_MS);
+  }
+}
+
+function pollMetricSamples() {
+  if (!document.getElementById("coordinator-perf-logs")) {
+    // another view was opened
+    clearInterval(metricPoll);
+    metricPoll = null;
+    return;
+  }
+  fetch(`/api/metrics/samples?since=${metricSampleSeq}`)
+    .then(res => res.json())
+    .then(data => {
+      metricSampleSeq = data.next;
+      data.samples.forEach(appendPerformanceLog);
+    })
+    .catch(err => console.error("[PerformanceView] Failed to load metric samples:", err));
+}
+
+// === Latency distribution per function (/api/metrics) ===
+function loadLatencyTable() {
+  fetch("/api/metrics")
+    .then(res => res.json())
+    .then(rows => {
+      const box = document.getElementById("latency-table");
+      if (!box) return;
+      box.innerHTML = "";
+      if (!rows.length) {
+        box.innerHTML = '<span class="placeholder">No latency data yet.</span>';
+        return;
+      }
+      rows.forEach((r) => {
+        const div = document.createElement("div");
+        div.innerText = `[${r.component}] ${r.name}  n=${r.count}  mean ${r.mean_ms.toFixed(2)} ms  ` +
+          `p50 ${r.p50_ms.toFixed(2)}  p90 ${r.p90_ms.toFixed(2)}  p99 ${r.p99_ms.toFixed(2)}  max ${r.max_ms.toFixed(2)} ms`;
+        box.appendChild(div);
+      });
+    })
+    .catch(err => console.error("[PerformanceView] Failed to load latency:", err));
 }
 
 export function appendPerformanceLog(msgObj) {
@@ -119,6 +189,75 @@ export function appendPerformanceLog(msgObj) {
   }
 }
 
+// === Traces: one waterfall per join/leave request (/api/traces) ===
+function loadTraceList() {
+  fetch("/api/traces")
+    .then(res => res.json())
+    .then(list => {
+      const box = document.getElementById("trace-list");
+      if (!box) return;
+      box.innerHTML = "";
+      if (!list.length) {
+        box.innerHTML = '<span class="placeholder">No traces yet.</span>';
+        return;
+      }
+      list.forEach((t) => {
+        const div = document.createElement("div");
+        div.innerText = `[${t.started}] ${t.trace_id}  ${t.duration_ms.toFixed(1)} ms  ${t.spans} spans  (${t.components.join(", ")})`;
+        div.style.cursor = "pointer";
+        div.addEventListener("click", () => loadTraceWaterfall(t.trace_id));
+        box.appendChild(div);
+      });
+    })
+    .catch(err => console.error("[PerformanceView] Failed to load traces:", err));
+}
+
+function loadTraceWaterfall(traceId) {
+  fetch(`/api/traces/${encodeURIComponent(traceId)}`)
+    .then(res => res.json())
+    .then(trace => {
+      const box = document.getElementById("trace-waterfall");
+      if (!box || !trace.spans) return;
+      box.innerHTML = "";
+
+      const header = document.createElement("div");
+      const hops = Object.entries(trace.by_component).map(([c, ms]) => `${c}: ${ms.toFixed(1)} ms`).join(", ");
+      header.innerText = `Trace ${trace.trace_id}, ${trace.duration_ms.toFixed(1)} ms total (self time by hop: ${hops})`;
+      box.appendChild(header);
+
+      const total = trace.duration_ms || 1;
+      trace.spans.forEach((s) => {
+        const row = document.createElement("div");
+        row.style.display = "flex";
+        row.style.alignItems = "center";
+
+        const label = document.createElement("span");
+        label.style.width = "40%";
+        label.style.paddingLeft = `${s.depth * 12}px`;
+        label.innerText = `[${s.component}] ${s.name}`;
+
+        const lane = document.createElement("span");
+        lane.style.position = "relative";
+        lane.style.flex = "1";
+        lane.style.height = "12px";
+
+        const bar = document.createElement("span");
+        bar.style.position = "absolute";
+        bar.style.left = `${(s.offset_ms / total) * 100}%`;
+        bar.style.width = `${Math.max((s.duration_ms / total) * 100, 0.3)}%`;
+        bar.style.height = "100%";
+        bar.style.background = "#4a90d9";
+        bar.title = `${s.duration_ms.toFixed(2)} ms (self ${s.self_ms.toFixed(2)} ms) on ${s.host}`;
+        lane.appendChild(bar);
+
+        row.appendChild(label);
+        row.appendChild(lane);
+        box.appendChild(row);
+      });
+    })
+    .catch(err => console.error("[PerformanceView] Failed to load trace:", err));
+}
+
 function downloadTextAsFile(text, filename) {
   const blob = new Blob([text], { type: 'text/plain' });
   const a = document.createElement('a');
@@ -37,20 +37,24 @@ export function connectWebSocket() {
   };
 
   // === Logs WebSocket ===
-  const logSocket = new WebSocket(`ws://${window.location.host}/ws/logs`);
+  connectLogSocket();
+}
+
+// Last log sequence number received; sent as `since` on reconnect so the
+// server replays what was missed instead of the stream starting over.
+// The first connect sends none: a new viewer starts with the live stream.
+let lastLogSeq = 0;
 
-  logSocket.onopen = () => {
-    console.log("[Frontend] Connected to /ws/logs");
+function connectLogSocket() {
+  const params = new URLSearchParams({ type: "Console,Metric" });
+  if (lastLogSeq > 0) params.set("since", String(lastLogSeq));
+  const logSocket = new WebSocket(`ws://${window.location.host}/ws/logs?${params}`);
 
-    // Subscribe to Console logs (Coordinator + AP)
-    logSocket.send(JSON.stringify({
-      subscribe: { type: "Console", source: null }
-    }));
+  logSocket.onopen = () => console.log("[Frontend] Connected to /ws/logs");
 
-    // Subscribe to Metric logs (Performance)
-    logSocket.send(JSON.stringify({
-      subscribe: { type: "Metric", source: null }
-    }));
+  logSocket.onclose = () => {
+    console.warn("[Frontend] /ws/logs closed, reconnecting in 2 s");
+    setTimeout(connectLogSocket, 2000);
   };
 
   logSocket.onmessage = (event) => {
@@ -62,18 +66,31 @@ export function connectWebSocket() {
       return;
     }
 
-    if (message.type === "log") {
-      if (message.log_type === "Metric") {
-        appendPerformanceLog(message);
-      } else if (message.log_type === "Console") {
-        const normalizedSource = String(message.source || "").toUpperCase();
-        if (normalizedSource.includes("COORDINATOR")) {
-          appendCoordinatorLog(message);
-          appendHeartbeatLog(message); // forward to heartbeat console
-        } else if (normalizedSource.includes("ACCESS POINT") || normalizedSource.includes("AP")) {
-          appendAPLog(message);
-        }
+    // Server sends batches: { type: "logs", logs: [...], dropped: n }
+    if (message.type === "logs") {
+      if (message.dropped) {
+        console.warn(`[Frontend] ${message.dropped} log entries dropped by the server (viewer too slow)`);
       }
+      message.logs.forEach(handleLogMessage);
+    } else if (message.type === "log") {
+      handleLogMessage(message);
     }
   };
 }
+
+function handleLogMessage(message) {
+  if (message.seq) {
+    lastLogSeq = message.seq;
+  }
+  if (message.log_type === "Metric") {
+    appendPerformanceLog(message);
+  } else if (message.log_type === "Console") {
+    const normalizedSource = String(message.source || "").toUpperCase();
+    if (normalizedSource.includes("COORDINATOR")) {
+      appendCoordinatorLog(message);
+      appendHeartbeatLog(message); // forward to heartbeat console
+    } else if (normalizedSource.includes("ACCESS POINT") || normalizedSource.includes("AP")) {
+      appendAPLog(message);
+    }
+  }
+}
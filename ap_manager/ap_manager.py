@@ -5,7 +5,6 @@ sys.path.append('.')
 sys.path.append('..')
 sys.path.append('../..')
 
-import subprocess
 import logging
 import logging.handlers
 
@@ -20,17 +19,23 @@ import sys
 import lib.database_comms as db
 import lib.bmv2_thrift_lib as bmv2
 import os
-import asyncio
 import lib.global_constants as cts
 import lib.helper_functions as utils
 import json
-import concurrent.futures
 
 
 import lib.node_discovery as se_net
 
 from argparse import ArgumentParser
-from lib.performance_monitor import measure_performance
+from lib.performance_monitor import measure_performance, current_trace
+import lib.metrics as metrics
+from lib.station_pipeline import StationPipeline
+from lib.switch_state import SwitchState
+from lib.forwarding_reconciler import ForwardingReconciler, DesiredState, lpm_entry, ternary_entry
+from lib.icmp_probe import IcmpProber
+from lib.netlink.vxlan import VxlanManager
+from lib.netlink.neigh import NeighborCache
+from lib.netlink.nl80211 import Nl80211Listener, FakeStationEvents, NEW_STATION, DEL_STATION
 from lib.logger_utils import get_logger, SocketStreamHandler
 
 
@@ -83,11 +88,9 @@ dir_path = os.path.dirname(os.path.realpath(__file__))
 # a global variable to set the communication protocol with the switch
 P4CTRL = bmv2.P4_CONTROL_METHOD_THRIFT_CLI
 
-INDEX_IW_EVENT_MAC_ADDRESS = 3
-INDEX_IW_EVENT_ACTION = 1 
-
-IW_TOOL_JOINED_STATION_EVENT = 'new'
-IW_TOOL_LEFT_STATION_EVENT = 'del'
+# station events come from nl80211; set this to a JSON-lines file of recorded
+# events (tests/record_station_events.py) to replay it instead of a radio
+STATION_EVENTS_REPLAY = os.environ.get("SE_AP_STATION_EVENTS", "")
 
 # read the swarm subnet from the config file
 # TODO: make this configurable by coordinator
@@ -102,6 +105,20 @@ COORDINATOR_S0_IP = cfg.COORDINATOR_S0_IP #f'10.0.{args.num_id}.254'
 # current_host_id = config.this_swarm_dhcp_start
 created_vxlans = set([])
 
+# VXLAN links are managed over rtnetlink instead of forking `ip`; the manager
+# also indexes the host's VXLANs by id, remote IP and interface name
+VXLANS = VxlanManager(prefix='se_vxlan')
+# stations are handled in parallel: picking a free id and creating the link must not interleave
+VXLAN_ASSIGN_LOCK = threading.Lock()
+
+# the neighbor (ARP) table, followed through netlink notifications instead of polling `arp -en`
+NEIGHBORS = NeighborCache()
+ARP_WAIT_TIMEOUT = 5
+
+# one ICMP socket probes every disconnected station during its grace period
+# (interval and per-probe timeout: SE_PROBE_INTERVAL / SE_PROBE_TIMEOUT)
+PROBER = IcmpProber()
+
 
 SWARM_P4_MC_NODE = 0
 SWARM_P4_MC_GROUP = 1
@@ -114,6 +131,10 @@ CONNECTED_STATIONS_VMAC_INDEX = 0
 CONNECTED_STATIONS_VIP_INDEX = 1
 CONNECTED_STATION_VXLAN_INDEX = 2
 
+# swarm join state per station (swarm id, host id, vIP, vMAC), kept when the
+# station roams to another AP so that coming back skips the host id allocation
+station_cache = {}
+
 WLAN_IF = utils.get_interfaces()["wifi"]
 ETH_IF = utils.get_interfaces()["ethernet"]
 
@@ -159,8 +180,15 @@ switch = {  'name': str(socket.gethostname() ),
 
 THIS_AP = bmv2.connect_to_switch(switch['address'])
 
+# se_vxlan switch ports and swarm broadcast membership of this AP's bmv2; station
+# handlers only record what they need and changes are applied in batches
+# (every SE_AP_SWITCH_FLUSH_INTERVAL seconds). A station that comes back while
+# its link and port still exist keeps both as they are
+SWITCH_STATE = SwitchState(THIS_AP, mc_node=SWARM_P4_MC_NODE)
+
 @measure_performance("Access Point", logger_metric)
 def initialize_program():
+    NEIGHBORS.start()
     while not SE_NODE.known_coordinators:
         logger_console.info("Waiting to Discover a Coordinator ...")
         time.sleep(1)
@@ -211,6 +239,9 @@ def initialize_program():
     bmv2.send_cli_command_to_bmv2(cli_command=f"mc_node_create {SWARM_P4_MC_NODE} {cfg.swarm_backbone_switch_port}", instance=THIS_AP)
     bmv2.send_cli_command_to_bmv2(cli_command=f"mc_node_associate {SWARM_P4_MC_GROUP} 0", instance=THIS_AP)
     bmv2.send_cli_command_to_bmv2(cli_command=f"table_add MyIngress.tb_l2_forward ac_l2_broadcast 01:00:00:00:00:00&&&0x010000000000 => {SWARM_P4_MC_GROUP} 100 ", instance=THIS_AP)
+    SWITCH_STATE.start()
+    # converge on what the ART says as soon as the AP is up, e.g. after a restart
+    RECONCILER.start().trigger('startup')
     
     logger_console.info(f"AP ID: {SELF_UUID} is up" )
     logger_console.info("Access Point initialization complete — AP Started")
@@ -220,10 +251,9 @@ def initialize_program():
 @measure_performance("Access Point", logger_metric) 
 def exit_handler():
     logger_console.debug('Handling exit')
-    for snic in psutil.net_if_addrs():
-        if 'se_vxlan' in snic:
-            shell_command = f"ip link del {snic}"
-            result = subprocess.run(shell_command.split())
+    VXLANS.refresh()
+    for op, snic, error in VXLANS.delete_all():
+        logger_console.error(f'\ncould not delete {snic}:\n\t {error}')
 
 # a function for sending the configuration to the swarm node
 # this connects to the TCP server running in the swarm node and sends the configuration as a string
@@ -245,37 +275,31 @@ def send_swarmNode_config(config_messge, node_socket_server_address):
 
 
 @measure_performance("Access Point", logger_metric)
-def create_vxlan_by_host_id(vxlan_id, remote, port=4789): 
+def create_vxlan_by_host_id(vxlan_id, remote, port=4789, replace=False): 
     logger_console.debug(f'Adding se_vxlan{vxlan_id}')
     
-    add_vxlan_shell_command = "ip link add se_vxlan%s type vxlan id %s dev %s remote %s dstport %s" % (
-        vxlan_id, vxlan_id, WLAN_IF , remote, port)
-
-    result = subprocess.run(add_vxlan_shell_command.split(), text=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    if (result.stderr):
-        logger_console.error(f'\nCould not create se_vxlan{vxlan_id}:\n\t {result.stderr}')
+    # one netlink exchange: the link is created already up, and with replace=True
+    # an old se_vxlan with the same id or remote is deleted in the same batch
+    try:
+        VXLANS.create(int(vxlan_id), remote, dev=WLAN_IF, port=port, replace=replace)
+    except OSError as e:
+        logger_console.error(f'\nCould not create se_vxlan{vxlan_id}:\n\t {e}')
         return -1
     
-    logger_console.debug(f'\nCreated se_vxlan{vxlan_id}')
+    logger_console.debug(f'\nCreated and activated se_vxlan{vxlan_id}')
     created_vxlans.add(int(vxlan_id) )
     
     logger_console.debug(f'\nCreated_vxlans:\n\t {created_vxlans}')            
-    activate_interface_shell_command = "ip link set se_vxlan%s up" % vxlan_id
-    result = subprocess.run(activate_interface_shell_command.split(), text=True , stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    if (result.stderr):
-        logger_console.error(f'\nCould not activate interface se_vxlan{vxlan_id}:\n\t {result.stderr}')
-        return -1
-    logger_console.debug(f'\nActivated interface se_vxlan{vxlan_id}')
     return vxlan_id
         
 
 @measure_performance("Access Point", logger_metric)
 def delete_vxlan_by_host_id(host_id):
     logger_console.debug(f'\nDeleting se_vxlan{host_id}')
-    delete_vxlan_shell_command = "ip link del se_vxlan%s" % (host_id)
-    result = subprocess.run(delete_vxlan_shell_command.split(), text=True , stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    if (result.stderr):
-        logger_console.error(f'\ncould not delete se_vxlan{host_id}:\n\t {result.stderr}')
+    try:
+        VXLANS.delete(f'se_vxlan{host_id}')
+    except OSError as e:
+        logger_console.error(f'\ncould not delete se_vxlan{host_id}:\n\t {e}')
         return
     logger_console.debug(f'\nCreated Vxlans before removing {host_id}: {created_vxlans}')
     if int(host_id) in created_vxlans:
@@ -285,46 +309,127 @@ def delete_vxlan_by_host_id(host_id):
 
 @measure_performance("Access Point", logger_metric)
 def get_mac_from_arp_by_physical_ip(ip):
-    shell_command = "arp -en"
-    result = subprocess.run( shell_command.split(), text=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    if (result.stderr):
-        logger_console.error(f'\nCould run arp for {ip}:\n\t {result.stderr}')
-        return
-
-    for line in result.stdout.strip().splitlines():
-        if ip in line:
-            return line.split()[2]
-    logger_console.error(f'\nMAC not found in ARP for {ip}')
-    return None
+    mac = NEIGHBORS.mac_for_ip(ip)
+    if mac is None:
+        logger_console.error(f'\nMAC not found in ARP for {ip}')
+    return mac
 
 
 @measure_performance("Access Point", logger_metric)
-def get_ip_from_arp_by_physical_mac(physical_mac):
-    shell_command = "arp -en"
+async def get_ip_from_arp_by_physical_mac(physical_mac):
+    # returns as soon as the neighbor entry of the station on WLAN_IF appears
     t0 = time.time()
-    while time.time() - t0 < 5:
-        result = subprocess.run( shell_command.split(), text=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        if (result.stderr):
-            logger_console.error(f'\nCould not run arp for {physical_mac}:\n\t {result.stderr}')
-            return
-        for line in result.stdout.strip().splitlines():
-            if physical_mac in line and WLAN_IF  in line:
-                ip = line.split()[0]
-                logger_console.debug(f'\nIP {ip} was found in ARP for {physical_mac} after {time.time() - t0} Seconds')                
-                return ip
+    ip = await NEIGHBORS.wait_for_ip(physical_mac, timeout=ARP_WAIT_TIMEOUT, ifname=WLAN_IF)
+    if ip is not None:
+        logger_console.debug(f'\nIP {ip} was found in ARP for {physical_mac} after {time.time() - t0} Seconds')                
+    return ip
  
 @measure_performance("Access Point", logger_metric)
 def get_next_available_vxlan_id():
-    shell_command = "ip -d link show | awk '/vxlan id/ {print $3}' "
-    process_ret = subprocess.run(shell_command, text=True, shell=True, stdout=subprocess.PIPE )
-    id_list_str = process_ret.stdout
-    id_list = list(map(int, id_list_str.split()))
-    result = min(set(range(1, 500 )) - set(id_list)) 
-    return result 
+    return VXLANS.next_free_vni(1, 499)
+
+@measure_performance("Access Point", logger_metric)
+def assign_station_vxlan(station_physical_ip_address):
+    # reuse the id of a vxlan that already points at this station; the old
+    # link is replaced in the same netlink exchange that creates the new one
+    with VXLAN_ASSIGN_LOCK:
+        existing_vxlan = VXLANS.find_by_remote(station_physical_ip_address)
+        logger_console.debug(f"existing vxlan for {station_physical_ip_address}: {existing_vxlan}")
+        if (existing_vxlan == None ):
+            vxlan_id = get_next_available_vxlan_id()
+        else:
+            vxlan_id = existing_vxlan.vni
+        if (vxlan_id == -1):
+            return -1
+        create_vxlan_by_host_id( vxlan_id= vxlan_id, remote= station_physical_ip_address, replace= True )
+        return vxlan_id
+
+@measure_performance("Access Point", logger_metric)
+def attach_station_vxlan(station_physical_ip_address):
+    # returns (vxlan_id, reused); an up se_vxlan to this station that is still a
+    # switch port is reused without recreating the link or touching the port
+    existing_vxlan = VXLANS.find_by_remote(station_physical_ip_address)
+    if (existing_vxlan != None and existing_vxlan.up and SWITCH_STATE.is_attached(existing_vxlan.vni)
+            and existing_vxlan.ifname == f'se_vxlan{existing_vxlan.vni}'):
+        logger_console.debug(f'Reusing se_vxlan{existing_vxlan.vni} and its switch port for {station_physical_ip_address}')
+        return existing_vxlan.vni, True
+    
+    vxlan_id = assign_station_vxlan(station_physical_ip_address)
+    if (vxlan_id == -1):
+        return -1, False
+    
+    # the link may have been recreated, so the port is removed and added again with the next batch
+    SWITCH_STATE.attach_port(vxlan_id, f'se_vxlan{vxlan_id}')
+    return vxlan_id, False
+
+def record_join_time(path, t0):
+    # time from the start of the join handling until the station's entries are in place,
+    # labelled by the path taken: full, reused_vxlan or reassociation
+    # the station's port and broadcast membership count as in place once their batch is applied
+    if path != 'reassociation' and not SWITCH_STATE.wait_applied():
+        logger_console.warning(f'Switch changes of a {path} join not applied in time')
+    metrics.exporter_for_logger(logger_metric).record("Access Point", "station.join.forwarding",
+                                                       time.perf_counter_ns() - t0, f"path={path}".encode())
+
+# ---------------- desired switch state ----------------
+# the station pipeline of monitor_stations(); reconciling waits while it has stations in hand
+station_pipeline = None
+
+def stations_busy():
+    return station_pipeline is not None and (station_pipeline.active > 0 or station_pipeline.depth() > 0)
+
+def desired_switch_state():
+    # what this AP's switch should hold according to the ART: its own stations on their
+    # se_vxlan ports, stations of other APs over the backbone towards the hosting AP
+    coordinator_vmac = utils.int_to_mac( int( ipaddress.ip_address(cfg.coordinator_vip)) )
+    entries = [
+        lpm_entry('MyIngress.tb_ipv4_lpm', cfg.coordinator_vip, 32, 'MyIngress.ac_ipv4_forward_mac',
+                  [cfg.swarm_backbone_switch_port, coordinator_vmac]),
+        lpm_entry('MyIngress.tb_ipv4_lpm', COORDINATOR_S0_IP, 32, 'MyIngress.ac_ipv4_forward_mac',
+                  [cfg.swarm_backbone_switch_port, coordinator_vmac]),
+        ternary_entry('MyIngress.tb_l2_forward', '01:00:00:00:00:00', 0x010000000000, 'MyIngress.ac_l2_broadcast',
+                      [SWARM_P4_MC_GROUP], 100),
+    ]
+    keep = set()
+    ports = {cfg.swarm_backbone_switch_port: cfg.ap_backbone_device}
+    broadcast_ports = {cfg.swarm_backbone_switch_port}
+    
+    nodes = db.get_all_nodes_from_art()
+    if (nodes == None or nodes == -1):
+        raise RuntimeError('could not read the ART')
+    aps = SE_NODE.get_aps_dict()
+    for node in nodes:
+        if not node.virt_ip:
+            continue
+        if node.current_ap == SELF_UUID:
+            entries.append(lpm_entry('MyIngress.tb_ipv4_lpm', node.virt_ip, 32,
+                                     'MyIngress.ac_ipv4_forward_mac_from_dst_ip', [node.ap_port]))
+            if (VXLANS.get(f'se_vxlan{node.ap_port}') != None):
+                ports[node.ap_port] = f'se_vxlan{node.ap_port}'
+            if (node.current_swarm != 0):
+                broadcast_ports.add(node.ap_port)
+        elif node.current_ap in aps:
+            ap_mac = utils.int_to_mac( int(ipaddress.ip_address(aps[node.current_ap]['sebackbone_ip'])) )
+            entries.append(lpm_entry('MyIngress.tb_ipv4_lpm', node.virt_ip, 32, 'MyIngress.ac_ipv4_forward_mac',
+                                     [cfg.swarm_backbone_switch_port, ap_mac]))
+        else:
+            # hosted by an AP not discovered yet: its entry, if any, is left as it is
+            keep.add(('MyIngress.tb_ipv4_lpm', ((int(ipaddress.ip_address(node.virt_ip)), 32),)))
+    
+    return DesiredState(entries=entries,
+                        owned={'MyIngress.tb_ipv4_lpm': lambda match: match[0][1] == 32},
+                        keep=keep, ports=ports, port_prefix='se_vxlan',
+                        broadcast_node=SWARM_P4_MC_NODE, broadcast_ports=broadcast_ports)
+
+# fixes whatever the event handlers missed, after events (SE_AP_RECONCILE_DELAY) and
+# periodically (SE_AP_RECONCILE_INTERVAL)
+RECONCILER = ForwardingReconciler(THIS_AP, desired_switch_state, SWITCH_STATE, busy=stations_busy,
+                                  metric_logger=logger_metric)
 
 @measure_performance("Access Point", logger_metric)
 async def handle_new_connected_station(station_physical_mac_address):
     logger_console.debug(f"handling newly connected staion {station_physical_mac_address}")
+    t0 = time.perf_counter_ns()
     
     
     # First Step check if node is already in the Connected Nodes 
@@ -336,7 +441,7 @@ async def handle_new_connected_station(station_physical_mac_address):
         # return
     
     # get the IP of the node from its mac address from the ARP table
-    station_physical_ip_address = get_ip_from_arp_by_physical_mac(station_physical_mac_address)
+    station_physical_ip_address = await get_ip_from_arp_by_physical_mac(station_physical_mac_address)
     if (station_physical_ip_address == None ):
         logger_console.error(f'\nIP not found in ARP for {station_physical_mac_address}. Aborting the handling of the node')
         return
@@ -351,40 +456,27 @@ async def handle_new_connected_station(station_physical_mac_address):
     node_info = node_db_result.one()
     logger_console.debug(f'node_info: {node_info} for {SN_UUID}')    
     
+    # Fast path: the station re-associated with this AP and its link, switch port
+    # and forwarding entries are all still in place, so there is nothing to change
+    connected_station = connected_stations.get(station_physical_mac_address)
+    if ( connected_station != None and node_info != None and node_info.current_ap == SELF_UUID
+            and node_info.ap_port == connected_station[CONNECTED_STATION_VXLAN_INDEX] ):
+        station_vxlan = VXLANS.get(f'se_vxlan{node_info.ap_port}')
+        if ( station_vxlan != None and station_vxlan.up and station_vxlan.remote == station_physical_ip_address
+                and SWITCH_STATE.is_attached(node_info.ap_port) ):
+            logger_console.info(f'Station {station_physical_mac_address} re-associated with {SELF_UUID}, keeping se_vxlan{node_info.ap_port}')
+            record_join_time('reassociation', t0)
+            return
+    
     # # in case the node is not present in the ART
     if ( node_info == None or node_info.current_swarm == 0):
         logger_console.debug(f'Configuring Swarm 0 for {SN_UUID}')    
         
-        command = f"ip -d link show | awk '/remote {station_physical_ip_address}/ {{print $3}}' "
-        proc_ret = subprocess.run(command, shell=True, text=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        if proc_ret.stderr:
-            logger_console.error(f"Error running: {command}\nError Message:\n{proc_ret.stdout} ")    
-            logger_console.error(f"Something wrong with assigning vxlan to {SN_UUID} ")
-            return
-        
-        logger_console.debug(f"ran command: {command}\ngot output:\n{proc_ret.stdout} ")
-        vxlan_id = -1
-        if (proc_ret.stdout == '' ):
-            vxlan_id = get_next_available_vxlan_id()
-        else:
-            vxlan_id = int(proc_ret.stdout)
-            command = f"ip link del se_vxlan{vxlan_id}"
-            proc_ret = subprocess.run(command, shell=True, text=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        vxlan_id, vxlan_reused = attach_station_vxlan(station_physical_ip_address)
         if (vxlan_id == -1):
             logger_console.error(f"Something wrong with assigning vxlan to {SN_UUID} ")
             return
         
-        create_vxlan_by_host_id( vxlan_id= vxlan_id, remote= station_physical_ip_address )
-        
-        
-        
-        
-        dettach_vxlan_from_bmv2_command = "port_remove %s" % (vxlan_id)
-        bmv2.send_cli_command_to_bmv2(cli_command=dettach_vxlan_from_bmv2_command, instance=THIS_AP)
-        
-        attach_vxlan_to_bmv2_command = "port_add se_vxlan%s %s" % (vxlan_id, vxlan_id)
-        bmv2.send_cli_command_to_bmv2(cli_command=attach_vxlan_to_bmv2_command, instance=THIS_AP)
-        
         node_s0_ip = str(DEFAULT_SUBNET).split('.')[:3]
         node_s0_ip.append(station_physical_ip_address.split('.')[3])
         node_s0_ip = '.'.join(node_s0_ip)      
@@ -401,7 +493,8 @@ async def handle_new_connected_station(station_physical_mac_address):
             STRs.SWARM_ID.name: 0,
             STRs.COORDINATOR_VIP.name: str(COORDINATOR_S0_IP),
             STRs.COORDINATOR_TCP_PORT.name: cfg.coordinator_tcp_port,
-            STRs.AP_UUID.name: SELF_UUID
+            STRs.AP_UUID.name: SELF_UUID,
+            STRs.TRACE_ID.name: current_trace()
         }
         
         swarmNode_config_message = json.dumps(swarmNode_config)   
@@ -424,53 +517,41 @@ async def handle_new_connected_station(station_physical_mac_address):
                             action_params= f'{str(vxlan_id)}', instance=THIS_AP)
      
         
+        ap_ip_for_mac_derivation = SE_NODE.get_aps_dict()[SELF_UUID]['sebackbone_ip']
         for uuid, sw_data in SE_NODE.get_aps_dict().items():
             if uuid != SELF_UUID:
                 ap_address = sw_data['address']
-                ap_mac = utils.int_to_mac( int(ipaddress.ip_address(sw_data['sebackbone_ip'])) )
+                ap_mac = utils.int_to_mac( int(ipaddress.ip_address(ap_ip_for_mac_derivation)) )
                 entry_handle = bmv2.add_entry_to_bmv2(communication_protocol= bmv2.P4_CONTROL_METHOD_THRIFT_CLI,
                         table_name='MyIngress.tb_ipv4_lpm',
                         action_name='MyIngress.ac_ipv4_forward_mac', match_keys=f'{node_s0_ip}/32' , 
                         action_params= f'{cfg.swarm_backbone_switch_port} {ap_mac}', thrift_ip= ap_address, thrift_port= bmv2.DEFAULT_THRIFT_PORT, instance=sw_data['cli_instance'] )
+        record_join_time('reused_vxlan' if vxlan_reused else 'full', t0)
             
 
         
     else :
         logger_console.info(f'node {SN_UUID} is part of swarm {node_info.current_swarm}')
-        command = f"ip -d link show | awk '/remote {station_physical_ip_address}/ {{print $3}}' "
-        proc_ret = subprocess.run(command, shell=True, text=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        if proc_ret.stderr:
-            logger_console.error(f"Error running: {command}\nError Message:\n{proc_ret.stdout} ")    
-            logger_console.error(f"Something wrong with assigning vxlan to {SN_UUID} ")
-            return
-        
-        logger_console.debug(f"ran command: {command}\ngot output:\n{proc_ret.stdout} ")
-        vxlan_id = -1
-        if (proc_ret.stdout == '' ):
-            vxlan_id = get_next_available_vxlan_id()
-        else:
-            vxlan_id = int(proc_ret.stdout)
-            command = f"ip link del se_vxlan{vxlan_id}"
-            proc_ret = subprocess.run(command, shell=True, text=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        vxlan_id, vxlan_reused = attach_station_vxlan(station_physical_ip_address)
         if (vxlan_id == -1):
             logger_console.error(f"Something wrong with assigning vxlan to {SN_UUID} ")
             return
         
-        create_vxlan_by_host_id( vxlan_id= vxlan_id, remote= station_physical_ip_address )
-    
-        dettach_vxlan_from_bmv2_command = "port_remove %s" % (vxlan_id)
-        bmv2.send_cli_command_to_bmv2(cli_command=dettach_vxlan_from_bmv2_command, instance=THIS_AP)
-        
-        attach_vxlan_to_bmv2_command = "port_add se_vxlan%s %s" % (vxlan_id, vxlan_id)
-        bmv2.send_cli_command_to_bmv2(cli_command=attach_vxlan_to_bmv2_command, instance=THIS_AP)
-        
-        
-        host_id = db.get_next_available_host_id_from_swarm_table(first_host_id=cfg.this_swarm_dhcp_start,
-                    max_host_id=cfg.this_swarm_dhcp_end, uuid=SN_UUID)
-        
-        result = utils.assign_virtual_mac_and_ip_by_host_id(subnet= THIS_SWARM_SUBNET, host_id=host_id)
-        station_vmac= result[0]
-        station_vip = result[1]
+        # a station coming back to this AP in the same swarm keeps its host id, vIP and vMAC
+        cached_state = station_cache.get(station_physical_mac_address)
+        if ( cached_state != None and cached_state['swarm_id'] == node_info.current_swarm ):
+            host_id = cached_state['host_id']
+            station_vmac = cached_state['vmac']
+            station_vip = cached_state['vip']
+        else:
+            host_id = db.get_next_available_host_id_from_swarm_table(first_host_id=cfg.this_swarm_dhcp_start,
+                        max_host_id=cfg.this_swarm_dhcp_end, uuid=SN_UUID)
+            
+            result = utils.assign_virtual_mac_and_ip_by_host_id(subnet= THIS_SWARM_SUBNET, host_id=host_id)
+            station_vmac= result[0]
+            station_vip = result[1]
+            station_cache[station_physical_mac_address] = {'swarm_id': node_info.current_swarm, 'host_id': host_id,
+                                                           'vmac': station_vmac, 'vip': station_vip}
         
         logger_console.info( f'\nStation {station_physical_mac_address}\t{station_physical_ip_address}\n\t' +  
                     f'assigned vIP: {station_vip} and vMAC: {station_vmac}')
@@ -485,7 +566,8 @@ async def handle_new_connected_station(station_physical_mac_address):
             STRs.SWARM_ID.name              : node_info.current_swarm,
             STRs.COORDINATOR_VIP.name       : cfg.coordinator_vip,
             STRs.COORDINATOR_TCP_PORT.name  : cfg.coordinator_tcp_port,
-            STRs.AP_UUID.name               : SELF_UUID
+            STRs.AP_UUID.name               : SELF_UUID,
+            STRs.TRACE_ID.name              : current_trace()
         }
         
         swarmNode_config_message = json.dumps(swarmNode_config)
@@ -504,7 +586,7 @@ async def handle_new_connected_station(station_physical_mac_address):
                                         host_id=host_id, node_vip=station_vip, node_vmac=station_vmac, 
                                         node_phy_mac=station_physical_mac_address, status=db.db_defines.SWARM_STATUS.JOINED.value)
         
-        bmv2.add_bmv2_swarm_broadcast_port(switch_port=vxlan_id, instance=THIS_AP)
+        SWITCH_STATE.add_broadcast_port(vxlan_id)
         
         entry_handle = bmv2.add_entry_to_bmv2(communication_protocol= bmv2.P4_CONTROL_METHOD_THRIFT_CLI,
                             table_name='MyIngress.tb_ipv4_lpm',
@@ -521,6 +603,7 @@ async def handle_new_connected_station(station_physical_mac_address):
                         table_name='MyIngress.tb_ipv4_lpm',
                         action_name='MyIngress.ac_ipv4_forward_mac', match_keys=f'{station_vip}/32' , 
                         action_params= f'{cfg.swarm_backbone_switch_port} {ap_mac}', thrift_ip= ap_ip, instance=sw_data['cli_instance'] )
+        record_join_time('reused_vxlan' if vxlan_reused else 'full', t0)
 
 @measure_performance("Access Point", logger_metric)                    
 async def handle_disconnected_station(station_physical_mac_address):
@@ -541,23 +624,19 @@ async def handle_disconnected_station(station_physical_mac_address):
             logger_console.warning(f'\nStation {station_physical_mac_address} disconnected from AP but was not found in connected stations: {connected_stations.keys()}')
             # return
         # Wait for some time configured by the variable in cfg before considering that the node has actually disconnected
-        t0 = time.time()
-        while time.time() - t0 < cfg.ap_wait_time_for_disconnected_station_in_seconds:
-            # cli_command = f"iw {WLAN_IF} station dump | grep Station"
-            # proc_res = subprocess.run(cli_command,shell=True, text=True,stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            # if (proc_res.stderr):
-            #     logger_console.error(f"Error running command: {cli_command}\nError Message: {proc_res.stderr}")
-            # if (station_physical_mac_address in proc_res.stdout):
-            #     return
-            cli_command = f"ping -c 1 { get_ip_from_arp_by_physical_mac(station_physical_mac_address)}"
-            proc_res = subprocess.run(cli_command.split(), capture_output=True)
-            if (proc_res.returncode == 0):
-                return 
+        # the station counts as back as soon as it answers an ICMP echo; its IP is
+        # re-read from the neighbor cache before every probe
+        if await PROBER.wait_reachable(lambda: NEIGHBORS.ip_for_mac(station_physical_mac_address, WLAN_IF),
+                                       duration=cfg.ap_wait_time_for_disconnected_station_in_seconds):
+            logger_console.info(f'Station {station_physical_mac_address} answered within the grace period, keeping it')
+            return 
         
         node_db_result = db.get_node_info_from_art(node_uuid=SN_UUID)
         node_info = node_db_result.one()
         if ( node_info == None or node_info.current_ap != SELF_UUID):
-            bmv2.remove_bmv2_swarm_broadcast_port(ap_ip='0.0.0.0', thrift_port=9090, switch_port=node_info.ap_port, instance=THIS_AP)
+            # the station's port on this AP, node_info.ap_port is its port on the new AP
+            if (station_physical_mac_address in connected_stations):
+                SWITCH_STATE.remove_broadcast_port(connected_stations[station_physical_mac_address][CONNECTED_STATION_VXLAN_INDEX])
             try:
                 logger_console.debug(f"Connected Stations List before removing {station_physical_mac_address}: {connected_stations}")                
                 del connected_stations[station_physical_mac_address]
@@ -585,43 +664,56 @@ async def handle_disconnected_station(station_physical_mac_address):
                                             instance=sw_data['cli_instance'] )
 
         # delete the corresponding switch port
-        bmv2.remove_bmv2_swarm_broadcast_port(switch_port=node_info.ap_port, instance=THIS_AP)
-        delete_vxlan_from_bmv2_command = "port_remove %s" % station_vxlan_id
-        bmv2.send_cli_command_to_bmv2(delete_vxlan_from_bmv2_command, instance=THIS_AP)
+        SWITCH_STATE.remove_broadcast_port(node_info.ap_port)
+        SWITCH_STATE.detach_port(station_vxlan_id)
+        station_cache.pop(station_physical_mac_address, None)
         
         db.delete_node_from_art(uuid=SN_UUID)  # also deletes from swarm database
     
         logger_console.info(f'station: {station_virtual_ip_address} left {SELF_UUID}')
+        # the switch lets go of the port before its link disappears
+        SWITCH_STATE.wait_applied()
         delete_vxlan_by_host_id(station_vxlan_id)
     except Exception as e:
         logger_console.error(f"Error handling disconnected station {SN_UUID}: {repr(e)}")
 
 
-def monitor_stations():
-    # this command is run in the shell to monitor wireless events using the iw tool
-    monitoring_command = 'iw event'
-
-    # python runs the shell command and monitors the output in the terminal
-    process = subprocess.Popen( monitoring_command.split() , stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    previous_line = ''
-    # we iterate over the output lines to read the event and react accordingly
-    for output_line in iter(lambda: process.stdout.readline().decode("utf-8"), ""):
-        if (output_line.strip() == previous_line.strip()):
+def monitor_stations(source=None):
+    # typed NEW_STATION / DEL_STATION events from the nl80211 mlme multicast group
+    if source is None:
+        if STATION_EVENTS_REPLAY:
+            source = FakeStationEvents.load(STATION_EVENTS_REPLAY, realtime=True)
+        else:
+            source = Nl80211Listener(ifname=WLAN_IF)
+    # events of one station are handled in order, different stations in parallel
+    global station_pipeline
+    pipeline = StationPipeline({NEW_STATION: handle_new_connected_station,
+                                DEL_STATION: handle_disconnected_station},
+                               component="Access Point", metric_logger=logger_metric).start()
+    station_pipeline = pipeline
+    previous_event = None
+    for event in source.events():
+        if previous_event is not None and (event.kind, event.mac) == (previous_event.kind, previous_event.mac):
             continue
-        previous_line = output_line
-        output_line_as_word_array = output_line.split()
-        logger_console.debug( 'WiFi Event: ' + output_line )
+        previous_event = event
+        logger_console.debug( f'WiFi Event: {event.ifname}: {event.kind} station {event.mac}' )
         
-        if output_line_as_word_array[INDEX_IW_EVENT_ACTION] == IW_TOOL_JOINED_STATION_EVENT:
-            station_physical_mac_address = output_line_as_word_array[INDEX_IW_EVENT_MAC_ADDRESS]
+        if event.kind == NEW_STATION:
+            station_physical_mac_address = event.mac
             logger_console.debug( 'New Station MAC: ' + station_physical_mac_address )
             
-            asyncio.run( handle_new_connected_station(station_physical_mac_address=station_physical_mac_address) )
+            # a station joining the AP starts a trace, followed by the node manager via the config message
+            trace_id = pipeline.submit(NEW_STATION, station_physical_mac_address, received=event.monotonic)
+            logger_console.debug(f'Tracing join of {station_physical_mac_address} as {trace_id}')
 
-        elif output_line_as_word_array[INDEX_IW_EVENT_ACTION] ==   IW_TOOL_LEFT_STATION_EVENT:
-            station_physical_mac_address = output_line_as_word_array[INDEX_IW_EVENT_MAC_ADDRESS]
+        elif event.kind == DEL_STATION:
+            station_physical_mac_address = event.mac
             logger_console.info( 'Disconnected Station MAC: ' + station_physical_mac_address )
-            asyncio.run(  handle_disconnected_station(station_physical_mac_address=station_physical_mac_address) )
+            trace_id = pipeline.submit(DEL_STATION, station_physical_mac_address, received=event.monotonic)
+            logger_console.debug(f'Tracing leave of {station_physical_mac_address} as {trace_id}')
+        
+        # checked once the pipeline has handled this and any following events
+        RECONCILER.trigger(event.kind)
 
 
 @measure_performance("Access Point", logger_metric)
@@ -633,6 +725,7 @@ def ap_id_to_vxlan_id(access_point_id):
                
 def main():
     logger_console.info("AP Starting")
+    metrics.serve_http()
     SE_NODE.start()        
     initialize_program()
     monitor_stations()
@@ -641,6 +734,7 @@ def run(uuid, no_discovery):
     global SELF_UUID, SE_NODE
     SELF_UUID = uuid
     logger_console.info(f"\n--{SELF_UUID} Starting")
+    metrics.serve_http()
     SE_NODE = se_net.Node(
         node_type = SELF_TYPE,
         node_uuid = SELF_UUID,
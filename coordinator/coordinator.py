@@ -28,6 +28,10 @@ import lib.database_comms as db
 import lib.global_constants as cts
 import lib.helper_functions as utils
 import lib.node_discovery as se_net
+import lib.heartbeat.events as hb_events
+from lib.logger_utils import SocketStreamHandler
+import lib.metrics as metrics
+from lib.performance_monitor import measure_performance, use_trace, current_trace, new_trace_id
 
 from argparse import ArgumentParser
 
@@ -41,43 +45,6 @@ STRs = cts.String_Constants
 
 
 
-class SocketStreamHandler(logging.StreamHandler):
-    """Custom StreamHandler to send logs over TCP."""
-    def __init__(self, host, port):
-        super().__init__(sys.stdout)  # StreamHandler needs an output stream
-        self.host = host
-        self.port = port
-        self.sock = None
-        self._connect()
-
-    def _connect(self):
-        """Establish connection to log server."""
-        try:
-            self.sock = socket.create_connection((self.host, self.port))
-        except Exception as e:
-            print(f"Failed to connect to log server: {e}")
-            self.sock = None
-
-    def emit(self, record):
-        """Send log message to log server."""
-        if not self.sock:
-            self._connect()  # Try to reconnect if needed
-            if not self.sock:
-                return  # Drop log if connection fails
-
-        try:
-            msg = self.format(record) + "\n"
-            self.sock.sendall(msg.encode('utf-8'))  # Send log as bytes
-        except Exception as e:
-            print(f"Error sending log: {e}")
-            self.sock = None  # Reset socket on failure
-
-    def close(self):
-        """Close the socket when done."""
-        if self.sock:
-            self.sock.close()
-        super().close()
-
 SELF_TYPE='CO'
 SELF_UUID = "null"
 
@@ -118,6 +85,12 @@ SWARM_NODE_TCP_SERVER = ('', 29997)
 
 DEFAULT_THRIFT_PORT = bmv2.DEFAULT_THRIFT_PORT
 
+# liveness events from the heartbeat server (lib/heartbeat/events.py EventServer)
+HB_EVENTS_ADDRESS = os.environ.get("SE_CO_HB_EVENTS", "127.0.0.1:5009")   # empty disables
+OFFBOARD_DEAD_NODES = os.environ.get("SE_CO_OFFBOARD_DEAD", "1") == "1"
+DEAD_BATCH_WINDOW = float(os.environ.get("SE_CO_DEAD_BATCH_WINDOW", "0.5"))   # seconds dead events are collected for
+GO_AWAY_TIMEOUT = float(os.environ.get("SE_CO_GO_AWAY_TIMEOUT", "0.5"))       # a dead node rarely answers
+
 THIS_SWARM_SUBNET=ipaddress.ip_address( cfg.this_swarm_subnet )
 
 db.DATABASE_IN_USE = db.STR_DATABASE_TYPE_CASSANDRA
@@ -181,12 +154,14 @@ class Swarm_Node_Handler:
         pass
 
          
+@measure_performance("Coordinator", logger)
 async def offboard_node(host_id, uuid, ap_id, node_vip, ap_port, available_nodes, lock):
     SN_UUID = uuid
     logger.debug(f'Kicking Node {SN_UUID} ip {node_vip} from Swarm')
     
     swarmNode_config = {
-        STRs.TYPE.name: 'go_away'
+        STRs.TYPE.name: 'go_away',
+        STRs.TRACE_ID.name: current_trace()
     }
     
     config_message = json.dumps(swarmNode_config)
@@ -210,6 +185,53 @@ async def offboard_node(host_id, uuid, ap_id, node_vip, ap_port, available_nodes
         return
             
 
+async def send_go_away(node_vip, uuid, timeout=GO_AWAY_TIMEOUT):
+    """Best-effort go_away; True if the node accepted the connection."""
+    message = json.dumps({STRs.TYPE.name: 'go_away', STRs.TRACE_ID.name: current_trace()})
+    try:
+        _reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(node_vip, cfg.node_manager_tcp_port), timeout)
+        writer.write(message.encode())
+        await asyncio.wait_for(writer.drain(), timeout)
+        writer.close()
+        return True
+    except Exception as e:
+        logger.debug(f'go_away to {uuid} at {node_vip} not delivered: {repr(e)}')
+        return False
+
+
+@measure_performance("Coordinator", logger)
+async def release_dead_nodes(node_ids):
+    """
+    Offboard nodes the heartbeat server reports dead: nothing is expected from
+    the node, so its forwarding entries, broadcast port, ART row and swarm
+    table row are removed here. Returns the uuids that were released.
+    """
+    query = f"""SELECT * FROM ks_swarm.art WHERE uuid IN (
+        {', '.join(repr(item) for item in node_ids)});"""
+    rows = db.execute_query(query)
+    if rows == -1:
+        return []
+    nodes = list(rows)
+    # in case a node is only unreachable for heartbeats, ask it to leave, without waiting on it
+    await asyncio.gather(*(send_go_away(node.virt_ip, node.uuid) for node in nodes if node.virt_ip))
+    
+    aps = SE_NODE.get_aps_dict()
+    for node in nodes:
+        if node.virt_ip:
+            for _, sw_data in aps.items():
+                bmv2.delete_forwarding_entry_from_bmv2(communication_protocol=bmv2.P4_CONTROL_METHOD_THRIFT_CLI,
+                                                       table_name='MyIngress.tb_ipv4_lpm', key=f'{node.virt_ip}/32',
+                                                       instance=sw_data['cli_instance'])
+        hosting_ap = aps.get(node.current_ap)
+        if hosting_ap is not None and node.ap_port is not None:
+            bmv2.remove_bmv2_swarm_broadcast_port(switch_port=node.ap_port, instance=hosting_ap['cli_instance'])
+        db.delete_node_from_art(uuid=node.uuid)  # also deletes from swarm database
+        logger.info(f"[HB] released dead node {node.uuid} ({node.virt_ip} at {node.current_ap})")
+    return [node.uuid for node in nodes]
+
+
+@measure_performance("Coordinator", logger)
 async def onboard_node(
     host_id, uuid, ap_id, node_s0_ip, ap_port,
     available_nodes, lock,
@@ -240,6 +262,7 @@ async def onboard_node(
         "heartbeat": heartbeat,
         "COORDINATOR_PUBKEY_PORT": 5007,
         "COORDINATOR_HB_PORT": 5008,
+        STRs.TRACE_ID.name: current_trace(),
     }
 
     # ✅ Include heartbeat parameters if heartbeat is enabled
@@ -253,7 +276,7 @@ async def onboard_node(
 
         logger.info(
             f"[ONBOARD] Node {SN_UUID} heartbeat enabled | "
-            f"length={hb_length}, window={hb_window}, interval={hb_interval}"
+            f"length={hb_length}, window={hb_window}, interval={hb_interval} trace={current_trace()}"
         )
     else:
         logger.info(f"[ONBOARD] Node {SN_UUID} heartbeat disabled")
@@ -307,10 +330,10 @@ async def onboard_node(
         instance=instance
     )
 
-    # --- replicate entry across other APs ---
+    # --- replicate entry across other APs, forwarding towards the hosting AP ---
+    ap_mac = utils.int_to_mac(int(ipaddress.ip_address(SE_NODE.get_aps_dict()[ap_id]['sebackbone_ip'])))
     for uuid, sw_data in SE_NODE.get_aps_dict().items():
         if uuid != ap_id:
-            ap_mac = utils.int_to_mac(int(ipaddress.ip_address(sw_data['sebackbone_ip'])))
             bmv2.add_entry_to_bmv2(
                 communication_protocol=bmv2.P4_CONTROL_METHOD_THRIFT_CLI,
                 table_name='MyIngress.tb_ipv4_lpm',
@@ -373,6 +396,47 @@ str_NODE_LEAVE_LIST = 'nll'
 str_AVAILABLE_NODES = 'avn'
 str_NODE_IDS = 'nids'
 
+@measure_performance("Coordinator", logger)
+async def offboard_nodes(node_ids):
+    """Offboard the given nodes; returns the uuids that acknowledged, None if none were found."""
+    query = f"""SELECT * FROM ks_swarm.art WHERE uuid IN (
+        {', '.join(repr(item) for item in node_ids)});"""
+    rows = db.execute_query(query)
+    availalbe_nodes_ids = []
+    available_nodes_ips = []
+    available_nodes_aps = []
+    available_nodes_ports = []
+    for row in rows:
+        availalbe_nodes_ids.append(row.uuid)
+        available_nodes_ips.append(row.virt_ip)
+        available_nodes_aps.append(row.current_ap)
+        available_nodes_ports.append(row.ap_port)
+    if not available_nodes_ips:
+        return
+    available_nodes = []
+    lock = asyncio.Lock()
+    tasks = []
+    for i in range(len(available_nodes_ips)):
+        node_uuid = availalbe_nodes_ids[i]
+        node_s0_ip = available_nodes_ips[i]
+        ap_id = available_nodes_aps[i]
+        ap_port = available_nodes_ports[i]
+        task = asyncio.create_task(
+            offboard_node(
+                host_id=None,
+                uuid=node_uuid,
+                ap_id=ap_id,
+                node_vip=node_s0_ip,
+                ap_port=ap_port,
+                available_nodes=available_nodes,
+                lock=lock
+            )
+        )
+        tasks.append(task)
+    await asyncio.gather(*tasks)
+    return available_nodes
+
+
 async def handle_ac_communication(ac_socket):
     try:
         ac_message_in = ac_socket.recv(1024)
@@ -383,139 +447,111 @@ async def handle_ac_communication(ac_socket):
         logger.debug(f'ac_message_in: {ac_message_in}')
         ac_message_in_json = json.loads(ac_message_in.decode())
 
-        if ac_message_in_json[str_TYPE] == str_NODE_JOIN_LIST:
-            # --- Parse heartbeat parameters if provided ---
-            heartbeat_enabled = ac_message_in_json.get("heartbeat", False)
-            hb_length = ac_message_in_json.get("hb_length")
-            hb_window = ac_message_in_json.get("hb_window")
-            hb_interval = ac_message_in_json.get("hb_interval")
+        # the Adaptive Coordinator may start the trace; otherwise the join/leave starts here
+        trace_id = ac_message_in_json.get(STRs.TRACE_ID.name) or new_trace_id()
+        with use_trace(trace_id):
+            await handle_ac_request(ac_socket, ac_message_in_json)
 
-            logger.info(
-                f"[AC] Received JOIN request | Heartbeat={heartbeat_enabled} "
-                f"length={hb_length}, window={hb_window}, interval={hb_interval}"
-            )
+    except Exception as e:
+        logger.exception(f"Error in handle_ac_communication: {e}")
 
-            # --- Retrieve target node(s) from DB ---
-            query = f"""SELECT * FROM ks_swarm.art WHERE uuid IN (
-                {', '.join(repr(item) for item in ac_message_in_json[str_NODE_IDS])});"""
-            rows = db.execute_query(query)
-
-            availalbe_nodes_ids = []
-            available_nodes_ips = []
-            available_nodes_aps = []
-            available_nodes_ports = []
-
-            nodes_already_in_swarm = []
-            for row in rows:
-                if row.current_swarm == 0:
-                    availalbe_nodes_ids.append(row.uuid)
-                    available_nodes_ips.append(row.virt_ip)
-                    available_nodes_aps.append(row.current_ap)
-                    available_nodes_ports.append(row.ap_port)
-                elif row.current_swarm == 1:
-                    nodes_already_in_swarm.append(row.uuid)
-                    pass
 
-            if not available_nodes_ips:
-                logger.warning("[AC] No available nodes found for join request.")
-                return
+@measure_performance("Coordinator", logger)
+async def handle_ac_request(ac_socket, ac_message_in_json):
+    """Join/leave request from the Adaptive Coordinator; runs under the request's trace id."""
+    if ac_message_in_json[str_TYPE] == str_NODE_JOIN_LIST:
+        # --- Parse heartbeat parameters if provided ---
+        heartbeat_enabled = ac_message_in_json.get("heartbeat", False)
+        hb_length = ac_message_in_json.get("hb_length")
+        hb_window = ac_message_in_json.get("hb_window")
+        hb_interval = ac_message_in_json.get("hb_interval")
 
-            available_host_ids = db.batch_get_available_host_id_from_swarm_table(
-                first_host_id=cfg.this_swarm_dhcp_start,
-                max_host_id=cfg.this_swarm_dhcp_end
-            )
+        logger.info(
+            f"[AC] Received JOIN request | Heartbeat={heartbeat_enabled} "
+            f"length={hb_length}, window={hb_window}, interval={hb_interval} trace={current_trace()}"
+        )
 
-            available_nodes = []
-            lock = asyncio.Lock()
-            tasks = []
-
-            for i in range(len(available_nodes_ips)):
-                host_id = available_host_ids[i]
-                node_uuid = availalbe_nodes_ids[i]
-                node_s0_ip = available_nodes_ips[i]
-                ap_id = available_nodes_aps[i]
-                ap_port = available_nodes_ports[i]
-
-                # ✅ Pass heartbeat params directly to onboard_node()
-                task = asyncio.create_task(
-                    onboard_node(
-                        host_id=host_id,
-                        uuid=node_uuid,
-                        ap_id=ap_id,
-                        node_s0_ip=node_s0_ip,
-                        ap_port=ap_port,
-                        available_nodes=available_nodes,
-                        lock=lock,
-                        heartbeat=heartbeat_enabled,
-                        hb_length=hb_length,
-                        hb_window=hb_window,
-                        hb_interval=hb_interval
-                    )
-                )
-                tasks.append(task)
+        # --- Retrieve target node(s) from DB ---
+        query = f"""SELECT * FROM ks_swarm.art WHERE uuid IN (
+            {', '.join(repr(item) for item in ac_message_in_json[str_NODE_IDS])});"""
+        rows = db.execute_query(query)
 
-            await asyncio.gather(*tasks)
+        availalbe_nodes_ids = []
+        available_nodes_ips = []
+        available_nodes_aps = []
+        available_nodes_ports = []
 
-            message = {
-                'Type': str_AVAILABLE_NODES,
-                str_NODE_IDS: available_nodes + nodes_already_in_swarm
-            }
-            try:
-                ac_socket.sendall(json.dumps(message).encode())
-            except (BrokenPipeError, ConnectionResetError):
-                logger.error("Error sending response back to Adaptive Coordinator")
-
-        elif ac_message_in_json[str_TYPE] == str_NODE_LEAVE_LIST:
-            # unchanged leave logic
-            query = f"""SELECT * FROM ks_swarm.art WHERE uuid IN (
-                {', '.join(repr(item) for item in ac_message_in_json[str_NODE_IDS])});"""
-            rows = db.execute_query(query)
-            availalbe_nodes_ids = []
-            available_nodes_ips = []
-            available_nodes_aps = []
-            available_nodes_ports = []
-            for row in rows:
+        nodes_already_in_swarm = []
+        for row in rows:
+            if row.current_swarm == 0:
                 availalbe_nodes_ids.append(row.uuid)
                 available_nodes_ips.append(row.virt_ip)
                 available_nodes_aps.append(row.current_ap)
                 available_nodes_ports.append(row.ap_port)
-            if not available_nodes_ips:
-                return
-            available_host_ids = db.batch_get_available_host_id_from_swarm_table(
-                first_host_id=cfg.this_swarm_dhcp_start,
-                max_host_id=cfg.this_swarm_dhcp_end
-            )
-            available_nodes = []
-            lock = asyncio.Lock()
-            tasks = []
-            for i in range(len(available_nodes_ips)):
-                host_id = available_host_ids[i]
-                node_uuid = availalbe_nodes_ids[i]
-                node_s0_ip = available_nodes_ips[i]
-                ap_id = available_nodes_aps[i]
-                ap_port = available_nodes_ports[i]
-                task = asyncio.create_task(
-                    offboard_node(
-                        host_id=host_id,
-                        uuid=node_uuid,
-                        ap_id=ap_id,
-                        node_vip=node_s0_ip,
-                        ap_port=ap_port,
-                        available_nodes=available_nodes,
-                        lock=lock
-                    )
+            elif row.current_swarm == 1:
+                nodes_already_in_swarm.append(row.uuid)
+                pass
+
+        if not available_nodes_ips:
+            logger.warning("[AC] No available nodes found for join request.")
+            return
+
+        available_host_ids = db.batch_get_available_host_id_from_swarm_table(
+            first_host_id=cfg.this_swarm_dhcp_start,
+            max_host_id=cfg.this_swarm_dhcp_end
+        )
+
+        available_nodes = []
+        lock = asyncio.Lock()
+        tasks = []
+
+        for i in range(len(available_nodes_ips)):
+            host_id = available_host_ids[i]
+            node_uuid = availalbe_nodes_ids[i]
+            node_s0_ip = available_nodes_ips[i]
+            ap_id = available_nodes_aps[i]
+            ap_port = available_nodes_ports[i]
+
+            # ✅ Pass heartbeat params directly to onboard_node()
+            task = asyncio.create_task(
+                onboard_node(
+                    host_id=host_id,
+                    uuid=node_uuid,
+                    ap_id=ap_id,
+                    node_s0_ip=node_s0_ip,
+                    ap_port=ap_port,
+                    available_nodes=available_nodes,
+                    lock=lock,
+                    heartbeat=heartbeat_enabled,
+                    hb_length=hb_length,
+                    hb_window=hb_window,
+                    hb_interval=hb_interval
                 )
-                tasks.append(task)
-            await asyncio.gather(*tasks)
+            )
+            tasks.append(task)
 
-            message = {'Type': str_AVAILABLE_NODES, str_NODE_IDS: available_nodes}
-            try:
-                ac_socket.sendall(json.dumps(message).encode())
-            except Exception:
-                logger.error("Error sending response to Adaptive Coordinator")
+        await asyncio.gather(*tasks)
 
-    except Exception as e:
-        logger.exception(f"Error in handle_ac_communication: {e}")
+        message = {
+            'Type': str_AVAILABLE_NODES,
+            str_NODE_IDS: available_nodes + nodes_already_in_swarm
+        }
+        try:
+            ac_socket.sendall(json.dumps(message).encode())
+        except (BrokenPipeError, ConnectionResetError):
+            logger.error("Error sending response back to Adaptive Coordinator")
+
+    elif ac_message_in_json[str_TYPE] == str_NODE_LEAVE_LIST:
+        logger.info(f"[AC] Received LEAVE request | trace={current_trace()}")
+        available_nodes = await offboard_nodes(ac_message_in_json[str_NODE_IDS])
+        if available_nodes is None:
+            return
+
+        message = {'Type': str_AVAILABLE_NODES, str_NODE_IDS: available_nodes}
+        try:
+            ac_socket.sendall(json.dumps(message).encode())
+        except Exception:
+            logger.error("Error sending response to Adaptive Coordinator")
 
 
 
@@ -557,12 +593,51 @@ def adaptive_coordinator_handler(HOST, HIGHER_PORT):
 
 
 
+# nodes reported dead, released in batches by dead_node_worker
+dead_nodes = queue.Queue()
+
+def dead_node_worker():
+    while True:
+        batch = {dead_nodes.get()}
+        # a mass failure arrives as many events close together: release them at once
+        deadline = time.monotonic() + DEAD_BATCH_WINDOW
+        while (remaining := deadline - time.monotonic()) > 0:
+            try:
+                batch.add(dead_nodes.get(timeout=remaining))
+            except queue.Empty:
+                break
+        with use_trace(new_trace_id()) as trace_id:
+            logger.info(f"[HB] offboarding {len(batch)} dead node(s) {sorted(batch)}, trace {trace_id}")
+            try:
+                asyncio.run(release_dead_nodes(sorted(batch)))
+            except Exception as e:
+                logger.error(f"[HB] releasing dead nodes {sorted(batch)} failed: {repr(e)}")
+
+
+def heartbeat_event_listener():
+    """Follow the heartbeat server's event stream and queue nodes it reports dead for offboarding."""
+    host, port = HB_EVENTS_ADDRESS.rsplit(':', 1)
+    while True:
+        try:
+            for event in hb_events.subscribe_remote(host, int(port), types=[hb_events.EV_DEAD, hb_events.EV_RECOVERED]):
+                if event['type'] == hb_events.EV_RECOVERED:
+                    logger.info(f"[HB] node {event['node']} recovered")
+                    continue
+                logger.warning(f"[HB] node {event['node']} is dead (no heartbeat for > {event.get('timeout')}s)")
+                if OFFBOARD_DEAD_NODES:
+                    dead_nodes.put(event['node'])
+        except Exception as e:
+            logger.debug(f'heartbeat event stream {HB_EVENTS_ADDRESS} unavailable: {e}')
+        time.sleep(5)
+
+
 def exit_handler():
     pass
 
 def main():
     atexit.register(exit_handler)
     logger.info('Coordinator Starting')
+    metrics.serve_http()
     SE_NODE.start()
     node_thread = threading.Thread(target=node_handler, args=(HOST, NODE_PORT))
     ap_thread = threading.Thread(target=ap_handler, args=(HOST, AP_PORT ))
@@ -570,12 +645,16 @@ def main():
     node_thread.start()
     ap_thread.start()
     ac_thread.start()
+    if HB_EVENTS_ADDRESS:
+        threading.Thread(target=heartbeat_event_listener, daemon=True).start()
+        threading.Thread(target=dead_node_worker, daemon=True).start()
     
 def run(uuid, no_discovery):
     global SELF_UUID, SE_NODE
     SELF_UUID = uuid
     # atexit.register(exit_handler)
     logger.info('Coordinator Starting')
+    metrics.serve_http()
     SE_NODE = se_net.Node(node_type=SELF_TYPE, node_uuid=SELF_UUID, 
                       node_sebackbone_ip=se_bb_ip, group_id=cfg.group_id)
     if no_discovery:
@@ -603,6 +682,9 @@ def run(uuid, no_discovery):
     node_thread.start()
     ap_thread.start()
     ac_thread.start()
+    if HB_EVENTS_ADDRESS:
+        threading.Thread(target=heartbeat_event_listener, daemon=True).start()
+        threading.Thread(target=dead_node_worker, daemon=True).start()
 
 if __name__ == "__main__":
     main()
@@ -8,14 +8,16 @@ sys.path.append('./lib/bmv2_pylibs')
 import subprocess
 import re
 import os
+import json
+import time
 import lib.global_config as cfg
 import io 
 
 from lib.bmv2_pylibs import *
-from lib.bmv2_pylibs.sswitch_CLI import runtime_CLI, SimpleSwitchAPI
+from lib.bmv2_pylibs.sswitch_CLI import runtime_CLI
 from contextlib import redirect_stdout 
-from thrift.transport.TTransport import TTransportException
 from lib.performance_monitor import measure_performance
+from lib.switch_connections import SWITCHES, CLI_LOCK, load_config
 from lib.logger_utils import get_logger
 import logging
 
@@ -50,45 +52,31 @@ def extract_numbers(lst):
     return [int(x) for sublist in extracted_numbers for x in sublist]
 
 
-def connect_to_switch(address):
-    switch_cli_instance = None
-    try:                
-        # args = runtime_CLI.get_parser().parse_args()
-        pre = runtime_CLI.PreType.SimplePreLAG
-        services = runtime_CLI.RuntimeAPI.get_thrift_services(pre)
-        services.extend(SimpleSwitchAPI.get_thrift_services())
-        
-        standard_client, mc_client, sswitch_client = runtime_CLI.thrift_connect(
-        address, 9090, services)
-        
-        runtime_CLI.load_json_config(standard_client) #   , args.json)
-        
-        cli_instance = SimpleSwitchAPI(pre, standard_client, mc_client, sswitch_client)
-        
-        switch_cli_instance = cli_instance
-        
-        logger_console.debug(f"thrift connected to  {address}")
-        
-    except Exception as e:
-        logger_console.warning(e)
-        
-    return switch_cli_instance
-
-
-output_capture = io.StringIO()
+# connections are pooled per switch: a rediscovered AP gets its existing CLI
+# instance back, the P4 JSON is only downloaded for a config md5 not seen
+# before, and broken transports reconnect on the next call
+def connect_to_switch(address, port=DEFAULT_THRIFT_PORT):
+    return SWITCHES.get(address, port)
+
+
+# CLI commands run one at a time under CLI_LOCK (see lib.switch_connections),
+# each against the P4 model of its own switch.
+# The multicast model below shares the same Thrift clients and lock.
+
 @measure_performance("Coordinator", logger_metric) 
 def run_cli_command(command, instance):
-    logger_console.debug(f'sending command to bmv2: \n{command}')
+    logger_console.debug('sending command to bmv2: \n%s', command)
     command_output = ""
-    with redirect_stdout(output_capture):
+    output_capture = io.StringIO()
+    with CLI_LOCK, redirect_stdout(output_capture):
         try:
+            load_config(instance)
             instance.onecmd(command)
         except:
             logger_console.warning(f'Error running command: {command}')
             return ''
     command_output = output_capture.getvalue()
-    output_capture.truncate(0)
-    logger_console.debug(f"response from switch: {command_output}")
+    logger_console.debug("response from switch: %s", command_output)
     return command_output
 
 
@@ -103,39 +91,112 @@ def send_cli_command_to_bmv2(cli_command, instance, thrift_ip='0.0.0.0', thrift_
         logger_console.error(f'\nBMV2ERROR:\nsending command:\n{cli_command}\nERROR MESSAGE:\n{proc.stderr}')
     response = proc.stdout.strip()
 
-    logger_console.debug(f'Sent command "{cli_command}" to bmv2\nResponse Received:\n{response}')
+    logger_console.debug('Sent command "%s" to bmv2\nResponse Received:\n%s', cli_command, response)
     return response
     
 
+# multicast groups, nodes and their ports as last read from / written to a switch.
+# Loaded with the typed bm_mc_get_entries call and updated with bm_mc_node_update
+# port bitmaps, so changing a node's ports needs no mc_dump text. Another process
+# (the coordinator updates the APs' broadcast nodes too) may change the same
+# switch, so the model is reloaded once it is older than MC_STATE_MAX_AGE seconds
+# or after a failed update.
+MC_STATE_MAX_AGE = float(os.environ.get("SE_MC_STATE_MAX_AGE", "1.0"))
+
+
+def port_map(ports):
+    """Port bitmap string of bm_mc_* calls: character i from the right is 1 if port i is set."""
+    bits = ['0'] * (max(ports) + 1 if ports else 0)
+    for port in ports:
+        bits[port] = '1'
+    return ''.join(reversed(bits))
+
+
+class McState:
+    def __init__(self, instance):
+        self.instance = instance
+        self.groups = {}     # mgrp id -> [node (L1) handles]
+        self.nodes = {}      # node handle -> {'rid': rid, 'ports': set, 'lags': set}
+        self.loaded_at = None
+        self.loads = 0
+        self.updates = 0
+
+    def load(self):
+        entries = json.loads(self.instance.mc_client.bm_mc_get_entries(0))
+        l2_handles = {h['handle']: h for h in entries['l2_handles']}
+        self.nodes = {}
+        for h in entries['l1_handles']:
+            l2 = l2_handles.get(h['l2_handle'], {})
+            self.nodes[h['handle']] = {'rid': h['rid'], 'ports': set(l2.get('ports', [])),
+                                       'lags': set(l2.get('lags', []))}
+        self.groups = {g['id']: list(g['l1_handles']) for g in entries['mgrps']}
+        self.loaded_at = time.monotonic()
+        self.loads += 1
+
+    def _current(self):
+        if self.loaded_at is None or time.monotonic() - self.loaded_at > MC_STATE_MAX_AGE:
+            self.load()
+
+    def node_ports(self, node):
+        """Ports of multicast node `node`, None if the switch has no such node."""
+        with CLI_LOCK:
+            self._current()
+            return set(self.nodes[node]['ports']) if node in self.nodes else None
+
+    def set_node_ports(self, node, ports):
+        """Replace the ports of `node`; no call is made if they are already set."""
+        with CLI_LOCK:
+            self._current()
+            if node not in self.nodes:
+                logger_console.warning(f'Multicast node {node} not found, ports {sorted(ports)} not set')
+                return False
+            ports = set(ports)
+            if ports == self.nodes[node]['ports']:
+                return True
+            try:
+                if self.instance.pre_type == runtime_CLI.PreType.SimplePre:
+                    self.instance.mc_client.bm_mc_node_update(0, node, port_map(ports))
+                else:
+                    self.instance.mc_client.bm_mc_node_update(0, node, port_map(ports), port_map(self.nodes[node]['lags']))
+            except Exception:
+                self.loaded_at = None
+                raise
+            self.nodes[node]['ports'] = ports
+            self.updates += 1
+            return True
+
+    def update_node_ports(self, node, add=(), remove=()):
+        with CLI_LOCK:
+            ports = self.node_ports(node)
+            if ports is None:
+                logger_console.warning(f'Multicast node {node} not found')
+                return False
+            return self.set_node_ports(node, (ports | set(add)) - set(remove))
+
+    def stats(self):
+        return {'groups': dict(self.groups),
+                'nodes': {node: sorted(data['ports']) for node, data in self.nodes.items()},
+                'loads': self.loads, 'updates': self.updates}
+
+
+MC_STATES = {}
+
+def mc_state(instance) -> McState:
+    """The multicast model of the switch behind a CLI instance."""
+    with CLI_LOCK:
+        if id(instance) not in MC_STATES:
+            MC_STATES[id(instance)] = McState(instance)
+        return MC_STATES[id(instance)]
+
+
 # this updates the list of broadcast ports in bmv2
 @measure_performance("Coordinator", logger_metric) 
-def add_bmv2_swarm_broadcast_port(switch_port, instance, thrift_ip='0.0.0.0', thrift_port=DEFAULT_THRIFT_PORT):
-        res = send_cli_command_to_bmv2(cli_command='mc_dump', instance=instance, thrift_ip=thrift_ip, thrift_port=thrift_port)
-        res_lines = res.splitlines()
-        i = 0        
-        for line in res_lines:
-            if 'mgrp(' in line:
-                port_list = set(extract_numbers([ res_lines[i+1].split('ports=[')[1].split(']')[0] ]))
-                port_list.add(switch_port)
-                broadcast_ports =  ' '.join( str(port) for port in port_list)
-                send_cli_command_to_bmv2(cli_command=f"mc_node_update 0 {broadcast_ports} ", thrift_ip=thrift_ip, thrift_port=thrift_port, instance=instance )  
-            i = i + 1
+def add_bmv2_swarm_broadcast_port(switch_port, instance, mc_node=0, thrift_ip='0.0.0.0', thrift_port=DEFAULT_THRIFT_PORT):
+    return mc_state(instance).update_node_ports(mc_node, add=[switch_port])
 
 @measure_performance("Coordinator", logger_metric) 
-def remove_bmv2_swarm_broadcast_port(switch_port, instance, thrift_ip='0.0.0.0', thrift_port=DEFAULT_THRIFT_PORT):
-        res = send_cli_command_to_bmv2(cli_command='mc_dump', thrift_ip=thrift_ip, thrift_port=thrift_port, instance=instance)
-        res_lines = res.splitlines()
-        i = 0
-        for line in res_lines:
-            if 'mgrp(' in line:
-                port_list = set(extract_numbers([ res_lines[i+1].split('ports=[')[1].split(']')[0] ]))
-                if (switch_port in port_list):
-                    port_list.remove(switch_port)
-                    broadcast_ports =  ' '.join( str(port) for port in port_list)
-                    send_cli_command_to_bmv2(cli_command=f"mc_node_update 0 {broadcast_ports} ", thrift_ip=thrift_ip, thrift_port=thrift_port, instance=instance )  
-            else:
-                logger_console.debug(f'Port {switch_port} is not in swarm boradcast ports')
-            i = i + 1
+def remove_bmv2_swarm_broadcast_port(switch_port, instance, mc_node=0, thrift_ip='0.0.0.0', thrift_port=DEFAULT_THRIFT_PORT):
+    return mc_state(instance).update_node_ports(mc_node, remove=[switch_port])
 
 @measure_performance("Coordinator", logger_metric) 
 def add_entry_to_bmv2(communication_protocol, instance, table_name, action_name, match_keys, action_params, thrift_ip = '0.0.0.0', thrift_port = DEFAULT_THRIFT_PORT):
@@ -157,13 +218,13 @@ def add_entry_to_bmv2(communication_protocol, instance, table_name, action_name,
                     return SWITCH_RESPONSE_INVALID
                 elif line.startswith("Entry has been added with handle"):
                     handle =  re.findall(r'\b\d+\b', line, re.I)[0]
-                    logger_console.debug(f"Added entry with handle {handle} detected from line: {line} ")
+                    logger_console.debug("Added entry with handle %s detected from line: %s ", handle, line)
                     return handle
         else:
             for line in response.splitlines():
                 if 'Dumping entry' in line:
                     entry_handle = int( re.findall(r'0x[0-9A-F]+', line, re.I)[0] , 16  )
-                    logger_console.debug(f'entry_handle exists: {entry_handle}')
+                    logger_console.debug('entry_handle exists: %s', entry_handle)
                     cli_command = f'table_modify {table_name} {action_name} {entry_handle} {action_params}'
                     send_cli_command_to_bmv2(cli_command=cli_command,  thrift_ip=thrift_ip, thrift_port=thrift_port, instance=instance)
                     break
@@ -174,13 +235,13 @@ def add_entry_to_bmv2(communication_protocol, instance, table_name, action_name,
 def get_entry_handle(table_name, instance, key, thrift_ip = '0.0.0.0', thrift_port = DEFAULT_THRIFT_PORT):
     command = f'table_dump_entry_from_key {table_name} {key}'
     response = send_cli_command_to_bmv2(cli_command=command, thrift_ip=thrift_ip, thrift_port=thrift_port, instance=instance)
-    logger_console.debug(f'Getting entry handle from bmv2 for: {key}\n {response}')
+    logger_console.debug('Getting entry handle from bmv2 for: %s\n %s', key, response)
     for line in response.splitlines():
         if 'Dumping entry' in line:
             handle = int( re.findall(r'0x[0-9A-F]+', line, re.I)[0] , 16 )
-            logger_console.debug(f'Found handle for key: {key} is: {handle}')
+            logger_console.debug('Found handle for key: %s is: %s', key, handle)
             return handle
-    logger_console.debug(f'Could not find entry handle for key: {key}')
+    logger_console.debug('Could not find entry handle for key: %s', key)
     return None
 
 @measure_performance("Coordinator", logger_metric) 
@@ -192,4 +253,4 @@ def delete_forwarding_entry_from_bmv2(
             cli_command = f'table_delete {table_name} {handle}'
             send_cli_command_to_bmv2(cli_command=cli_command, thrift_ip=thrift_ip, thrift_port=thrift_port, instance=instance)
             return
-        logger_console.debug(f'Entry Handle is None for table: {table_name}, and key: {key}')
+        logger_console.debug('Entry Handle is None for table: %s, and key: %s', table_name, key)
@@ -205,6 +205,16 @@ def get_node_info_from_art(node_uuid):
         return execute_query(query)
 
 
+@measure_performance("Coordinator", db_logger_metric)
+def get_all_nodes_from_art():
+    if DATABASE_IN_USE == STR_DATABASE_TYPE_CASSANDRA:
+        query = f"""
+        SELECT * FROM 
+            {db_defines.NAMEOF_DATABASE_SWARM_KEYSPACE}.{db_defines.NAMEOF_DATABASE_ADDRESS_RESOLUTION_TABLE} ;
+        """
+        return execute_query(query)
+
+
 @measure_performance("Coordinator", db_logger_metric)
 def insert_into_art(node_uuid, current_ap, swarm_id, ap_port, node_ip):
     if DATABASE_IN_USE == STR_DATABASE_TYPE_CASSANDRA:
@@ -0,0 +1,289 @@
+"""
+Desired-state reconciler for one bmv2 switch.
+
+The imperative paths (AP start, station join/leave, coordinator onboarding)
+stay as they are; this controller catches what they miss, e.g. a switch that
+restarted or an update that was lost. A caller-supplied function derives the
+desired table entries, switch ports and broadcast node ports (the AP derives
+them from the ART); the reconciler reads what the switch actually has over
+Thrift (bm_mt_get_entries, bm_dev_mgr_show_ports, the multicast model), and
+applies only the difference: table fixes as one pass under the CLI lock,
+port and broadcast fixes through the AP's batched SwitchState.
+
+It runs SE_AP_RECONCILE_DELAY seconds after trigger() (events are collapsed)
+and every SE_AP_RECONCILE_INTERVAL seconds. A pass is postponed while
+busy() is true so that half-handled stations are not "fixed": busy() is
+checked before the pass and again after the switch was read, and the state
+compared against is derived after those reads, so a station that finished
+meanwhile is part of it and whatever a station adds later is not touched.
+Fix counts are logged, served on GET /metrics/stats and recorded as
+reconcile.run.
+"""
+import os
+import time
+import logging
+import ipaddress
+import threading
+from typing import NamedTuple, Callable
+
+import lib.bmv2_thrift_lib as bmv2
+import lib.metrics as metrics
+
+RECONCILE_INTERVAL = float(os.environ.get("SE_AP_RECONCILE_INTERVAL", "30"))   # seconds between periodic passes
+RECONCILE_DELAY    = float(os.environ.get("SE_AP_RECONCILE_DELAY", "1.0"))     # seconds from an event to its pass
+
+MATCH_EXACT   = 0
+MATCH_LPM     = 1
+MATCH_TERNARY = 2
+
+logger = logging.getLogger(__name__)
+
+
+class TableEntry(NamedTuple):
+    table: str
+    match: tuple               # match key as read back from the switch, see switch_match()
+    key: str                   # the same key in CLI syntax
+    action: str                # fully qualified, as the switch reports it
+    params: tuple              # action parameters as integers
+    args: str                  # the same parameters in CLI syntax
+    priority: int | None = None
+
+
+class DesiredState(NamedTuple):
+    entries: list                          # [TableEntry]
+    owned: dict                            # table -> predicate(match): entries the reconciler may delete
+    keep: set                              # {(table, match)} not desired but left alone (state unknown)
+    ports: dict                            # switch port -> interface name
+    port_prefix: str                       # only ports on interfaces with this prefix are detached
+    broadcast_node: int | None = None
+    broadcast_ports: set | None = None
+
+
+def _param(value):
+    # MAC addresses stay text for the CLI and become integers for comparison
+    if isinstance(value, str) and ':' in value:
+        return int(value.replace(':', ''), 16), value
+    return int(value), str(value)
+
+
+def _entry(table, match, key, action, params, priority=None) -> TableEntry:
+    converted = [_param(p) for p in params]
+    return TableEntry(table, match, key, action, tuple(c[0] for c in converted),
+                      ' '.join(c[1] for c in converted), priority)
+
+
+def lpm_entry(table, ip, prefix_len, action, params) -> TableEntry:
+    return _entry(table, ((int(ipaddress.ip_address(ip)), prefix_len),), f"{ip}/{prefix_len}", action, params)
+
+
+def ternary_entry(table, mac, mask, action, params, priority) -> TableEntry:
+    value = int(mac.replace(':', ''), 16)
+    return _entry(table, ((value & mask, mask),), f"{mac}&&&{mask:#x}", action, params, priority)
+
+
+def switch_match(match_key) -> tuple:
+    """Canonical form of the BmMatchParam list of a switch entry."""
+    match = []
+    for param in match_key:
+        if param.type == MATCH_LPM:
+            match.append((int.from_bytes(param.lpm.key, 'big'), param.lpm.prefix_length))
+        elif param.type == MATCH_TERNARY:
+            match.append((int.from_bytes(param.ternary.key, 'big'), int.from_bytes(param.ternary.mask, 'big')))
+        elif param.type == MATCH_EXACT:
+            match.append((int.from_bytes(param.exact.key, 'big'),))
+        else:
+            match.append((param.type,))
+    return tuple(match)
+
+
+class ForwardingReconciler:
+    def __init__(self, instance, desired: Callable[[], DesiredState], switch_state, busy: Callable[[], bool] | None = None,
+                 interval: float = RECONCILE_INTERVAL, delay: float = RECONCILE_DELAY,
+                 component: str = "Access Point", metric_logger=None):
+        self.instance = instance
+        self.desired = desired
+        self.switch_state = switch_state
+        self.busy = busy
+        self.interval = interval
+        self.delay = delay
+        self.component = component
+        self.metric_logger = metric_logger
+        self._cond = threading.Condition()
+        self._due = None
+        self._reason = None
+        self.runs = 0
+        self.postponed = 0
+        self.failed = 0
+        self.fixes = {"added": 0, "modified": 0, "deleted": 0, "ports": 0, "broadcast": 0}
+        self.last = {}
+        self._thread = None
+
+    # ---------------- lifecycle ----------------
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="reconciler", daemon=True)
+        self._thread.start()
+        metrics.register_stats("reconciler", self.stats)
+        return self
+
+    def trigger(self, reason: str = "event"):
+        """Schedule a pass `delay` seconds from now; triggers before it runs share it."""
+        with self._cond:
+            due = time.monotonic() + self.delay
+            if self._due is None or due < self._due:
+                self._due = due
+                self._reason = reason
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._due is None:
+                    self._due = time.monotonic() + self.interval
+                    self._reason = "periodic"
+                while time.monotonic() < self._due:
+                    self._cond.wait(self._due - time.monotonic())
+                reason = self._reason
+                self._due = None
+            if self._busy(reason):
+                continue
+            try:
+                self.reconcile(reason)
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Reconciling the switch failed: {e!r}")
+
+    def _busy(self, reason):
+        if self.busy is not None and self.busy():
+            self.postponed += 1
+            self.trigger(reason)
+            return True
+        return False
+
+    # ---------------- one pass ----------------
+    def reconcile(self, reason: str = "manual") -> dict | None:
+        """
+        Bring the switch to the desired state; returns the number of fixes by
+        kind, None if the pass was postponed because stations are being handled.
+        """
+        started = time.perf_counter_ns()
+        # let changes the station handlers already queued land before reading the switch
+        self.switch_state.wait_applied()
+        before = self.desired()
+        actual_tables = {table: self._read_table(table) for table in self._tables(before)}
+        actual_ports = self._read_ports()
+        actual_broadcast = self._read_broadcast(before.broadcast_node)
+        # compare with the state as it is after the reads, and leave stations being handled alone
+        desired = self.desired()
+        if self._busy(reason):
+            return None
+        fixes = {"added": 0, "modified": 0, "deleted": 0, "ports": 0, "broadcast": 0}
+        self._reconcile_tables(desired, actual_tables, fixes)
+        self._reconcile_ports(desired, actual_ports, fixes)
+        self._reconcile_broadcast(desired, actual_broadcast, fixes)
+        self.switch_state.wait_applied()
+
+        total = sum(fixes.values())
+        self.runs += 1
+        for kind, count in fixes.items():
+            self.fixes[kind] += count
+        duration = time.perf_counter_ns() - started
+        self.last = {"reason": reason, "fixes": dict(fixes), "ms": round(duration / 1e6, 3), "at": time.time()}
+        if total:
+            logger.info(f"Reconciled switch ({reason}): {total} fix(es) {fixes}")
+        exporter = metrics.exporter_for_logger(self.metric_logger) if self.metric_logger else metrics.get_exporter()
+        exporter.record(self.component, "reconcile.run", duration, f"reason={reason},fixes={total}".encode())
+        return fixes
+
+    @staticmethod
+    def _tables(desired):
+        return {entry.table for entry in desired.entries} | set(desired.owned)
+
+    def _read_table(self, table):
+        with bmv2.CLI_LOCK:
+            entries = self.instance.client.bm_mt_get_entries(0, table)
+        actual = {}
+        for e in entries:
+            action = e.action_entry
+            actual[switch_match(e.match_key)] = (e.entry_handle, action.action_name,
+                                                 tuple(int.from_bytes(d, 'big') for d in (action.action_data or [])),
+                                                 e.options.priority if e.options else None)
+        return actual
+
+    def _command(self, command):
+        response = bmv2.send_cli_command_to_bmv2(cli_command=command, instance=self.instance)
+        if 'Error' in response or 'Invalid' in response:
+            logger.warning(f"Reconcile command failed: {command}\n{response}")
+            return False
+        return True
+
+    def _reconcile_tables(self, desired, actual_tables, fixes):
+        by_table = {}
+        for entry in desired.entries:
+            by_table.setdefault(entry.table, {})[entry.match] = entry
+        for table in self._tables(desired):
+            wanted = by_table.get(table, {})
+            actual = actual_tables.get(table)
+            owned = desired.owned.get(table)
+            if actual is None:
+                # not read before busy() was checked: only add what is missing
+                actual, owned = self._read_table(table), None
+            with bmv2.CLI_LOCK:
+                for match, entry in wanted.items():
+                    current = actual.get(match)
+                    add = f"table_add {table} {entry.action} {entry.key} => {entry.args}" + \
+                          (f" {entry.priority}" if entry.priority is not None else "")
+                    if current is None:
+                        fixes["added"] += self._command(add)
+                        continue
+                    handle, action, params, priority = current
+                    if entry.priority is not None and priority != entry.priority:
+                        # the priority of an entry cannot be modified
+                        if self._command(f"table_delete {table} {handle}") and self._command(add):
+                            fixes["modified"] += 1
+                    elif action != entry.action or params != entry.params:
+                        fixes["modified"] += self._command(f"table_modify {table} {entry.action} {handle} {entry.args}")
+                if owned is None:
+                    continue
+                for match, (handle, _action, _params, _priority) in actual.items():
+                    if match not in wanted and (table, match) not in desired.keep and owned(match):
+                        fixes["deleted"] += self._command(f"table_delete {table} {handle}")
+
+    def _read_ports(self):
+        with bmv2.CLI_LOCK:
+            return {p.port_num: p.iface_name for p in self.instance.client.bm_dev_mgr_show_ports()}
+
+    def _reconcile_ports(self, desired, actual, fixes):
+        for port, ifname in desired.ports.items():
+            if actual.get(port) != ifname:
+                self.switch_state.attach_port(port, ifname)
+                fixes["ports"] += 1
+        for port, ifname in actual.items():
+            if port not in desired.ports and ifname.startswith(desired.port_prefix):
+                self.switch_state.detach_port(port)
+                fixes["ports"] += 1
+
+    def _read_broadcast(self, node):
+        if node is None:
+            return None
+        mc = bmv2.mc_state(self.instance)
+        with bmv2.CLI_LOCK:
+            mc.load()
+            return mc.node_ports(node)
+
+    def _reconcile_broadcast(self, desired, actual, fixes):
+        if desired.broadcast_ports is None:
+            return
+        if actual is None:
+            logger.warning(f"Multicast node {desired.broadcast_node} not found, broadcast ports not reconciled")
+            return
+        for port in desired.broadcast_ports - actual:
+            self.switch_state.add_broadcast_port(port)
+            fixes["broadcast"] += 1
+        for port in actual - desired.broadcast_ports:
+            self.switch_state.remove_broadcast_port(port)
+            fixes["broadcast"] += 1
+
+    # ---------------- stats ----------------
+    def stats(self) -> dict:
+        return {"runs": self.runs, "postponed": self.postponed, "failed": self.failed,
+                "fixes": dict(self.fixes), "last": dict(self.last)}
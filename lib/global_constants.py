@@ -22,6 +22,7 @@ class String_Constants(str, Enum):
     SET_CONFIG = auto()
     UPDAET_CONFIG = auto()
     LEAVE_REQUEST = auto()
+    TRACE_ID = auto()
     
 
 STRs = String_Constants
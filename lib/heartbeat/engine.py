@@ -0,0 +1,262 @@
+"""
+Heartbeat state machine shared by the coordinator and GUI receivers.
+
+The engine owns the node cache and writes through to a StateStore. Each node
+entry also keeps the last accepted chain element ("anchor"), so a heartbeat is
+checked with one or two hashes instead of re-walking the chain up to the key.
+"""
+import time
+import logging
+import threading
+
+from lib.heartbeat.store import StateStore
+from lib.heartbeat.events import EventBus, EV_REGISTERED, EV_ALIVE, EV_HEARTBEAT, EV_DEAD, EV_RECOVERED, EV_ROLLOVER
+from lib.heartbeat.verifier import parse_datagram, verify_chain
+
+STATUS_REGISTERED = "registered"
+STATUS_ALIVE      = "alive"
+STATUS_DEAD       = "dead"
+
+
+def now_ts() -> float:
+    return time.time()
+
+
+class HeartbeatEngine:
+    def __init__(self, store: StateStore, timeout: float, events: EventBus | None = None):
+        self.store = store
+        self.timeout = timeout
+        self.events = events or EventBus()
+        self.lock = threading.RLock()
+        # Cache: node_uuid -> {"public_key": bytes, "last_i": int, "status": str, "last_ts": float,
+        #                      "anchor": bytes, "anchor_i": int,
+        #                      "prev_public_key": bytes, "prev_anchor": bytes, "prev_last_i": int}
+        # anchor_* is in-memory only; prev_* exists only after a rollover.
+        self.state: dict[str, dict] = {}
+
+    # ---------------- Cache / Store ----------------
+    def preload_cache(self) -> int:
+        # Preload cached PKs and HB state
+        rows = self.store.load_all()
+        with self.lock:
+            for node_uuid, row in rows.items():
+                s = self.state.setdefault(node_uuid, {})
+                if "public_key" in row:
+                    s["public_key"] = row["public_key"]
+                s["last_i"]  = int(row.get("last_i", 0))
+                s["last_ts"] = float(row.get("last_ts", 0.0))
+                s["status"]  = row.get("status", STATUS_REGISTERED)
+        logging.info(f"Preloaded {len(rows)} clients from {self.store.name} store")
+        return len(rows)
+
+    def _cache_pubkey(self, node_uuid: str, public_key: bytes) -> dict:
+        s = self.state.setdefault(node_uuid, {})
+        if s.get("public_key") != public_key:
+            s.pop("anchor", None)
+            s.pop("anchor_i", None)
+        s["public_key"] = public_key
+        s.pop("prev_public_key", None)
+        s.pop("prev_anchor", None)
+        s.setdefault("last_i", 0)
+        s.setdefault("status", STATUS_REGISTERED)
+        s.setdefault("last_ts", 0.0)
+        return s
+
+    def save_pubkey(self, node_uuid: str, public_key: bytes):
+        self.store.save_pubkey(node_uuid, public_key)
+        with self.lock:
+            self._cache_pubkey(node_uuid, public_key)
+        self.events.publish(EV_REGISTERED, node_uuid)
+
+    def save_hb_state(self, node_uuid: str, last_i: int, status: str):
+        ts = now_ts()
+        self.store.save_hb_state(node_uuid, last_i, ts, status)
+        with self.lock:
+            s = self.state.setdefault(node_uuid, {})
+            s["last_i"] = last_i
+            s["status"] = status
+            s["last_ts"] = ts
+
+    def get_pubkey(self, node_uuid: str) -> bytes | None:
+        with self.lock:
+            pk = self.state.get(node_uuid, {}).get("public_key")
+        if pk:
+            return pk
+        pk = self.store.get_pubkey(node_uuid)
+        if pk:
+            with self.lock:
+                self._cache_pubkey(node_uuid, pk)
+        return pk
+
+    def get_hb_state(self, node_uuid: str) -> tuple[int, float, str]:
+        with self.lock:
+            s = self.state.get(node_uuid)
+            if s and "last_i" in s:
+                return int(s.get("last_i", 0)), float(s.get("last_ts", 0.0)), s.get("status", STATUS_REGISTERED)
+        row = self.store.get_hb_state(node_uuid)
+        if row:
+            last_i, last_ts, status = row
+            with self.lock:
+                s = self.state.setdefault(node_uuid, {})
+                s.update(last_i=last_i, last_ts=last_ts, status=status)
+            return last_i, last_ts, status
+        return 0, 0.0, STATUS_REGISTERED
+
+    def import_pubkeys(self, entries) -> int:
+        """
+        Bulk path for registering many public keys at once, e.g. right after a batched
+        join. `entries` is a dict or iterable of (node_uuid, public_key) pairs.
+        Key writes go to the store as one bulk call instead of one round trip per
+        node; nodes currently marked dead, and nodes registering a different key
+        (a new chain, counted from 1 again), are reset to registered.
+        The heartbeat state comes from the preloaded cache, so no per-node read is done.
+        """
+        entries = list(entries.items()) if isinstance(entries, dict) else list(entries)
+        if not entries:
+            return 0
+        with self.lock:
+            resets = [u for u, pk in entries
+                      if self.state.get(u, {}).get("status") == STATUS_DEAD
+                      or self.state.get(u, {}).get("public_key") not in (None, pk)]
+        ts = now_ts()
+
+        self.store.save_pubkeys(entries)
+        if resets:
+            self.store.save_hb_states([(u, 0, ts, STATUS_REGISTERED) for u in resets])
+        with self.lock:
+            for node_uuid, public_key in entries:
+                self._cache_pubkey(node_uuid, public_key)
+            for node_uuid in resets:
+                # If a node re-registers or starts a new chain, reset to registered
+                s = self.state[node_uuid]
+                s["last_i"] = 0
+                s["status"] = STATUS_REGISTERED
+                s["last_ts"] = ts
+                s.pop("anchor", None)
+                s.pop("anchor_i", None)
+        for node_uuid, _ in entries:
+            self.events.publish(EV_REGISTERED, node_uuid)
+        return len(entries)
+
+    def rollover_pubkey(self, node_uuid: str, last_i: int, next_public_key: bytes) -> bool:
+        """
+        Atomically switch a node to the next chain announced inside a verified heartbeat.
+        The spent chain is kept as a grace anchor so heartbeats still in flight on it
+        keep the node alive until the client moves over.
+        """
+        ts = now_ts()
+        with self.lock:
+            s = self.state.setdefault(node_uuid, {})
+            if s.get("public_key") == next_public_key:
+                return False  # repeated announcement
+            self.store.save_pubkey(node_uuid, next_public_key)
+            self.store.save_hb_state(node_uuid, 0, ts, STATUS_ALIVE)
+            s["prev_public_key"] = s.get("public_key")
+            s["prev_anchor"] = s.get("anchor") if s.get("anchor_i") == last_i else None
+            s["prev_last_i"] = last_i
+            s["public_key"] = next_public_key
+            s["anchor"] = next_public_key
+            s["anchor_i"] = 0
+            s["last_i"] = 0
+            s["status"] = STATUS_ALIVE
+            s["last_ts"] = ts
+        self.events.publish(EV_ROLLOVER, node_uuid, last_i=last_i)
+        return True
+
+    def _accept_on_previous_chain(self, node_uuid: str, w_i: bytes, i: int) -> bool:
+        """Verify a heartbeat against the grace anchor left by a rollover."""
+        with self.lock:
+            s = self.state.get(node_uuid, {})
+            prev_pk = s.get("prev_public_key")
+            prev_anchor = s.get("prev_anchor")
+            prev_last_i = int(s.get("prev_last_i", 0))
+            last_i = int(s.get("last_i", 0))
+        if not prev_pk or not (prev_last_i < i <= prev_last_i + 2):
+            return False
+        if prev_anchor:
+            ok = verify_chain(w_i, i, prev_anchor, prev_last_i)
+        else:
+            ok = verify_chain(w_i, i, prev_pk, 0)
+        if not ok:
+            return False
+        with self.lock:
+            s["prev_last_i"] = i
+            s["prev_anchor"] = w_i
+            status = s.get("status")
+        self.save_hb_state(node_uuid, last_i, status=STATUS_ALIVE)
+        self._publish_heartbeat(node_uuid, i, status)
+        return True
+
+    # ---------------- Heartbeats ----------------
+    def handle_datagram(self, data: bytes, peer: str) -> bool:
+        """Verify one heartbeat datagram and update the node; returns True if accepted."""
+        try:
+            hb = parse_datagram(data)
+            client_id, i, w_i = hb.client_id, hb.i, hb.w_i
+
+            pk = self.get_pubkey(client_id)
+            if not pk:
+                raise ValueError("unknown client (no public key)")
+
+            last_i, _, status = self.get_hb_state(client_id)
+            with self.lock:
+                s = self.state.get(client_id, {})
+                anchor, anchor_i = s.get("anchor"), s.get("anchor_i")
+            if anchor is None or anchor_i != last_i:
+                # no verified element cached (fresh start or reload): walk up to the key
+                anchor, anchor_i = pk, 0
+
+            # Accept strictly next or one-skip only
+            if not (i == last_i + 1 or i == last_i + 2) or not verify_chain(w_i, i, anchor, anchor_i):
+                # Heartbeats still in flight on a chain that was just rolled over
+                if self._accept_on_previous_chain(client_id, w_i, i):
+                    logging.info(f"[HB] OK client={client_id} i={i} ts={hb.ts} from {peer} (previous chain)")
+                    return True
+                if i <= last_i:
+                    raise ValueError(f"out-of-order i={i} (last_i={last_i})")
+                if i > last_i + 2:
+                    raise ValueError(f"too far ahead i={i} (last_i={last_i})")
+                raise ValueError("Winternitz verification failed")
+
+            # Update DB/cache
+            self.save_hb_state(client_id, i, status=STATUS_ALIVE)
+            with self.lock:
+                s = self.state[client_id]
+                if s.get("public_key") == pk:
+                    s["anchor"], s["anchor_i"] = w_i, i
+            logging.info(f"[HB] OK client={client_id} i={i} ts={hb.ts} from {peer}")
+            self._publish_heartbeat(client_id, i, status, peer)
+
+            # The authenticator binds the announced key to this chain element
+            if hb.next_public_key and self.rollover_pubkey(client_id, i, hb.next_public_key):
+                logging.info(f"[HB] ROLLOVER client={client_id} at i={i}, next key {hb.next_public_key.hex()[:16]}...")
+            return True
+
+        except Exception as e:
+            logging.warning(f"[HB] DROP from {peer}: {e}")
+            return False
+
+    def _publish_heartbeat(self, node_uuid: str, i: int, prev_status: str, peer: str = ""):
+        if prev_status == STATUS_DEAD:
+            self.events.publish(EV_RECOVERED, node_uuid, i=i)
+        elif prev_status != STATUS_ALIVE:
+            self.events.publish(EV_ALIVE, node_uuid, i=i)
+        self.events.publish(EV_HEARTBEAT, node_uuid, i=i, peer=peer)
+
+    # ---------------- Liveness ----------------
+    def check_timeouts(self, now: float | None = None) -> list[str]:
+        """Mark nodes silent for longer than the timeout as dead; returns the newly dead."""
+        deadline = (now or now_ts()) - self.timeout
+        with self.lock:
+            expired = [(u, s.get("last_i", 0)) for u, s in self.state.items()
+                       if s.get("status") != STATUS_DEAD and 0.0 < s.get("last_ts", 0.0) < deadline]
+        # store writes happen outside the scan so the receiver is not stalled by a long sweep
+        dead = []
+        for node_uuid, last_i in expired:
+            with self.lock:
+                if self.state[node_uuid].get("last_ts", 0.0) >= deadline:
+                    continue  # a heartbeat arrived meanwhile
+            self.save_hb_state(node_uuid, last_i, status=STATUS_DEAD)
+            self.events.publish(EV_DEAD, node_uuid, last_i=last_i, timeout=self.timeout)
+            dead.append(node_uuid)
+        return dead
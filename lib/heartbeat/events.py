@@ -0,0 +1,239 @@
+"""
+In-process publish/subscribe for heartbeat liveness events.
+
+Every subscriber owns a bounded queue: publishing never blocks, and when a slow
+subscriber falls behind its oldest events are dropped and counted. Sinks (UDP,
+TCP push, TCP event server) run on their own threads fed from a subscription,
+so a stalled network peer cannot hold up heartbeat ingestion.
+
+Event: {"seq": int, "type": str, "node": str, "ts": float, ...extra fields}
+"""
+import json
+import time
+import asyncio
+import socket
+import logging
+import itertools
+import threading
+from collections import deque
+
+# Liveness transitions: registered -> alive -> dead -> recovered (-> dead ...)
+EV_REGISTERED = "registered"
+EV_ALIVE      = "alive"       # first accepted heartbeat after registration
+EV_HEARTBEAT  = "heartbeat"   # every accepted heartbeat
+EV_DEAD       = "dead"
+EV_RECOVERED  = "recovered"   # accepted heartbeat from a node marked dead
+EV_ROLLOVER   = "rollover"    # node switched to its next hash chain
+EVENT_TYPES   = (EV_REGISTERED, EV_ALIVE, EV_HEARTBEAT, EV_DEAD, EV_RECOVERED, EV_ROLLOVER)
+TRANSITIONS   = (EV_REGISTERED, EV_ALIVE, EV_DEAD, EV_RECOVERED, EV_ROLLOVER)
+
+DEFAULT_QUEUE_SIZE = 1024
+
+
+class Subscription:
+    def __init__(self, bus: "EventBus", name: str, types=None, maxlen: int = DEFAULT_QUEUE_SIZE):
+        self.bus = bus
+        self.name = name
+        self.types = frozenset(types) if types else None
+        self.queue = deque(maxlen=maxlen)
+        self.cond = threading.Condition()
+        self.dropped = 0
+
+    def offer(self, event: dict):
+        if self.types is not None and event["type"] not in self.types:
+            return
+        with self.cond:
+            if len(self.queue) == self.queue.maxlen:
+                self.dropped += 1   # deque drops the oldest entry
+            self.queue.append(event)
+            self.cond.notify()
+
+    def get_batch(self, max_items: int = 256, timeout: float | None = None) -> list[dict]:
+        """Wait up to `timeout` for events and return everything queued (at most max_items)."""
+        with self.cond:
+            if not self.queue:
+                self.cond.wait(timeout)
+            batch = []
+            while self.queue and len(batch) < max_items:
+                batch.append(self.queue.popleft())
+        return batch
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class EventBus:
+    def __init__(self):
+        self._subs: tuple[Subscription, ...] = ()
+        self._lock = threading.Lock()
+        self._seq = itertools.count(1)
+
+    def subscribe(self, name: str, types=None, maxlen: int = DEFAULT_QUEUE_SIZE) -> Subscription:
+        sub = Subscription(self, name, types, maxlen)
+        with self._lock:
+            self._subs = self._subs + (sub,)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            self._subs = tuple(s for s in self._subs if s is not sub)
+
+    def publish(self, event_type: str, node: str, **data):
+        subs = self._subs   # copy-on-write tuple, no lock on the hot path
+        if not subs:
+            return
+        event = {"seq": next(self._seq), "type": event_type, "node": node, "ts": time.time(), **data}
+        for sub in subs:
+            sub.offer(event)
+
+    def add_sink(self, name: str, deliver, types=None, maxlen: int = DEFAULT_QUEUE_SIZE) -> Subscription:
+        """Run `deliver(batch)` on a daemon thread for every batch of matching events."""
+        sub = self.subscribe(name, types, maxlen)
+
+        def _pump():
+            while True:
+                batch = sub.get_batch(timeout=1.0)
+                if not batch:
+                    continue
+                try:
+                    deliver(batch)
+                except Exception as e:
+                    logging.warning(f"[EVENT] sink {name} failed: {e}")
+
+        threading.Thread(target=_pump, name=f"event-sink-{name}", daemon=True).start()
+        return sub
+
+    def stats(self) -> dict:
+        return {s.name: {"queued": len(s.queue), "dropped": s.dropped} for s in self._subs}
+
+
+def encode_event(event: dict) -> bytes:
+    return json.dumps(event, separators=(",", ":")).encode() + b"\n"
+
+
+# ---------------- Sinks ----------------
+class UdpSink:
+    """
+    UDP datagram per event. legacy=True keeps the old "NODE_DEAD|<uuid>" text
+    format for dead events; otherwise each datagram is one JSON event.
+    """
+    def __init__(self, ip: str, port: int, legacy: bool = False):
+        self.addr = (ip, port)
+        self.legacy = legacy
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def __call__(self, batch: list[dict]):
+        for event in batch:
+            if self.legacy:
+                if event["type"] != EV_DEAD:
+                    continue
+                msg = f"NODE_DEAD|{event['node']}".encode()
+            else:
+                msg = encode_event(event)
+            self.sock.sendto(msg, self.addr)
+            if self.legacy:
+                logging.info(f"[NOTIFY] Dead event sent for {event['node']} to {self.addr[0]}:{self.addr[1]}")
+
+
+class TcpSink:
+    """Pushes JSON lines to a remote collector, reconnecting on failure."""
+    def __init__(self, host: str, port: int, timeout: float = 2.0):
+        self.addr = (host, port)
+        self.timeout = timeout
+        self.sock = None
+
+    def __call__(self, batch: list[dict]):
+        data = b"".join(encode_event(e) for e in batch)
+        for _ in range(2):
+            if self.sock is None:
+                self.sock = socket.create_connection(self.addr, timeout=self.timeout)
+            try:
+                self.sock.sendall(data)
+                return
+            except OSError:
+                self.sock.close()
+                self.sock = None
+        raise ConnectionError(f"cannot deliver to {self.addr[0]}:{self.addr[1]}")
+
+
+class EventServer:
+    """
+    TCP event stream. A client may send one filter line right after connecting,
+    e.g. "dead,recovered" (an empty line or nothing within 0.5 s means all types),
+    and then receives JSON lines until it disconnects.
+    """
+    def __init__(self, bus: EventBus, bind_ip: str, port: int, maxlen: int = DEFAULT_QUEUE_SIZE):
+        self.bus = bus
+        self.bind_ip = bind_ip
+        self.port = port
+        self.maxlen = maxlen
+
+    def _client(self, conn: socket.socket, addr):
+        peer = f"{addr[0]}:{addr[1]}"
+        types = None
+        conn.settimeout(0.5)
+        try:
+            line = conn.recv(1024).split(b"\n", 1)[0].decode().strip()
+            types = [t.strip() for t in line.split(",") if t.strip()] or None
+        except (socket.timeout, UnicodeDecodeError):
+            pass
+        except OSError:
+            conn.close()
+            return
+        sub = self.bus.subscribe(f"tcp:{peer}", types, self.maxlen)
+        logging.info(f"[EVENT] subscriber {peer} connected (types={types or 'all'})")
+        conn.settimeout(None)
+        try:
+            while True:
+                batch = sub.get_batch(timeout=5.0)
+                # an empty write doubles as a liveness check of idle subscribers
+                conn.sendall(b"".join(encode_event(e) for e in batch) if batch else b"\n")
+        except OSError:
+            pass
+        finally:
+            sub.close()
+            conn.close()
+            logging.info(f"[EVENT] subscriber {peer} disconnected (dropped={sub.dropped})")
+
+    def serve_forever(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as srv:
+            srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            srv.bind((self.bind_ip, self.port))
+            srv.listen(16)
+            logging.info(f"Event stream listening on {self.bind_ip}:{self.port}")
+            while True:
+                conn, addr = srv.accept()
+                threading.Thread(target=self._client, args=(conn, addr), daemon=True).start()
+
+
+def subscribe_remote(host: str, port: int, types=None, timeout: float = 5.0):
+    """Client side of EventServer: yields events from another process until the connection drops."""
+    with socket.create_connection((host, port), timeout=timeout) as s:
+        s.sendall((",".join(types or []) + "\n").encode())
+        s.settimeout(None)
+        buf = b""
+        while True:
+            chunk = s.recv(65536)
+            if not chunk:
+                return
+            buf += chunk
+            *lines, buf = buf.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield json.loads(line)
+
+
+async def follow_events(host: str, port: int, types=None, timeout: float = 5.0):
+    """asyncio variant of subscribe_remote for event-loop based subscribers (the GUI backend)."""
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        writer.write((",".join(types or []) + "\n").encode())
+        await writer.drain()
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            if line.strip():
+                yield json.loads(line)
+    finally:
+        writer.close()
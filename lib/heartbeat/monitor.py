@@ -0,0 +1,13 @@
+"""Liveness monitor: marks silent nodes dead; the engine publishes a dead event for each."""
+import time
+import logging
+
+from lib.heartbeat.engine import HeartbeatEngine
+
+
+def heartbeat_monitor(engine: HeartbeatEngine, interval: float = 1.0):
+    logging.info(f"Timeout monitor running (threshold={engine.timeout}s)")
+    while True:
+        time.sleep(interval)
+        for node_uuid in engine.check_timeouts():
+            logging.warning(f"[ALERT] {node_uuid} DEAD (no heartbeat for > {engine.timeout}s)")
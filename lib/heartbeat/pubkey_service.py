@@ -0,0 +1,128 @@
+"""
+Public key registration service (asyncio, TCP).
+
+Framing: one "client_id|<public_key_hex>" record per line, answered in order with
+"ACK"/"NACK" lines, any number of records per connection. Single-shot clients that
+send one unterminated record and wait for the answer are served after PK_LEGACY_IDLE.
+"""
+import os
+import asyncio
+import logging
+
+from lib.heartbeat.engine import HeartbeatEngine
+
+PK_BATCH_MAX      = int(os.environ.get("SE_CO_PK_BATCH_MAX", "256"))         # keys per DB write round
+PK_BATCH_WINDOW   = float(os.environ.get("SE_CO_PK_BATCH_WINDOW", "0.02"))  # seconds to coalesce registrations
+PK_CONN_TIMEOUT   = 5.0     # idle seconds before a registration connection is closed
+PK_LEGACY_IDLE    = 0.2     # silence after which an unterminated record is processed
+PK_MAX_RECORD     = 4096
+
+
+def _parse_pk_record(record: bytes) -> tuple[str, bytes]:
+    msg = record.decode("utf-8", errors="strict")
+    if "|" not in msg:
+        raise ValueError("bad format")
+    client_id, pk_hex = msg.split("|", 1)
+    client_id = client_id.strip()
+    pk_hex = pk_hex.strip()
+    if not client_id or len(pk_hex) % 2 != 0:
+        raise ValueError("invalid fields")
+    try:
+        return client_id, bytes.fromhex(pk_hex)
+    except ValueError:
+        raise ValueError("invalid hex")
+
+
+class PubkeyBatcher:
+    """Coalesces registrations from all connections into bulk writes."""
+    def __init__(self, engine: HeartbeatEngine):
+        self.engine = engine
+        self._pending: list[tuple[str, bytes, asyncio.Future]] = []
+        self._wakeup = asyncio.Event()
+
+    async def register(self, client_id: str, public_key: bytes):
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((client_id, public_key, fut))
+        self._wakeup.set()
+        await fut
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wakeup.wait()
+            if len(self._pending) < PK_BATCH_MAX:
+                await asyncio.sleep(PK_BATCH_WINDOW)
+            batch, self._pending = self._pending[:PK_BATCH_MAX], self._pending[PK_BATCH_MAX:]
+            if not self._pending:
+                self._wakeup.clear()
+            try:
+                await loop.run_in_executor(None, self.engine.import_pubkeys, [(c, pk) for c, pk, _ in batch])
+            except Exception as e:
+                for *_, fut in batch:
+                    fut.set_exception(e)
+                continue
+            logging.info(f"[PK] Stored {len(batch)} public key(s)")
+            for *_, fut in batch:
+                fut.set_result(None)
+
+async def _handle_pk_record(record: bytes, peer: str, batcher: PubkeyBatcher) -> bytes:
+    try:
+        client_id, public_key = _parse_pk_record(record)
+    except (ValueError, UnicodeDecodeError) as e:
+        logging.warning(f"[PK] {peer} {e}")
+        return b"NACK"
+    try:
+        await batcher.register(client_id, public_key)
+    except Exception as e:
+        logging.error(f"[PK] {peer} error storing key for {client_id}: {e}")
+        return b"NACK"
+    logging.info(f"[PK] Stored public key for {client_id} ({len(public_key)} bytes)")
+    return b"ACK"
+
+async def _handle_pk_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, batcher: PubkeyBatcher):
+    addr = writer.get_extra_info("peername")
+    peer = f"{addr[0]}:{addr[1]}"
+    buf = b""
+    try:
+        while True:
+            try:
+                chunk = await asyncio.wait_for(reader.read(65536), PK_LEGACY_IDLE if buf else PK_CONN_TIMEOUT)
+            except asyncio.TimeoutError:
+                if not buf:
+                    break
+                chunk = None  # unterminated single-shot record
+            buf += chunk or b""
+            if len(buf) > PK_MAX_RECORD and b"\n" not in buf:
+                logging.warning(f"[PK] {peer} record too long")
+                writer.write(b"NACK\n"); break
+            records = buf.split(b"\n")
+            buf = records.pop()
+            if not chunk and buf:
+                records.append(buf); buf = b""
+            records = [r for r in records if r.strip()]
+            if records:
+                replies = await asyncio.gather(*(_handle_pk_record(r, peer, batcher) for r in records))
+                writer.write(b"".join(r + b"\n" for r in replies))
+                await writer.drain()
+            if not chunk:
+                break
+    except Exception as e:
+        logging.error(f"[PK] {peer} error: {e}")
+    finally:
+        try:
+            writer.close()
+            await writer.wait_closed()
+        except Exception:
+            pass
+
+async def pubkey_server(engine: HeartbeatEngine, bind_ip: str, port: int):
+    batcher = PubkeyBatcher(engine)
+    asyncio.create_task(batcher.run())
+    srv = await asyncio.start_server(lambda r, w: _handle_pk_connection(r, w, batcher),
+                                     bind_ip, port, reuse_address=True, backlog=1024)
+    logging.info(f"TCP server listening on {bind_ip}:{port}")
+    async with srv:
+        await srv.serve_forever()
+
+def tcp_server(engine: HeartbeatEngine, bind_ip: str, port: int):
+    asyncio.run(pubkey_server(engine, bind_ip, port))
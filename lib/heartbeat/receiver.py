@@ -0,0 +1,54 @@
+"""
+UDP heartbeat receiver.
+
+Datagrams are handed to a fixed pool of worker threads instead of one thread per
+datagram. Workers are sharded by client id, so heartbeats of one node are
+processed in arrival order while different nodes are verified in parallel.
+"""
+import queue
+import socket
+import logging
+import threading
+import zlib
+
+from lib.heartbeat.engine import HeartbeatEngine
+
+DEFAULT_WORKERS    = 4
+DEFAULT_QUEUE_SIZE = 4096   # per worker; datagrams beyond this are dropped like a full socket buffer
+
+
+class HeartbeatReceiver:
+    def __init__(self, engine: HeartbeatEngine, bind_ip: str, port: int,
+                 workers: int = DEFAULT_WORKERS, queue_size: int = DEFAULT_QUEUE_SIZE):
+        self.engine = engine
+        self.bind_ip = bind_ip
+        self.port = port
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(max(1, workers))]
+        self.dropped = 0
+
+    def dispatch(self, data: bytes, addr):
+        # shard on the client id (first payload field) to keep per-node ordering
+        q = self.queues[zlib.crc32(data.split(b"|", 1)[0]) % len(self.queues)]
+        try:
+            q.put_nowait((data, addr))
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logging.warning(f"[HB] receiver backlog full, {self.dropped} datagram(s) dropped so far")
+
+    def _worker(self, q: queue.Queue):
+        handle = self.engine.handle_datagram
+        while True:
+            data, addr = q.get()
+            handle(data, f"{addr[0]}:{addr[1]}")
+
+    def serve_forever(self):
+        for q in self.queues:
+            threading.Thread(target=self._worker, args=(q,), daemon=True).start()
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as srv:
+            srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            srv.bind((self.bind_ip, self.port))
+            logging.info(f"UDP server listening on {self.bind_ip}:{self.port} ({len(self.queues)} workers)")
+            while True:
+                data, addr = srv.recvfrom(65507)
+                self.dispatch(data, addr)
@@ -0,0 +1,116 @@
+"""
+Heartbeat receiver daemon: public key service (TCP), heartbeat receiver (UDP)
+and liveness monitor around one HeartbeatEngine. coordinator/heartbeat_server.py
+and GUI/backend/heartbeat_server.py are thin wrappers around main().
+"""
+import os
+import sys
+import time
+import logging
+import threading
+from pathlib import Path
+
+from lib.heartbeat.store import open_store
+from lib.heartbeat.engine import HeartbeatEngine
+from lib.heartbeat.events import EventBus, EventServer, UdpSink, TcpSink, EV_DEAD
+from lib.heartbeat.receiver import HeartbeatReceiver
+from lib.heartbeat.monitor import heartbeat_monitor
+from lib.heartbeat.pubkey_service import tcp_server
+
+# ==================== Configuration ====================
+BIND_IP           = os.environ.get("SE_CO_BIND_IP", "0.0.0.0")   # e.g., "10.1.255.254" in prod
+TCP_PORT          = int(os.environ.get("SE_CO_PUBKEY_TCP_PORT", "5007"))
+UDP_PORT          = int(os.environ.get("SE_CO_HB_UDP_PORT", "5008"))
+HEARTBEAT_TIMEOUT = int(os.environ.get("SE_CO_HB_TIMEOUT", "7"))  # seconds
+LOGFILE           = os.environ.get("SE_CO_LOG", "./logs/coordinator_hb_server.log")
+STORE_DIR         = os.environ.get("SE_CO_HB_STORE", "./hb_store")  # optional: where to stash any files if needed
+HB_WORKERS        = int(os.environ.get("SE_CO_HB_WORKERS", "4"))    # verification threads
+
+# Optional: notify another coordinator/service on DEAD ("NODE_DEAD|<uuid>" over UDP)
+NOTIFY_IP         = os.environ.get("SE_NOTIFY_IP", "")            # e.g., "10.30.2.153"
+NOTIFY_PORT       = int(os.environ.get("SE_NOTIFY_PORT", "5050"))
+
+# Liveness event stream (JSON lines) for the coordinator, the GUI and other subscribers
+EVENT_BIND_IP     = os.environ.get("SE_CO_HB_EVENT_BIND", "127.0.0.1")
+EVENT_PORT        = int(os.environ.get("SE_CO_HB_EVENT_PORT", "5009"))   # 0 disables
+EVENT_QUEUE       = int(os.environ.get("SE_CO_HB_EVENT_QUEUE", "1024"))  # per subscriber
+EVENT_SINKS       = os.environ.get("SE_CO_HB_EVENT_SINKS", "")           # e.g. "udp:10.0.0.5:6000,tcp:10.0.0.6:6001"
+
+# State backend: cassandra | sqlite | memory (see lib/heartbeat/store.py for SE_CASS_* / SE_CO_HB_SQLITE)
+HB_BACKEND        = os.environ.get("SE_CO_HB_BACKEND", "cassandra")
+# ========================================================
+
+
+def setup_logging(logfile: str = LOGFILE, line_buffered: bool = False):
+    os.makedirs(os.path.dirname(os.path.abspath(logfile)), exist_ok=True)
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [CO-HB] %(levelname)s: %(message)s",
+        handlers=[logging.StreamHandler(sys.stdout), logging.FileHandler(logfile)],
+        force=line_buffered
+    )
+    if line_buffered:
+        sys.stdout.reconfigure(line_buffering=True)
+
+
+def timeout_from_argv(argv: list[str]) -> int:
+    # Allow override via CLI argument: python3 heartbeat_server.py <lost_limit>
+    if argv:
+        try:
+            timeout = int(argv[0])
+            print(f"[INFO] Using CLI heartbeat timeout: {timeout}s")
+            return timeout
+        except ValueError:
+            print(f"[WARN] Invalid heartbeat timeout argument '{argv[0]}', using default.")
+    return HEARTBEAT_TIMEOUT
+
+
+def build_event_bus() -> EventBus:
+    bus = EventBus()
+    if NOTIFY_IP:
+        bus.add_sink("notify", UdpSink(NOTIFY_IP, NOTIFY_PORT, legacy=True), types=[EV_DEAD], maxlen=EVENT_QUEUE)
+    for spec in filter(None, (x.strip() for x in EVENT_SINKS.split(","))):
+        try:
+            kind, host, port = spec.split(":")
+            sink = {"udp": UdpSink, "tcp": TcpSink}[kind](host, int(port))
+        except (ValueError, KeyError):
+            logging.warning(f"[EVENT] ignoring bad sink '{spec}' (expected udp:<ip>:<port> or tcp:<ip>:<port>)")
+            continue
+        bus.add_sink(spec, sink, maxlen=EVENT_QUEUE)
+    return bus
+
+
+def build_engine(timeout: int = HEARTBEAT_TIMEOUT, backend: str = HB_BACKEND,
+                 events: EventBus | None = None) -> HeartbeatEngine:
+    store = open_store(backend)
+    store.connect()
+    logging.info(f"State store connected (backend={store.name})")
+    engine = HeartbeatEngine(store, timeout, events)
+    engine.preload_cache()
+    return engine
+
+
+def main(argv: list[str] | None = None, line_buffered: bool = False):
+    timeout = timeout_from_argv(sys.argv[1:] if argv is None else argv)
+    setup_logging(line_buffered=line_buffered)
+    logging.info(f"Starting Coordinator HB receiver on {BIND_IP} (TCP:{TCP_PORT} UDP:{UDP_PORT})")
+    Path(STORE_DIR).mkdir(parents=True, exist_ok=True)
+    events = build_event_bus()
+    engine = build_engine(timeout, events=events)
+    receiver = HeartbeatReceiver(engine, BIND_IP, UDP_PORT, workers=HB_WORKERS)
+
+    t1 = threading.Thread(target=tcp_server, args=(engine, BIND_IP, TCP_PORT), daemon=True)
+    t2 = threading.Thread(target=receiver.serve_forever, daemon=True)
+    t3 = threading.Thread(target=heartbeat_monitor, args=(engine,), daemon=True)
+
+    t1.start(); t2.start(); t3.start()
+    if EVENT_PORT:
+        event_server = EventServer(events, EVENT_BIND_IP, EVENT_PORT, maxlen=EVENT_QUEUE)
+        threading.Thread(target=event_server.serve_forever, daemon=True).start()
+
+    logging.info("Receiver is running. Press Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        logging.info("Shutting down.")
@@ -0,0 +1,295 @@
+"""
+Storage backends for the heartbeat server.
+
+The server keeps every node in its in-memory cache and uses a store only to
+persist public keys and heartbeat state, and to reload them on start-up.
+Select the backend with SE_CO_HB_BACKEND = cassandra (default) | sqlite | memory.
+"""
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+BACKEND_CASSANDRA = "cassandra"
+BACKEND_SQLITE    = "sqlite"
+BACKEND_MEMORY    = "memory"
+
+DEFAULT_BACKEND   = os.environ.get("SE_CO_HB_BACKEND", BACKEND_CASSANDRA)
+
+
+class StateStore:
+    """
+    Interface implemented by every backend.
+    Node rows are dicts: {"public_key": bytes, "last_i": int, "last_ts": float, "status": str}
+    """
+    name = "base"
+
+    def connect(self):
+        pass
+
+    def close(self):
+        pass
+
+    def load_all(self) -> dict[str, dict]:
+        raise NotImplementedError
+
+    def get_pubkey(self, node_uuid: str) -> bytes | None:
+        raise NotImplementedError
+
+    def get_hb_state(self, node_uuid: str) -> tuple[int, float, str] | None:
+        raise NotImplementedError
+
+    def save_pubkey(self, node_uuid: str, public_key: bytes):
+        raise NotImplementedError
+
+    def save_hb_state(self, node_uuid: str, last_i: int, last_ts: float, status: str):
+        raise NotImplementedError
+
+    def save_pubkeys(self, entries: list[tuple[str, bytes]]):
+        for node_uuid, public_key in entries:
+            self.save_pubkey(node_uuid, public_key)
+
+    def save_hb_states(self, rows: list[tuple[str, int, float, str]]):
+        for node_uuid, last_i, last_ts, status in rows:
+            self.save_hb_state(node_uuid, last_i, last_ts, status)
+
+
+class MemoryStore(StateStore):
+    """Nothing survives a restart; for edge coordinators without a database and for benchmarks."""
+    name = BACKEND_MEMORY
+
+    def __init__(self):
+        self._keys: dict[str, bytes] = {}
+        self._hb: dict[str, tuple[int, float, str]] = {}
+        self._lock = threading.Lock()
+
+    def load_all(self):
+        with self._lock:
+            rows = {u: {"public_key": pk} for u, pk in self._keys.items()}
+            for u, (last_i, last_ts, status) in self._hb.items():
+                rows.setdefault(u, {}).update(last_i=last_i, last_ts=last_ts, status=status)
+        return rows
+
+    def get_pubkey(self, node_uuid):
+        with self._lock:
+            return self._keys.get(node_uuid)
+
+    def get_hb_state(self, node_uuid):
+        with self._lock:
+            return self._hb.get(node_uuid)
+
+    def save_pubkey(self, node_uuid, public_key):
+        with self._lock:
+            self._keys[node_uuid] = public_key
+
+    def save_hb_state(self, node_uuid, last_i, last_ts, status):
+        with self._lock:
+            self._hb[node_uuid] = (last_i, last_ts, status)
+
+
+class SQLiteStore(StateStore):
+    """Single-file store for single-coordinator deployments (WAL journal, one writer)."""
+    name = BACKEND_SQLITE
+
+    def __init__(self, path: str):
+        self.path = path
+        self.db = None
+        self._lock = threading.Lock()
+
+    def connect(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS node_keys (
+                node_uuid  TEXT PRIMARY KEY,
+                public_key BLOB,
+                created_at REAL
+            )
+        """)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS heartbeat_state (
+                node_uuid  TEXT PRIMARY KEY,
+                last_i     INTEGER,
+                last_ts    REAL,
+                status     TEXT,
+                updated_at REAL
+            )
+        """)
+
+    def close(self):
+        if self.db:
+            self.db.close()
+            self.db = None
+
+    def load_all(self):
+        with self._lock:
+            keys = self.db.execute("SELECT node_uuid, public_key FROM node_keys").fetchall()
+            hb = self.db.execute("SELECT node_uuid, last_i, last_ts, status FROM heartbeat_state").fetchall()
+        rows = {u: {"public_key": bytes(pk)} for u, pk in keys}
+        for u, last_i, last_ts, status in hb:
+            rows.setdefault(u, {}).update(last_i=last_i or 0, last_ts=last_ts or 0.0,
+                                          status=status or "registered")
+        return rows
+
+    def get_pubkey(self, node_uuid):
+        with self._lock:
+            row = self.db.execute("SELECT public_key FROM node_keys WHERE node_uuid = ?", (node_uuid,)).fetchone()
+        return bytes(row[0]) if row else None
+
+    def get_hb_state(self, node_uuid):
+        with self._lock:
+            row = self.db.execute("SELECT last_i, last_ts, status FROM heartbeat_state WHERE node_uuid = ?",
+                                  (node_uuid,)).fetchone()
+        return (row[0] or 0, row[1] or 0.0, row[2] or "registered") if row else None
+
+    def save_pubkey(self, node_uuid, public_key):
+        self.save_pubkeys([(node_uuid, public_key)])
+
+    def save_hb_state(self, node_uuid, last_i, last_ts, status):
+        self.save_hb_states([(node_uuid, last_i, last_ts, status)])
+
+    def save_pubkeys(self, entries):
+        now = datetime.now(tz=timezone.utc).timestamp()
+        with self._lock:
+            self.db.executemany("INSERT OR REPLACE INTO node_keys VALUES (?, ?, ?)",
+                                [(u, pk, now) for u, pk in entries])
+
+    def save_hb_states(self, rows):
+        now = datetime.now(tz=timezone.utc).timestamp()
+        with self._lock:
+            self.db.executemany("INSERT OR REPLACE INTO heartbeat_state VALUES (?, ?, ?, ?, ?)",
+                                [(u, i, ts, st, now) for u, i, ts, st in rows])
+
+
+class CassandraStore(StateStore):
+    """The original keyspace layout (swarm.node_keys / swarm.heartbeat_state)."""
+    name = BACKEND_CASSANDRA
+
+    def __init__(self, hosts: list[str], keyspace: str, replication: str, concurrency: int = 256):
+        self.hosts = hosts
+        self.keyspace = keyspace
+        self.replication = replication
+        self.concurrency = concurrency
+        self.cluster = None
+        self.session = None
+        self.ps = {}
+
+    def connect(self):
+        # imported here so the other backends run without the driver installed
+        from cassandra.cluster import Cluster
+        from cassandra import ConsistencyLevel
+
+        self.cluster = Cluster(self.hosts)
+        session = self.cluster.connect()
+        # Keyspace
+        session.execute(f"""
+            CREATE KEYSPACE IF NOT EXISTS {self.keyspace}
+            WITH replication = {self.replication}
+        """)
+        session.set_keyspace(self.keyspace)
+        # Tables
+        session.execute("""
+            CREATE TABLE IF NOT EXISTS node_keys (
+                node_uuid  text PRIMARY KEY,
+                public_key blob,
+                created_at timestamp
+            )
+        """)
+        session.execute("""
+            CREATE TABLE IF NOT EXISTS heartbeat_state (
+                node_uuid  text PRIMARY KEY,
+                last_i     int,
+                last_ts    timestamp,
+                status     text,       /* 'registered' | 'alive' | 'dead' */
+                updated_at timestamp
+            )
+        """)
+
+        # Prepared statements
+        self.ps = {
+            "upsert_key": session.prepare(
+                "INSERT INTO node_keys (node_uuid, public_key, created_at) VALUES (?, ?, toTimestamp(now()))"
+            ),
+            "get_key": session.prepare(
+                "SELECT public_key FROM node_keys WHERE node_uuid = ?"
+            ),
+            "upsert_hb": session.prepare(
+                "INSERT INTO heartbeat_state (node_uuid, last_i, last_ts, status, updated_at) VALUES (?, ?, ?, ?, toTimestamp(now()))"
+            ),
+            "get_hb": session.prepare(
+                "SELECT last_i, last_ts, status FROM heartbeat_state WHERE node_uuid = ?"
+            ),
+        }
+        for statement in self.ps.values():
+            statement.consistency_level = ConsistencyLevel.ONE
+        self.session = session
+
+    def close(self):
+        if self.cluster:
+            self.cluster.shutdown()
+            self.cluster = None
+
+    def load_all(self):
+        rows = {}
+        for r in self.session.execute("SELECT node_uuid, public_key FROM node_keys"):
+            rows.setdefault(r.node_uuid, {})["public_key"] = r.public_key
+        for r in self.session.execute("SELECT node_uuid, last_i, last_ts, status FROM heartbeat_state"):
+            rows.setdefault(r.node_uuid, {}).update(
+                last_i=int(r.last_i) if r.last_i is not None else 0,
+                last_ts=r.last_ts.replace(tzinfo=timezone.utc).timestamp() if r.last_ts else 0.0,
+                status=r.status or "registered")
+        return rows
+
+    def get_pubkey(self, node_uuid):
+        row = self.session.execute(self.ps["get_key"], (node_uuid,)).one()
+        return row.public_key if row else None
+
+    def get_hb_state(self, node_uuid):
+        row = self.session.execute(self.ps["get_hb"], (node_uuid,)).one()
+        if not row:
+            return None
+        return (int(row.last_i) if row.last_i is not None else 0,
+                row.last_ts.replace(tzinfo=timezone.utc).timestamp() if row.last_ts else 0.0,
+                row.status or "registered")
+
+    def save_pubkey(self, node_uuid, public_key):
+        self.session.execute(self.ps["upsert_key"], (node_uuid, public_key))
+
+    def save_hb_state(self, node_uuid, last_i, last_ts, status):
+        self.session.execute(self.ps["upsert_hb"], (node_uuid, last_i, _to_datetime(last_ts), status))
+
+    def save_pubkeys(self, entries):
+        from cassandra.concurrent import execute_concurrent_with_args
+        # pipelined with bounded concurrency rather than a multi-partition BATCH
+        execute_concurrent_with_args(self.session, self.ps["upsert_key"], entries,
+                                     concurrency=self.concurrency, raise_on_first_error=True)
+
+    def save_hb_states(self, rows):
+        from cassandra.concurrent import execute_concurrent_with_args
+        execute_concurrent_with_args(self.session, self.ps["upsert_hb"],
+                                     [(u, i, _to_datetime(ts), st) for u, i, ts, st in rows],
+                                     concurrency=self.concurrency, raise_on_first_error=True)
+
+
+def _to_datetime(ts: float) -> datetime:
+    return datetime.fromtimestamp(ts, tz=timezone.utc)
+
+
+def open_store(backend: str | None = None) -> StateStore:
+    """Build the store selected by `backend` or SE_CO_HB_BACKEND; call connect() before use."""
+    backend = (backend or DEFAULT_BACKEND).lower()
+    if backend == BACKEND_MEMORY:
+        return MemoryStore()
+    if backend == BACKEND_SQLITE:
+        store_dir = os.environ.get("SE_CO_HB_STORE", "./hb_store")
+        return SQLiteStore(os.environ.get("SE_CO_HB_SQLITE", os.path.join(store_dir, "heartbeat.db")))
+    if backend == BACKEND_CASSANDRA:
+        return CassandraStore(
+            hosts=os.environ.get("SE_CASS_HOSTS", "127.0.0.1").split(","),
+            keyspace=os.environ.get("SE_CASS_KEYSPACE", "swarm"),
+            replication=os.environ.get("SE_CASS_REPL", "{'class': 'SimpleStrategy', 'replication_factor': 1}"),
+            concurrency=int(os.environ.get("SE_CO_PK_BATCH_MAX", "256")),
+        )
+    raise ValueError(f"unknown heartbeat store backend '{backend}'")
@@ -0,0 +1,72 @@
+"""
+Parsing and hash-chain verification of heartbeat datagrams.
+
+Datagram: payload || w_i || authenticator
+  payload       := client_id|timestamp|i[|next_public_key_hex]
+  authenticator := H(payload || w_i)
+A heartbeat is valid when H^i(w_i) == public_key, or equivalently
+H^(i - last_i)(w_i) == w_last_i for the last accepted element.
+"""
+import hmac
+import hashlib
+from typing import NamedTuple
+
+HASH_FN = hashlib.sha256
+DIGEST_SIZE = HASH_FN().digest_size
+
+
+class Heartbeat(NamedTuple):
+    client_id: str
+    ts: str
+    i: int
+    w_i: bytes
+    next_public_key: bytes | None
+
+
+def hash_n(x: bytes, n: int) -> bytes:
+    h = HASH_FN
+    for _ in range(n):
+        x = h(x).digest()
+    return x
+
+
+def parse_datagram(data: bytes) -> Heartbeat:
+    """Split and authenticate a datagram; raises ValueError on anything malformed."""
+    # Expect: payload || w_i || authenticator. w_i and the authenticator are raw
+    # digests that may themselves contain "|", so they are cut by length from the end.
+    d = DIGEST_SIZE
+    if len(data) < 2 * d + 5 or data[-d - 2:-d] != b"||" or data[-2 * d - 4:-2 * d - 2] != b"||":
+        raise ValueError("malformed datagram (split)")
+    payload, w_i, authenticator = data[:-2 * d - 4], data[-2 * d - 2:-d - 2], data[-d:]
+
+    # payload := client_id|timestamp|i[|next_public_key_hex]
+    p = payload.split(b"|")
+    if len(p) not in (3, 4):
+        raise ValueError("malformed payload")
+    try:
+        client_id = p[0].decode("utf-8")
+        ts_str = p[1].decode("utf-8")
+    except UnicodeDecodeError:
+        raise ValueError("payload not utf-8")
+    try:
+        i = int(p[2])
+    except ValueError:
+        raise ValueError("i not int")
+    next_pk = None
+    if len(p) == 4:
+        try:
+            next_pk = bytes.fromhex(p[3].decode("ascii"))
+        except (ValueError, UnicodeDecodeError):
+            raise ValueError("next public key not hex")
+        if len(next_pk) != DIGEST_SIZE:
+            raise ValueError("bad next public key length")
+
+    # Verify authenticator: H(payload || w_i), constant-time compare
+    if not hmac.compare_digest(HASH_FN(payload + w_i).digest(), authenticator):
+        raise ValueError("authenticator mismatch")
+    return Heartbeat(client_id, ts_str, i, w_i, next_pk)
+
+
+def verify_chain(w_i: bytes, i: int, anchor: bytes, anchor_i: int) -> bool:
+    """True if w_i sits i - anchor_i steps before `anchor` (the public key when anchor_i == 0)."""
+    return i > anchor_i and hash_n(w_i, i - anchor_i) == anchor
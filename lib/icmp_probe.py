@@ -0,0 +1,148 @@
+"""
+In-process ICMP echo prober, replacing `ping -c 1` subprocesses.
+
+One ICMP socket is shared by every probe: an unprivileged datagram ICMP
+socket when net.ipv4.ping_group_range allows it, a raw socket otherwise. A
+reader thread matches echo replies to pending probes by (address, sequence)
+and resolves the waiting futures on their own event loops, so any number of
+stations can be probed concurrently from any thread or loop:
+
+    prober = IcmpProber()
+    rtt = await prober.probe("10.0.0.7", timeout=1.0)           # seconds or None
+    back = await prober.wait_reachable("10.0.0.7", duration=5)  # probe every interval until a reply
+"""
+import os
+import time
+import errno
+import socket
+import struct
+import asyncio
+import logging
+import itertools
+import threading
+
+PROBE_INTERVAL = float(os.environ.get("SE_PROBE_INTERVAL", "0.5"))   # seconds between probes of one target
+PROBE_TIMEOUT  = float(os.environ.get("SE_PROBE_TIMEOUT", "1.0"))    # seconds to wait for one reply
+
+ICMP_ECHO_REPLY   = 0
+ICMP_ECHO_REQUEST = 8
+ICMP_HEADER = struct.Struct("!BBHHH")     # type, code, checksum, identifier, sequence
+
+logger = logging.getLogger(__name__)
+
+
+def checksum(data: bytes) -> int:
+    if len(data) % 2:
+        data += b"\0"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+def echo_request(ident: int, seq: int, payload: bytes = b"se-probe") -> bytes:
+    header = ICMP_HEADER.pack(ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+    return ICMP_HEADER.pack(ICMP_ECHO_REQUEST, 0, checksum(header + payload), ident, seq) + payload
+
+
+class IcmpProber:
+    def __init__(self):
+        try:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+            self.raw = False
+        except PermissionError:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+            self.raw = True
+        # a roaming storm answers many probes at once (raw sockets also see our own requests on loopback)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        # on datagram sockets the kernel replaces the identifier with the socket's own
+        self.ident = os.getpid() & 0xffff
+        self._seq = itertools.count(1)
+        self._pending: dict[tuple[str, int], tuple] = {}   # (ip, seq) -> (loop, future, sent)
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.replies = 0
+        self.timeouts = 0
+        self._thread = threading.Thread(target=self._run, name="icmp-prober", daemon=True)
+        self._thread.start()
+
+    # ---------------- reader thread ----------------
+    def _parse(self, data: bytes):
+        if self.raw:
+            data = data[(data[0] & 0x0f) * 4:]     # raw sockets deliver the IP header too
+        if len(data) < ICMP_HEADER.size:
+            return None
+        icmp_type, _code, _sum, ident, seq = ICMP_HEADER.unpack_from(data)
+        if icmp_type != ICMP_ECHO_REPLY or (self.raw and ident != self.ident):
+            return None
+        return seq
+
+    def _run(self):
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(2048)
+            except OSError as e:
+                if e.errno in (errno.EINTR, errno.EAGAIN):
+                    continue
+                logger.error(f"ICMP prober stopped: {e!r}")
+                return
+            seq = self._parse(data)
+            if seq is None:
+                continue
+            with self._lock:
+                pending = self._pending.pop((addr[0], seq), None)
+            if pending is None:
+                continue
+            loop, future, sent = pending
+            self.replies += 1
+            rtt = time.monotonic() - sent
+            loop.call_soon_threadsafe(lambda f=future: f.done() or f.set_result(rtt))
+
+    # ---------------- probes ----------------
+    async def probe(self, ip: str, timeout: float = PROBE_TIMEOUT) -> float | None:
+        """Round-trip time of one echo request to `ip` in seconds, None if no reply came within `timeout`."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        seq = next(self._seq) & 0xffff
+        key = (ip, seq)
+        with self._lock:
+            self._pending[key] = (loop, future, time.monotonic())
+        try:
+            self.sock.sendto(echo_request(self.ident, seq), (ip, 0))
+            self.sent += 1
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return None
+        except OSError as e:
+            # unreachable network, no route, ... count as a lost probe
+            logger.debug(f"ICMP probe to {ip} failed: {e!r}")
+            return None
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    async def wait_reachable(self, target, duration: float, interval: float = PROBE_INTERVAL,
+                             timeout: float = PROBE_TIMEOUT, attempts: int | None = None) -> bool:
+        """
+        Probe `target` every `interval` seconds until it answers (True) or
+        `duration` seconds or `attempts` probes have passed (False). `target`
+        is an IP or a callable returning the current IP (or None if unknown,
+        which counts as a failed attempt).
+        """
+        deadline = time.monotonic() + duration
+        tries = 0
+        while True:
+            started = time.monotonic()
+            remaining = deadline - started
+            if remaining <= 0 or (attempts is not None and tries >= attempts):
+                return False
+            tries += 1
+            ip = target() if callable(target) else target
+            if ip is not None and await self.probe(ip, min(timeout, remaining)) is not None:
+                return True
+            await asyncio.sleep(max(0.0, min(interval - (time.monotonic() - started), deadline - time.monotonic())))
+
+    def stats(self) -> dict:
+        return {"raw": self.raw, "sent": self.sent, "replies": self.replies, "timeouts": self.timeouts,
+                "pending": len(self._pending)}
@@ -1,39 +1,190 @@
 import logging
 import sys
+import os
+import copy
+import shutil
+import time
+import queue
 import socket
+import threading
+
+# Log shipping: records are queued by the caller and sent by a background thread
+LOG_QUEUE_SIZE      = int(os.environ.get("SE_LOG_QUEUE_SIZE", "10000"))   # records held in memory
+LOG_BATCH_SIZE      = 256                                                 # records per socket write
+LOG_SPILL_DIR       = os.environ.get("SE_LOG_SPILL_DIR", "")              # empty: drop instead of spilling
+LOG_SPILL_MAX_BYTES = 16 * 1024 * 1024
+LOG_SPILL_CHUNK     = 1024 * 1024                                         # bytes per replayed write
+RECONNECT_MIN       = 0.5     # seconds, doubled on every failed attempt
+RECONNECT_MAX       = 30.0
+CONNECT_TIMEOUT     = 2.0
+
+_EXC_FORMATTER = logging.Formatter()
 
 
 class SocketStreamHandler(logging.Handler):
     """
     Custom logging handler that streams logs over TCP to the central log server.
+
+    emit() only puts the record on a bounded queue, so the calling thread never
+    waits on the network. The message and traceback are rendered in emit(), as
+    QueueHandler.prepare does, so later changes to the arguments do not show up
+    in the log and the queue holds no references to them or to tracebacks.
+    A background thread formats queued records, sends them
+    with one write per batch and reconnects with exponential backoff. While the
+    server is unreachable, batches are spilled to a file (if spill_path is set)
+    and replayed after reconnecting, otherwise they are dropped. Both are counted.
     """
-    def __init__(self, host, port):
+    def __init__(self, host, port, queue_size: int = LOG_QUEUE_SIZE,
+                 batch_size: int = LOG_BATCH_SIZE, spill_path: str | None = None):
         super().__init__()
         self.host = host
         self.port = port
         self.sock = None
-        self._connect()
+        self.batch_size = batch_size
+        self.spill_path = spill_path
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.sent = 0
+        self.dropped = 0
+        self.spilled = 0
+        self._backoff = RECONNECT_MIN
+        self._next_connect = 0.0
+        self._thread = threading.Thread(target=self._run, name=f"log-ship-{host}:{port}", daemon=True)
+        self._thread.start()
+
+    def emit(self, record):
+        try:
+            self.queue.put_nowait(self.prepare(record))
+        except queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def prepare(self, record):
+        # a copy, the record is shared with the other handlers
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = (self.formatter or _EXC_FORMATTER).formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def stats(self) -> dict:
+        return {"queued": self.queue.qsize(), "sent": self.sent, "dropped": self.dropped,
+                "spilled": self.spilled, "connected": self.sock is not None}
 
-    def _connect(self):
+    # ---------------- sender thread ----------------
+    def _connect(self) -> bool:
+        now = time.monotonic()
+        if now < self._next_connect:
+            return False
         try:
-            self.sock = socket.create_connection((self.host, self.port))
+            self.sock = socket.create_connection((self.host, self.port), timeout=CONNECT_TIMEOUT)
+            self.sock.settimeout(None)
+            self._backoff = RECONNECT_MIN
             print(f"[LoggerUtils] Connected to log server at {self.host}:{self.port}")
-        except Exception as e:
-            print(f"[LoggerUtils] Failed to connect to log server at {self.host}:{self.port}: {e}")
+            return True
+        except OSError as e:
+            if self._backoff == RECONNECT_MIN:
+                print(f"[LoggerUtils] Failed to connect to log server at {self.host}:{self.port}: {e}")
             self.sock = None
+            self._next_connect = now + self._backoff
+            self._backoff = min(self._backoff * 2, RECONNECT_MAX)
+            return False
 
-    def emit(self, record):
-        if not self.sock:
-            self._connect()
-        if not self.sock:
+    def _spill(self, data: bytes, count: int):
+        if self.spill_path:
+            try:
+                if os.path.getsize(self.spill_path) + len(data) <= LOG_SPILL_MAX_BYTES:
+                    with open(self.spill_path, "ab") as f:
+                        f.write(data)
+                    self.spilled += count
+                    return
+            except FileNotFoundError:
+                os.makedirs(os.path.dirname(os.path.abspath(self.spill_path)), exist_ok=True)
+                with open(self.spill_path, "ab") as f:
+                    f.write(data)
+                self.spilled += count
+                return
+            except OSError:
+                pass
+        self.dropped += count
+
+    def _replay_spill(self):
+        if not self.spill_path or not os.path.exists(self.spill_path):
             return
+        sent = 0
+        try:
+            with open(self.spill_path, "rb") as f:
+                while chunk := f.read(LOG_SPILL_CHUNK):
+                    self.sock.sendall(chunk)
+                    sent += len(chunk)
+        except OSError:
+            # keep only what was not delivered, or it is sent again after the next reconnect
+            if sent:
+                self._drop_spilled(sent)
+            raise
+        os.remove(self.spill_path)
+
+    def _drop_spilled(self, size: int):
+        tmp = self.spill_path + ".tmp"
+        with open(self.spill_path, "rb") as src, open(tmp, "wb") as dst:
+            src.seek(size)
+            shutil.copyfileobj(src, dst)
+        os.replace(tmp, self.spill_path)
 
+    def _send(self, data: bytes, count: int):
+        if self.sock is None and not self._connect():
+            self._spill(data, count)
+            return
         try:
-            msg = self.format(record)
-            self.sock.sendall((msg + "\n").encode('utf-8'))
-        except Exception as e:
+            self._replay_spill()
+            self.sock.sendall(data)
+            self.sent += count
+        except OSError as e:
             print(f"[LoggerUtils] Error sending log: {e}")
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+            self._spill(data, count)
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            lines = []
+            for record in batch:
+                if record is None:
+                    continue
+                try:
+                    lines.append(self.format(record) + "\n")
+                except Exception:
+                    self.dropped += 1
+            if lines:
+                self._send("".join(lines).encode("utf-8"), len(lines))
+            if stop:
+                return
+
+    def close(self):
+        """Flush what is queued (best effort) and close the socket."""
+        if self._thread.is_alive():
+            try:
+                self.queue.put(None, timeout=1.0)
+                self._thread.join(timeout=2.0)
+            except queue.Full:
+                pass
+        if self.sock:
+            self.sock.close()
             self.sock = None
+        super().close()
 
 
 def get_logger(source: str, log_type: str, level=logging.INFO,
@@ -76,7 +227,8 @@ def get_logger(source: str, log_type: str, level=logging.INFO,
     logger.addHandler(console_handler)
 
     # Socket handler
-    socket_handler = SocketStreamHandler(log_server_ip, log_server_port)
+    spill_path = os.path.join(LOG_SPILL_DIR, f"{logger_name.replace(' ', '_')}.spill") if LOG_SPILL_DIR else None
+    socket_handler = SocketStreamHandler(log_server_ip, log_server_port, spill_path=spill_path)
     socket_handler.setFormatter(formatter)
     socket_handler.setLevel(level)
     logger.addHandler(socket_handler)
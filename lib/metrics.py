@@ -0,0 +1,441 @@
+"""
+Metric channel: numeric timing samples kept apart from the text logs.
+
+Every sample updates an in-process log-linear (HDR-style) histogram per
+(component, name). Histogram snapshots are shipped periodically; individual
+samples are shipped too unless SE_METRICS_SAMPLES=0. Samples are appended to a
+bounded deque (append/popleft are atomic, so the recording path takes no lock
+for them) and a background thread ships everything to the log server's metric
+port using compact binary frames:
+
+    frame     := !I length of the rest | !4sH magic, item count | item*
+    b"SEM1"   sample    := !qqBBH ts_ns, duration_ns, len(component), len(name), len(labels)
+                           component | name | labels (utf-8; labels is "k=v,k=v" or empty)
+    b"SEH2"   (header followed by !I pid of the sender, whose snapshots replace each other)
+              histogram := !BB len(component), len(name) | component | name
+                           | !QQQQH count, total_ns, min_ns, max_ns, bucket count | (!HQ index, count)*
+"""
+import os
+import json
+import time
+import signal
+import struct
+import socket
+import threading
+from urllib.parse import urlparse, parse_qs
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import lib.global_config as cfg
+
+METRICS_PORT        = int(os.environ.get("SE_METRICS_PORT", "5001"))
+METRICS_HOST        = os.environ.get("SE_METRICS_HOST", "")     # empty: same host as the log server
+METRICS_SAMPLES     = os.environ.get("SE_METRICS_SAMPLES", "1") == "1"   # ship every sample, not only histograms
+METRICS_HTTP_PORT   = int(os.environ.get("SE_METRICS_HTTP_PORT", "9100"))
+METRICS_ENABLED     = os.environ.get("SE_METRICS_ENABLED", "1") == "1"
+METRICS_SAMPLE_RATE = float(os.environ.get("SE_METRICS_SAMPLE_RATE", "1.0"))   # fraction of root calls traced
+HIST_EXPORT_INTERVAL = 10.0     # seconds between histogram snapshots
+HIST_SUB_BITS       = 5         # 2^(5-1) = 16 sub-buckets per power of two; midpoints are off by at most 1/32 (~3%)
+METRICS_BUFFER      = 65536     # samples held before the oldest are dropped
+METRICS_BATCH       = 1024      # samples per frame
+FLUSH_INTERVAL      = 0.5       # seconds
+RECONNECT_MAX       = 30.0
+CONNECT_TIMEOUT     = 2.0
+
+FRAME_MAGIC         = b"SEM1"
+HIST_MAGIC          = b"SEH2"
+_LEN                = struct.Struct("!I")
+_HEADER             = struct.Struct("!4sH")
+_HIST_PID           = struct.Struct("!I")
+_SAMPLE             = struct.Struct("!qqBBH")
+_HIST_NAMES         = struct.Struct("!BB")
+_HIST_TOTALS        = struct.Struct("!QQQQH")
+_HIST_BUCKET        = struct.Struct("!HQ")
+
+
+class _Settings:
+    """Runtime switches read by lib/performance_monitor on every decorated call."""
+    __slots__ = ("enabled", "sample_rate")
+
+    def __init__(self):
+        self.enabled = METRICS_ENABLED
+        self.sample_rate = METRICS_SAMPLE_RATE
+
+
+SETTINGS = _Settings()
+
+
+def set_enabled(enabled: bool | None = None, sample_rate: float | None = None) -> dict:
+    if enabled is not None:
+        SETTINGS.enabled = bool(enabled)
+    if sample_rate is not None:
+        SETTINGS.sample_rate = min(1.0, max(0.0, float(sample_rate)))
+    return {"enabled": SETTINGS.enabled, "sample_rate": SETTINGS.sample_rate}
+
+
+def install_signal_toggle(sig=signal.SIGUSR2):
+    """`kill -USR2 <pid>` flips timing collection on/off (main thread only)."""
+    def _toggle(signum, frame):
+        state = set_enabled(not SETTINGS.enabled)
+        print(f"[Metrics] timing collection {'enabled' if state['enabled'] else 'disabled'}")
+    try:
+        signal.signal(sig, _toggle)
+    except ValueError:
+        pass  # not called from the main thread
+
+
+# ---------------- Histograms ----------------
+_SUB = 1 << HIST_SUB_BITS
+_HALF = _SUB >> 1
+
+
+def _bucket_index(v: int) -> int:
+    if v < _SUB:
+        return v
+    shift = v.bit_length() - HIST_SUB_BITS
+    return _SUB + (shift - 1) * _HALF + ((v >> shift) - _HALF)
+
+
+def _bucket_value(idx: int) -> int:
+    """Midpoint of the value range covered by bucket `idx`."""
+    if idx < _SUB:
+        return idx
+    shift, top = divmod(idx - _SUB, _HALF)
+    shift += 1
+    return ((top + _HALF) << shift) + (1 << (shift - 1))
+
+
+class Histogram:
+    """Log-linear histogram of durations in ns; records in O(1), memory bounded by the value range."""
+    __slots__ = ("counts", "count", "total", "min", "max", "lock")
+
+    def __init__(self):
+        self.counts: dict[int, int] = {}
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+        self.lock = threading.Lock()
+
+    def record(self, v: int):
+        idx = _bucket_index(v) if v > 0 else 0
+        with self.lock:
+            self.counts[idx] = self.counts.get(idx, 0) + 1
+            if not self.count or v < self.min:
+                self.min = v
+            if v > self.max:
+                self.max = v
+            self.count += 1
+            self.total += v
+
+    def merge(self, other: "Histogram"):
+        with other.lock:
+            counts, count, total, lo, hi = dict(other.counts), other.count, other.total, other.min, other.max
+        if not count:
+            return
+        with self.lock:
+            for idx, c in counts.items():
+                self.counts[idx] = self.counts.get(idx, 0) + c
+            self.min = lo if not self.count else min(self.min, lo)
+            self.max = max(self.max, hi)
+            self.count += count
+            self.total += total
+
+    def percentile(self, p: float) -> int:
+        with self.lock:
+            if not self.count:
+                return 0
+            rank = max(1, int(round(p / 100.0 * self.count)))
+            seen = 0
+            for idx in sorted(self.counts):
+                seen += self.counts[idx]
+                if seen >= rank:
+                    return min(max(_bucket_value(idx), self.min), self.max)
+            return self.max
+
+    def summary(self) -> dict:
+        ms = 1e6
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count / ms if self.count else 0.0,
+            "p50_ms": self.percentile(50) / ms,
+            "p90_ms": self.percentile(90) / ms,
+            "p99_ms": self.percentile(99) / ms,
+            "max_ms": self.max / ms,
+        }
+
+
+def summarize(histograms: dict) -> list[dict]:
+    """{(component, name): Histogram} -> sorted list of summary rows."""
+    return [{"component": c, "name": n, **h.summary()} for (c, n), h in sorted(histograms.items())]
+
+
+def encode_labels(labels: dict | None) -> bytes:
+    if not labels:
+        return b""
+    return ",".join(f"{k}={v}" for k, v in labels.items()).encode()
+
+
+def decode_labels(raw: bytes) -> dict:
+    if not raw:
+        return {}
+    return dict(item.split("=", 1) for item in raw.decode().split(","))
+
+
+def encode_frame(samples) -> bytes:
+    """samples: iterable of (ts_ns, duration_ns, component, name, labels_bytes)."""
+    parts = []
+    count = 0
+    for ts_ns, duration_ns, component, name, labels in samples:
+        c, n = component.encode(), name.encode()
+        parts.append(_SAMPLE.pack(ts_ns, duration_ns, len(c), len(n), len(labels)))
+        parts.append(c); parts.append(n); parts.append(labels)
+        count += 1
+    body = _HEADER.pack(FRAME_MAGIC, count) + b"".join(parts)
+    return _LEN.pack(len(body)) + body
+
+
+def encode_histograms(histograms: dict, pid: int | None = None) -> bytes:
+    parts = [_HIST_PID.pack(os.getpid() if pid is None else pid)]
+    for (component, name), h in histograms.items():
+        with h.lock:
+            counts, count, total, lo, hi = list(h.counts.items()), h.count, h.total, h.min, h.max
+        c, n = component.encode(), name.encode()
+        parts.append(_HIST_NAMES.pack(len(c), len(n)) + c + n)
+        parts.append(_HIST_TOTALS.pack(count, total, lo, hi, len(counts)))
+        parts.extend(_HIST_BUCKET.pack(idx, cnt) for idx, cnt in counts)
+    body = _HEADER.pack(HIST_MAGIC, len(histograms)) + b"".join(parts)
+    return _LEN.pack(len(body)) + body
+
+
+def _decode_histograms(body: bytes, count: int) -> tuple[int, dict]:
+    (pid,) = _HIST_PID.unpack_from(body, _HEADER.size)
+    off = _HEADER.size + _HIST_PID.size
+    out = {}
+    for _ in range(count):
+        lc, ln = _HIST_NAMES.unpack_from(body, off); off += _HIST_NAMES.size
+        component = body[off:off + lc].decode(); off += lc
+        name = body[off:off + ln].decode(); off += ln
+        h = Histogram()
+        h.count, h.total, h.min, h.max, nb = _HIST_TOTALS.unpack_from(body, off); off += _HIST_TOTALS.size
+        for _ in range(nb):
+            idx, cnt = _HIST_BUCKET.unpack_from(body, off); off += _HIST_BUCKET.size
+            h.counts[idx] = cnt
+        out[(component, name)] = h
+    return pid, out
+
+
+def decode_frame(body: bytes) -> tuple[bytes, list | dict]:
+    """
+    Inverse of encode_frame / encode_histograms, without the leading length prefix.
+    Returns (FRAME_MAGIC, [sample, ...]) or (HIST_MAGIC, (pid, {(component, name): Histogram})).
+    """
+    magic, count = _HEADER.unpack_from(body, 0)
+    if magic == HIST_MAGIC:
+        return magic, _decode_histograms(body, count)
+    if magic != FRAME_MAGIC:
+        raise ValueError("bad metric frame magic")
+    off = _HEADER.size
+    out = []
+    for _ in range(count):
+        ts_ns, duration_ns, lc, ln, ll = _SAMPLE.unpack_from(body, off)
+        off += _SAMPLE.size
+        component = body[off:off + lc].decode(); off += lc
+        name = body[off:off + ln].decode(); off += ln
+        labels = body[off:off + ll]; off += ll
+        out.append((ts_ns, duration_ns, component, name, labels))
+    return magic, out
+
+
+async def read_frames(reader):
+    """Async generator over decoded (magic, items) frames from an asyncio StreamReader."""
+    while True:
+        try:
+            head = await reader.readexactly(_LEN.size)
+            body = await reader.readexactly(_LEN.unpack(head)[0])
+        except Exception:
+            return
+        yield decode_frame(body)
+
+
+class MetricsExporter:
+    """Buffers samples and flushes them to one metric server from a daemon thread."""
+    def __init__(self, host: str, port: int = METRICS_PORT, buffer_size: int = METRICS_BUFFER):
+        self.host = host
+        self.port = port
+        self.buffer: deque = deque(maxlen=buffer_size)
+        self.histograms: dict[tuple[str, str], Histogram] = {}
+        self.sock = None
+        self.sent = 0
+        self.dropped = 0
+        self._backoff = FLUSH_INTERVAL
+        self._next_connect = 0.0
+        threading.Thread(target=self._run, name=f"metrics-{host}:{port}", daemon=True).start()
+
+    def histogram(self, component: str, name: str) -> Histogram:
+        h = self.histograms.get((component, name))
+        if h is None:
+            h = self.histograms.setdefault((component, name), Histogram())
+        return h
+
+    def record(self, component: str, name: str, duration_ns: int, labels: bytes = b""):
+        self.histogram(component, name).record(duration_ns)
+        if not METRICS_SAMPLES:
+            return
+        if len(self.buffer) == self.buffer.maxlen:
+            self.dropped += 1   # the deque discards the oldest sample
+        self.buffer.append((time.time_ns(), duration_ns, component, name, labels))
+
+    def _connect(self) -> bool:
+        now = time.monotonic()
+        if now < self._next_connect:
+            return False
+        try:
+            self.sock = socket.create_connection((self.host, self.port), timeout=CONNECT_TIMEOUT)
+            self.sock.settimeout(None)
+            self._backoff = FLUSH_INTERVAL
+            return True
+        except OSError:
+            self.sock = None
+            self._next_connect = now + self._backoff
+            self._backoff = min(self._backoff * 2, RECONNECT_MAX)
+            return False
+
+    def flush(self):
+        buf = self.buffer
+        while buf:
+            batch = []
+            try:
+                while len(batch) < METRICS_BATCH:
+                    batch.append(buf.popleft())
+            except IndexError:
+                pass
+            if self.sock is None and not self._connect():
+                self.dropped += len(batch)
+                continue
+            try:
+                self.sock.sendall(encode_frame(batch))
+                self.sent += len(batch)
+            except OSError:
+                self.sock.close()
+                self.sock = None
+                self.dropped += len(batch)
+
+    def export_histograms(self):
+        if not self.histograms or (self.sock is None and not self._connect()):
+            return
+        try:
+            self.sock.sendall(encode_histograms(dict(self.histograms)))
+        except OSError:
+            self.sock.close()
+            self.sock = None
+
+    def _run(self):
+        next_export = time.monotonic() + HIST_EXPORT_INTERVAL
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            self.flush()
+            if time.monotonic() >= next_export:
+                next_export += HIST_EXPORT_INTERVAL
+                self.export_histograms()
+
+    def stats(self) -> dict:
+        return {"buffered": len(self.buffer), "sent": self.sent, "dropped": self.dropped,
+                "connected": self.sock is not None}
+
+
+_exporters: dict[str, MetricsExporter] = {}
+_exporters_lock = threading.Lock()
+
+
+def get_exporter(host: str | None = None) -> MetricsExporter:
+    """One exporter per destination host, created on first use."""
+    host = host or METRICS_HOST or cfg.logs_server_address[0]
+    exporter = _exporters.get(host)
+    if exporter is None:
+        with _exporters_lock:
+            exporter = _exporters.get(host)
+            if exporter is None:
+                exporter = _exporters[host] = MetricsExporter(host)
+    return exporter
+
+
+def exporter_for_logger(logger) -> MetricsExporter:
+    """Send metrics to the same host as the logger's log-server handler, if it has one."""
+    for handler in getattr(logger, "handlers", ()):
+        host = getattr(handler, "host", None)
+        if host:
+            return get_exporter(host)
+    return get_exporter()
+
+
+def local_histograms() -> dict:
+    """Histograms of this process, merged across exporters."""
+    merged: dict[tuple[str, str], Histogram] = {}
+    for exporter in list(_exporters.values()):
+        for key, h in list(exporter.histograms.items()):
+            merged.setdefault(key, Histogram()).merge(h)
+    return merged
+
+
+_stats_providers: dict = {}
+
+
+def register_stats(name: str, provider):
+    """Serve provider() (a JSON-able dict, e.g. queue depths) under GET /metrics/stats."""
+    _stats_providers[name] = provider
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def _reply(self, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlparse(self.path).path.rstrip("/")
+        if path in ("/metrics", "/api/metrics"):
+            self._reply(summarize(local_histograms()))
+        elif path == "/metrics/settings":
+            self._reply(set_enabled())
+        elif path == "/metrics/stats":
+            self._reply({name: provider() for name, provider in list(_stats_providers.items())})
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        # POST /metrics/settings?enabled=0|1&sample_rate=0.1
+        url = urlparse(self.path)
+        if url.path.rstrip("/") != "/metrics/settings":
+            self.send_error(404)
+            return
+        q = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            enabled = q["enabled"] in ("1", "true", "on") if "enabled" in q else None
+            self._reply(set_enabled(enabled, q.get("sample_rate")))
+        except ValueError:
+            self.send_error(400)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_http(port: int = METRICS_HTTP_PORT, bind_ip: str = "0.0.0.0"):
+    """
+    Serve this daemon's latency histograms as JSON on GET /metrics (background thread),
+    with GET/POST /metrics/settings to switch collection and sampling at runtime
+    and GET /metrics/stats for the gauges added with register_stats().
+    Also installs the SIGUSR2 toggle when called from the main thread.
+    """
+    install_signal_toggle()
+    try:
+        server = ThreadingHTTPServer((bind_ip, port), _MetricsRequestHandler)
+    except OSError as e:
+        print(f"[Metrics] HTTP endpoint on port {port} unavailable: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
@@ -0,0 +1,194 @@
+"""
+Neighbor (ARP) table watcher, replacing `arp -en` polling.
+
+NeighborCache loads the neighbor table with one dump, then follows
+RTM_NEWNEIGH / RTM_DELNEIGH notifications on a background thread and keeps
+MAC <-> IP maps per interface. Coroutines waiting for a station's address with
+wait_for_ip() are woken by the notification that adds it:
+
+    neighbors = NeighborCache()
+    neighbors.start()
+    ip = await neighbors.wait_for_ip("02:00:00:aa:bb:cc", timeout=5, ifname="wlan0")
+"""
+import errno
+import socket
+import struct
+import asyncio
+import logging
+import threading
+
+from lib.netlink import rtnl
+
+NDMSG = struct.Struct("=BxxxiHBB")    # family, ifindex, state, flags, type
+
+NDA_DST    = 1
+NDA_LLADDR = 2
+
+NUD_INCOMPLETE = 0x01
+NUD_FAILED     = 0x20
+NUD_UNUSABLE   = NUD_INCOMPLETE | NUD_FAILED     # entries `arp -en` shows without a usable MAC
+
+logger = logging.getLogger(__name__)
+
+
+def _mac(lladdr: bytes) -> str:
+    return ":".join(f"{b:02x}" for b in lladdr)
+
+
+def parse_neighbor(payload: bytes):
+    """(ifindex, ip, mac or None, state) of an RTM_*NEIGH payload, None without a destination."""
+    family, ifindex, state, _flags, _type = NDMSG.unpack_from(payload)
+    attrs = rtnl.parse_attrs(payload, NDMSG.size)
+    dst = attrs.get(NDA_DST)
+    if not dst:
+        return None
+    ip = socket.inet_ntop(family, dst)
+    lladdr = attrs.get(NDA_LLADDR)
+    return ifindex, ip, _mac(lladdr) if lladdr else None, state
+
+
+class NeighborCache:
+    def __init__(self, family: int = socket.AF_INET):
+        self.family = family
+        self.by_mac: dict[int, dict[str, str]] = {}     # ifindex -> mac -> ip
+        self.by_ip: dict[int, dict[str, str]] = {}      # ifindex -> ip -> mac
+        self.events = 0
+        self.resyncs = 0
+        self._waiters: dict[str, list] = {}            # mac -> [(loop, future, ifindex or None)]
+        self._lock = threading.RLock()
+        self._ifindex: dict[str, int] = {}
+        self._listener = None
+        self._thread = None
+
+    def _index(self, ifname: str | None) -> int | None:
+        if not ifname:
+            return None
+        if ifname not in self._ifindex:
+            self._ifindex[ifname] = socket.if_nametoindex(ifname)
+        return self._ifindex[ifname]
+
+    # ---------------- table ----------------
+    def _set(self, ifindex: int, ip: str, mac: str):
+        old = self.by_ip.setdefault(ifindex, {}).get(ip)
+        if old == mac:
+            return
+        if old is not None and self.by_mac[ifindex].get(old) == ip:
+            del self.by_mac[ifindex][old]
+        self.by_ip[ifindex][ip] = mac
+        self.by_mac.setdefault(ifindex, {})[mac] = ip
+        for waiter in self._waiters.pop(mac, []):
+            loop, future, wanted = waiter
+            if wanted is not None and wanted != ifindex:
+                self._waiters.setdefault(mac, []).append(waiter)
+                continue
+            loop.call_soon_threadsafe(lambda f=future: f.done() or f.set_result(ip))
+
+    def _unset(self, ifindex: int, ip: str):
+        mac = self.by_ip.get(ifindex, {}).pop(ip, None)
+        if mac is not None and self.by_mac[ifindex].get(mac) == ip:
+            del self.by_mac[ifindex][mac]
+
+    def _apply(self, msg_type: int, payload: bytes):
+        neighbor = parse_neighbor(payload)
+        if neighbor is None:
+            return
+        ifindex, ip, mac, state = neighbor
+        with self._lock:
+            if msg_type == rtnl.RTM_NEWNEIGH and mac and not state & NUD_UNUSABLE:
+                self._set(ifindex, ip, mac)
+            else:
+                self._unset(ifindex, ip)
+
+    def resync(self):
+        """Reload the whole table with one dump (start-up and after lost notifications)."""
+        sock = rtnl.RtnlSocket()
+        try:
+            answers = sock.dump(rtnl.RTM_GETNEIGH, NDMSG.pack(self.family, 0, 0, 0, 0))
+        finally:
+            sock.close()
+        with self._lock:
+            self.by_mac.clear()
+            self.by_ip.clear()
+            for msg_type, payload in answers:
+                self._apply(msg_type, payload)
+            self.resyncs += 1
+
+    # ---------------- listener ----------------
+    def start(self):
+        # subscribe before the dump so that no change falls between the two
+        self._listener = rtnl.RtnlSocket(groups=rtnl.RTMGRP_NEIGH)
+        self.resync()
+        self._thread = threading.Thread(target=self._run, name="neighbor-cache", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+
+    def _run(self):
+        while self._listener is not None:
+            try:
+                messages = self._listener.recv()
+            except OSError as e:
+                if self._listener is None:
+                    return
+                if e.errno == errno.ENOBUFS:
+                    # the kernel dropped notifications; the table may be stale
+                    logger.warning("Neighbor notifications overflowed, reloading the neighbor table")
+                    self.resync()
+                    continue
+                logger.error(f"Neighbor listener stopped: {e!r}")
+                return
+            for msg_type, _flags, _seq, payload in messages:
+                if msg_type in (rtnl.RTM_NEWNEIGH, rtnl.RTM_DELNEIGH):
+                    self.events += 1
+                    self._apply(msg_type, payload)
+
+    # ---------------- lookups ----------------
+    def ip_for_mac(self, mac: str, ifname: str | None = None) -> str | None:
+        mac = mac.lower()
+        ifindex = self._index(ifname)
+        with self._lock:
+            for index, macs in self.by_mac.items():
+                if (ifindex is None or index == ifindex) and mac in macs:
+                    return macs[mac]
+        return None
+
+    def mac_for_ip(self, ip: str, ifname: str | None = None) -> str | None:
+        ifindex = self._index(ifname)
+        with self._lock:
+            for index, ips in self.by_ip.items():
+                if (ifindex is None or index == ifindex) and ip in ips:
+                    return ips[ip]
+        return None
+
+    async def wait_for_ip(self, mac: str, timeout: float = 5.0, ifname: str | None = None) -> str | None:
+        """IP of `mac`, waiting up to `timeout` seconds for its neighbor entry; None on timeout."""
+        mac = mac.lower()
+        ifindex = self._index(ifname)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiter = (loop, future, ifindex)
+        with self._lock:
+            ip = self.ip_for_mac(mac, ifname)
+            if ip is not None:
+                return ip
+            self._waiters.setdefault(mac, []).append(waiter)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(mac)
+                if waiters and waiter in waiters:
+                    waiters.remove(waiter)
+                    if not waiters:
+                        del self._waiters[mac]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": sum(len(ips) for ips in self.by_ip.values()), "events": self.events,
+                    "resyncs": self.resyncs, "waiting": sum(len(w) for w in self._waiters.values())}
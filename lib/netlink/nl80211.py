@@ -0,0 +1,160 @@
+"""
+Station events from nl80211, replacing the text output of `iw event`.
+
+Nl80211Listener joins the "mlme" multicast group of the nl80211 generic
+netlink family and yields a StationEvent for every NL80211_CMD_NEW_STATION
+and NL80211_CMD_DEL_STATION. FakeStationEvents replays a recorded list or
+JSON-lines file with the same interface, so station handling can be driven
+without a radio:
+
+    for event in Nl80211Listener(ifname="wlan0").events():
+        print(event.kind, event.mac, event.ifname)
+"""
+import json
+import time
+import errno
+import socket
+import struct
+import logging
+from typing import NamedTuple
+
+from lib.netlink import rtnl
+
+GENL_ID_CTRL         = 0x10
+CTRL_CMD_GETFAMILY   = 3
+CTRL_ATTR_FAMILY_ID   = 1
+CTRL_ATTR_FAMILY_NAME = 2
+CTRL_ATTR_MCAST_GROUPS = 7
+CTRL_ATTR_MCAST_GRP_NAME = 1
+CTRL_ATTR_MCAST_GRP_ID   = 2
+
+GENLMSGHDR = struct.Struct("=BBH")    # cmd, version, reserved
+
+NL80211_CMD_NEW_STATION = 19
+NL80211_CMD_DEL_STATION = 20
+NL80211_ATTR_IFINDEX    = 3
+NL80211_ATTR_MAC        = 6
+
+# event kinds, named like the words of `iw event`
+NEW_STATION = "new"
+DEL_STATION = "del"
+STATION_COMMANDS = {NL80211_CMD_NEW_STATION: NEW_STATION, NL80211_CMD_DEL_STATION: DEL_STATION}
+
+logger = logging.getLogger(__name__)
+
+
+class StationEvent(NamedTuple):
+    kind: str             # NEW_STATION or DEL_STATION
+    mac: str
+    ifname: str
+    ifindex: int
+    timestamp: float      # wall clock, time.time()
+    monotonic: float      # time.monotonic() at reception, for latency measurements
+
+    def to_json(self) -> str:
+        return json.dumps({"kind": self.kind, "mac": self.mac, "ifname": self.ifname,
+                           "ifindex": self.ifindex, "timestamp": self.timestamp})
+
+
+def resolve_family(sock: rtnl.RtnlSocket, name: str) -> tuple[int, dict[str, int]]:
+    """Family id and {multicast group name: group id} of a generic netlink family."""
+    body = GENLMSGHDR.pack(CTRL_CMD_GETFAMILY, 1, 0) + rtnl.nla_str(CTRL_ATTR_FAMILY_NAME, name)
+    for _type, payload in sock.dump(GENL_ID_CTRL, body, flags=rtnl.NLM_F_ACK):
+        attrs = rtnl.parse_attrs(payload, GENLMSGHDR.size)
+        groups = {}
+        for group in rtnl.parse_attrs(attrs.get(CTRL_ATTR_MCAST_GROUPS, b"")).values():
+            group_attrs = rtnl.parse_attrs(group)
+            groups[rtnl.attr_str(group_attrs, CTRL_ATTR_MCAST_GRP_NAME)] = rtnl.attr_u32(group_attrs,
+                                                                                         CTRL_ATTR_MCAST_GRP_ID)
+        return rtnl.attr_u16(attrs, CTRL_ATTR_FAMILY_ID), groups
+    raise OSError(errno.ENOENT, f"generic netlink family {name} not found")
+
+
+class Nl80211Listener:
+    """NEW_STATION / DEL_STATION events of one interface (all interfaces if ifname is None)."""
+    def __init__(self, ifname: str | None = None):
+        self.ifname = ifname
+        self.sock = rtnl.RtnlSocket(protocol=rtnl.NETLINK_GENERIC)
+        self.family_id, groups = resolve_family(self.sock, "nl80211")
+        if "mlme" not in groups:
+            raise OSError(errno.ENOENT, "nl80211 has no mlme multicast group")
+        self.sock.join_group(groups["mlme"])
+        self.ifindex = socket.if_nametoindex(ifname) if ifname else None
+        self.lost = 0
+        self._names: dict[int, str] = {}
+
+    def _ifname(self, ifindex: int) -> str:
+        if ifindex not in self._names:
+            try:
+                self._names[ifindex] = socket.if_indextoname(ifindex)
+            except OSError:
+                return str(ifindex)
+        return self._names[ifindex]
+
+    def parse(self, payload: bytes) -> StationEvent | None:
+        cmd = payload[0]
+        kind = STATION_COMMANDS.get(cmd)
+        if kind is None:
+            return None
+        attrs = rtnl.parse_attrs(payload, GENLMSGHDR.size)
+        ifindex = rtnl.attr_u32(attrs, NL80211_ATTR_IFINDEX, 0)
+        mac = attrs.get(NL80211_ATTR_MAC)
+        if not mac or (self.ifindex is not None and ifindex != self.ifindex):
+            return None
+        return StationEvent(kind, ":".join(f"{b:02x}" for b in mac[:6]), self._ifname(ifindex), ifindex,
+                            time.time(), time.monotonic())
+
+    def events(self):
+        """Blocking generator of StationEvents."""
+        while True:
+            try:
+                messages = self.sock.recv()
+            except OSError as e:
+                if e.errno != errno.ENOBUFS:
+                    raise
+                # events were dropped by the kernel while we were busy; keep listening
+                self.lost += 1
+                logger.warning(f"nl80211 events lost ({self.lost} overflow(s) so far)")
+                continue
+            for msg_type, _flags, _seq, payload in messages:
+                if msg_type == self.family_id:
+                    event = self.parse(payload)
+                    if event is not None:
+                        yield event
+
+    def close(self):
+        self.sock.close()
+
+
+class FakeStationEvents:
+    """
+    Replays StationEvents from a list of dicts or a JSON-lines file (one
+    {"kind", "mac", "ifname", "timestamp"} per line, as written by
+    StationEvent.to_json). With realtime=True the original spacing is kept,
+    divided by `speed`; otherwise events are yielded back to back.
+    """
+    def __init__(self, events, realtime: bool = False, speed: float = 1.0):
+        self.records = list(events)
+        self.realtime = realtime
+        self.speed = speed
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> "FakeStationEvents":
+        with open(path) as f:
+            return cls((json.loads(line) for line in f if line.strip()), **kwargs)
+
+    def events(self):
+        first = None
+        started = time.monotonic()
+        for record in self.records:
+            ts = record.get("timestamp", 0.0)
+            if self.realtime:
+                first = ts if first is None else first
+                delay = (ts - first) / self.speed - (time.monotonic() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            yield StationEvent(record["kind"], record["mac"].lower(), record.get("ifname", ""),
+                               record.get("ifindex", 0), ts or time.time(), time.monotonic())
+
+    def close(self):
+        pass
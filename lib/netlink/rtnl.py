@@ -0,0 +1,213 @@
+"""
+Minimal rtnetlink (NETLINK_ROUTE) client on a raw AF_NETLINK socket; the
+same socket class also serves generic netlink (see nl80211.py).
+
+Only what the access point needs: building and parsing netlink messages and
+their attributes, dumps, and request batches. A batch is several requests
+packed into one datagram; the kernel processes them in order and answers each
+with its own ACK, so N link operations cost one send and no process spawns.
+"""
+import os
+import struct
+import socket
+import threading
+
+NETLINK_ROUTE   = 0
+NETLINK_GENERIC = 16
+SOL_NETLINK     = 270
+NETLINK_ADD_MEMBERSHIP = 1
+
+# message types
+NLMSG_ERROR   = 2
+NLMSG_DONE    = 3
+RTM_NEWLINK   = 16
+RTM_DELLINK   = 17
+RTM_GETLINK   = 18
+RTM_NEWNEIGH  = 28
+RTM_DELNEIGH  = 29
+RTM_GETNEIGH  = 30
+
+# message flags
+NLM_F_REQUEST = 0x001
+NLM_F_MULTI   = 0x002
+NLM_F_ACK     = 0x004
+NLM_F_DUMP    = 0x300
+NLM_F_EXCL    = 0x200
+NLM_F_CREATE  = 0x400
+
+# multicast groups (bit masks for bind())
+RTMGRP_LINK   = 0x1
+RTMGRP_NEIGH  = 0x4
+
+NLA_F_NESTED   = 0x8000
+NLA_TYPE_MASK  = 0x3fff
+
+NLMSGHDR = struct.Struct("=IHHII")     # len, type, flags, seq, pid
+NLATTR   = struct.Struct("=HH")        # len, type
+NLMSGERR = struct.Struct("=i")         # error, followed by the offending header
+
+RECV_BUFFER = 1 << 16
+
+
+def _align(n: int) -> int:
+    return (n + 3) & ~3
+
+
+# ---------------- attributes ----------------
+def nla(attr_type: int, payload: bytes) -> bytes:
+    length = NLATTR.size + len(payload)
+    return NLATTR.pack(length, attr_type) + payload + b"\0" * (_align(length) - length)
+
+
+def nla_u16(attr_type: int, value: int) -> bytes:
+    return nla(attr_type, struct.pack("=H", value))
+
+
+def nla_be16(attr_type: int, value: int) -> bytes:
+    return nla(attr_type, struct.pack("!H", value))
+
+
+def nla_u32(attr_type: int, value: int) -> bytes:
+    return nla(attr_type, struct.pack("=I", value))
+
+
+def nla_str(attr_type: int, value: str) -> bytes:
+    return nla(attr_type, value.encode() + b"\0")
+
+
+def nla_nested(attr_type: int, *attrs: bytes) -> bytes:
+    return nla(attr_type | NLA_F_NESTED, b"".join(attrs))
+
+
+def parse_attrs(data: bytes, offset: int = 0) -> dict:
+    """{type: payload} of the attributes in data[offset:]; nested ones are left as bytes."""
+    attrs = {}
+    end = len(data)
+    while offset + NLATTR.size <= end:
+        length, attr_type = NLATTR.unpack_from(data, offset)
+        if length < NLATTR.size:
+            break
+        attrs[attr_type & NLA_TYPE_MASK] = data[offset + NLATTR.size:offset + length]
+        offset += _align(length)
+    return attrs
+
+
+def attr_u16(attrs: dict, attr_type: int, default=None):
+    value = attrs.get(attr_type)
+    return struct.unpack("=H", value[:2])[0] if value and len(value) >= 2 else default
+
+
+def attr_be16(attrs: dict, attr_type: int, default=None):
+    value = attrs.get(attr_type)
+    return struct.unpack("!H", value[:2])[0] if value and len(value) >= 2 else default
+
+
+def attr_u32(attrs: dict, attr_type: int, default=None):
+    value = attrs.get(attr_type)
+    return struct.unpack("=I", value[:4])[0] if value and len(value) >= 4 else default
+
+
+def attr_str(attrs: dict, attr_type: int, default=None):
+    value = attrs.get(attr_type)
+    return value.split(b"\0", 1)[0].decode(errors="replace") if value is not None else default
+
+
+# ---------------- messages ----------------
+def parse_messages(data: bytes):
+    """Yield (type, flags, seq, payload) for every netlink message in one datagram."""
+    offset = 0
+    while offset + NLMSGHDR.size <= len(data):
+        length, msg_type, flags, seq, _pid = NLMSGHDR.unpack_from(data, offset)
+        if length < NLMSGHDR.size:
+            break
+        yield msg_type, flags, seq, data[offset + NLMSGHDR.size:offset + length]
+        offset += _align(length)
+
+
+class RtnlSocket:
+    """
+    One netlink socket, NETLINK_ROUTE unless `protocol` says otherwise.
+    `groups` subscribes to multicast notifications (RTMGRP_*); sockets used
+    for requests leave it at 0. Requests are serialized with a lock so the
+    socket can be shared between threads.
+    """
+    def __init__(self, groups: int = 0, protocol: int = NETLINK_ROUTE):
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, protocol)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        self.sock.bind((0, groups))
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def fileno(self) -> int:
+        return self.sock.fileno()
+
+    def close(self):
+        self.sock.close()
+
+    def join_group(self, group: int):
+        """Subscribe to a multicast group by number (generic netlink groups do not fit the bind() mask)."""
+        self.sock.setsockopt(SOL_NETLINK, NETLINK_ADD_MEMBERSHIP, group)
+
+    def _next_seq(self) -> int:
+        self._seq = (self._seq + 1) & 0xffffffff or 1
+        return self._seq
+
+    def _pack(self, msg_type: int, flags: int, body: bytes) -> tuple[int, bytes]:
+        seq = self._next_seq()
+        length = NLMSGHDR.size + len(body)
+        return seq, NLMSGHDR.pack(length, msg_type, flags, seq, 0) + body + b"\0" * (_align(length) - length)
+
+    def recv(self):
+        """Messages of one datagram, for multicast listeners."""
+        return list(parse_messages(self.sock.recv(RECV_BUFFER)))
+
+    def batch(self, requests) -> list[int]:
+        """
+        Send [(msg_type, flags, body), ...] in one datagram, each with
+        NLM_F_REQUEST | NLM_F_ACK, and wait for all ACKs. Returns the result
+        of every request in order: 0 on success, a negative errno otherwise.
+        A failed request does not stop the ones after it.
+        """
+        if not requests:
+            return []
+        with self._lock:
+            seqs, chunks = [], []
+            for msg_type, flags, body in requests:
+                seq, data = self._pack(msg_type, flags | NLM_F_REQUEST | NLM_F_ACK, body)
+                seqs.append(seq)
+                chunks.append(data)
+            self.sock.send(b"".join(chunks))
+            results = {}
+            while len(results) < len(seqs):
+                for msg_type, _flags, seq, payload in parse_messages(self.sock.recv(RECV_BUFFER)):
+                    if msg_type == NLMSG_ERROR and seq in seqs:
+                        results[seq] = NLMSGERR.unpack_from(payload)[0]
+            return [results[seq] for seq in seqs]
+
+    def request(self, msg_type: int, flags: int, body: bytes):
+        """One request; raises OSError if the kernel rejects it."""
+        error = self.batch([(msg_type, flags, body)])[0]
+        if error:
+            raise OSError(-error, os.strerror(-error))
+
+    def dump(self, msg_type: int, body: bytes, flags: int = NLM_F_DUMP):
+        """
+        All (type, payload) answers of an NLM_F_DUMP request. With
+        flags=NLM_F_ACK it reads the replies of a plain request up to its ACK.
+        """
+        with self._lock:
+            seq, data = self._pack(msg_type, NLM_F_REQUEST | flags, body)
+            self.sock.send(data)
+            answers = []
+            while True:
+                for reply_type, _flags, reply_seq, payload in parse_messages(self.sock.recv(RECV_BUFFER)):
+                    if reply_seq != seq:
+                        continue
+                    if reply_type == NLMSG_DONE:
+                        return answers
+                    if reply_type == NLMSG_ERROR:
+                        error = NLMSGERR.unpack_from(payload)[0]
+                        if error:
+                            raise OSError(-error, os.strerror(-error))
+                        return answers
+                    answers.append((reply_type, payload))
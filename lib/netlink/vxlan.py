@@ -0,0 +1,241 @@
+"""
+VXLAN links over rtnetlink, replacing `ip link add/del` and `ip -d link show | awk`.
+
+VxlanManager keeps an index of the VXLAN links on the host (VNI <-> remote IP
+<-> ifname), filled by one link dump at start-up and kept current by the
+manager's own operations. Several operations can be sent as one netlink
+exchange with batch():
+
+    with vxlans.batch() as b:
+        b.delete("se_vxlan7")
+        b.create(7, "192.168.1.20", dev="wlan0")
+"""
+import os
+import socket
+import struct
+import threading
+from typing import NamedTuple
+
+from lib.netlink import rtnl
+
+IFINFOMSG = struct.Struct("=BxHiII")   # family, type, index, flags, change
+IFF_UP    = 0x1
+
+IFLA_IFNAME    = 3
+IFLA_LINKINFO  = 18
+IFLA_INFO_KIND = 1
+IFLA_INFO_DATA = 2
+
+IFLA_VXLAN_ID     = 1
+IFLA_VXLAN_GROUP  = 2     # remote (or multicast group) IPv4 address
+IFLA_VXLAN_LINK   = 3
+IFLA_VXLAN_PORT   = 15    # destination port, network byte order
+IFLA_VXLAN_GROUP6 = 16
+
+DEFAULT_VXLAN_PORT = 4789
+
+
+class VxlanLink(NamedTuple):
+    ifname: str
+    vni: int
+    remote: str | None
+    port: int
+    ifindex: int = 0
+    up: bool = False
+
+
+def _ifinfomsg(index: int = 0, flags: int = 0, change: int = 0) -> bytes:
+    return IFINFOMSG.pack(socket.AF_UNSPEC, 0, index, flags, change)
+
+
+def _pack_ip(ip: str) -> tuple[int, bytes]:
+    if ":" in ip:
+        return IFLA_VXLAN_GROUP6, socket.inet_pton(socket.AF_INET6, ip)
+    return IFLA_VXLAN_GROUP, socket.inet_aton(ip)
+
+
+def parse_vxlan_link(payload: bytes) -> VxlanLink | None:
+    """VxlanLink of an RTM_NEWLINK payload, None if the link is not a VXLAN."""
+    _family, _type, index, flags, _change = IFINFOMSG.unpack_from(payload)
+    attrs = rtnl.parse_attrs(payload, IFINFOMSG.size)
+    linkinfo = attrs.get(IFLA_LINKINFO)
+    if not linkinfo:
+        return None
+    info = rtnl.parse_attrs(linkinfo)
+    if rtnl.attr_str(info, IFLA_INFO_KIND) != "vxlan":
+        return None
+    data = rtnl.parse_attrs(info.get(IFLA_INFO_DATA, b""))
+    remote = None
+    if data.get(IFLA_VXLAN_GROUP):
+        remote = socket.inet_ntop(socket.AF_INET, data[IFLA_VXLAN_GROUP][:4])
+    elif data.get(IFLA_VXLAN_GROUP6):
+        remote = socket.inet_ntop(socket.AF_INET6, data[IFLA_VXLAN_GROUP6][:16])
+    return VxlanLink(ifname=rtnl.attr_str(attrs, IFLA_IFNAME, ""), vni=rtnl.attr_u32(data, IFLA_VXLAN_ID, 0),
+                     remote=remote, port=rtnl.attr_be16(data, IFLA_VXLAN_PORT, DEFAULT_VXLAN_PORT),
+                     ifindex=index, up=bool(flags & IFF_UP))
+
+
+class VxlanBatch:
+    """Link operations collected by VxlanManager.batch() and sent in one exchange on exit."""
+    def __init__(self, manager: "VxlanManager"):
+        self.manager = manager
+        self.ops = []            # (op, VxlanLink or ifname, (msg_type, flags, body))
+        self.results = []        # 0 or -errno per op, filled on exit
+
+    def create(self, vni: int, remote: str, dev: str | None = None, port: int = DEFAULT_VXLAN_PORT,
+               ifname: str | None = None, up: bool = True):
+        """`ip link add <ifname> type vxlan id <vni> dev <dev> remote <remote> dstport <port>` (+ `up`)."""
+        ifname = ifname or f"{self.manager.prefix}{vni}"
+        kind, address = _pack_ip(remote)
+        data = [rtnl.nla_u32(IFLA_VXLAN_ID, vni), rtnl.nla(kind, address), rtnl.nla_be16(IFLA_VXLAN_PORT, port)]
+        if dev:
+            data.append(rtnl.nla_u32(IFLA_VXLAN_LINK, socket.if_nametoindex(dev)))
+        body = _ifinfomsg(flags=IFF_UP if up else 0, change=IFF_UP if up else 0) + \
+            rtnl.nla_str(IFLA_IFNAME, ifname) + \
+            rtnl.nla_nested(IFLA_LINKINFO, rtnl.nla_str(IFLA_INFO_KIND, "vxlan"),
+                            rtnl.nla_nested(IFLA_INFO_DATA, *data))
+        link = VxlanLink(ifname=ifname, vni=vni, remote=remote, port=port, up=up)
+        self.ops.append(("create", link, (rtnl.RTM_NEWLINK, rtnl.NLM_F_CREATE | rtnl.NLM_F_EXCL, body)))
+        return self
+
+    def delete(self, ifname: str):
+        """`ip link del <ifname>`."""
+        body = _ifinfomsg() + rtnl.nla_str(IFLA_IFNAME, ifname)
+        self.ops.append(("delete", ifname, (rtnl.RTM_DELLINK, 0, body)))
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.results = self.manager.commit(self)
+        return False
+
+    def errors(self) -> list[tuple[str, str, OSError]]:
+        """(op, ifname, OSError) of every failed operation."""
+        failed = []
+        for (op, target, _), error in zip(self.ops, self.results):
+            if error:
+                ifname = target if isinstance(target, str) else target.ifname
+                failed.append((op, ifname, OSError(-error, f"{op} {ifname}: {os.strerror(-error)}")))
+        return failed
+
+
+class VxlanManager:
+    def __init__(self, prefix: str = "se_vxlan", sock: rtnl.RtnlSocket | None = None):
+        self.prefix = prefix
+        self.sock = sock or rtnl.RtnlSocket()
+        self.links: dict[str, VxlanLink] = {}      # ifname -> link
+        self.by_vni: dict[int, str] = {}          # vni -> ifname
+        self.by_remote: dict[str, str] = {}       # remote ip -> ifname
+        self._lock = threading.Lock()
+        self.refresh()
+
+    # ---------------- index ----------------
+    def _add(self, link: VxlanLink):
+        self._remove(link.ifname)
+        self.links[link.ifname] = link
+        self.by_vni[link.vni] = link.ifname
+        if link.remote:
+            self.by_remote[link.remote] = link.ifname
+
+    def _remove(self, ifname: str):
+        link = self.links.pop(ifname, None)
+        if link is None:
+            return
+        if self.by_vni.get(link.vni) == ifname:
+            del self.by_vni[link.vni]
+        if link.remote and self.by_remote.get(link.remote) == ifname:
+            del self.by_remote[link.remote]
+
+    def refresh(self):
+        """Rebuild the index from a dump of all links on the host."""
+        links = []
+        for msg_type, payload in self.sock.dump(rtnl.RTM_GETLINK, _ifinfomsg()):
+            if msg_type == rtnl.RTM_NEWLINK:
+                link = parse_vxlan_link(payload)
+                if link is not None:
+                    links.append(link)
+        with self._lock:
+            self.links.clear()
+            self.by_vni.clear()
+            self.by_remote.clear()
+            for link in links:
+                self._add(link)
+
+    def get(self, ifname: str) -> VxlanLink | None:
+        return self.links.get(ifname)
+
+    def find_by_vni(self, vni: int) -> VxlanLink | None:
+        ifname = self.by_vni.get(vni)
+        return self.links.get(ifname) if ifname else None
+
+    def find_by_remote(self, remote: str) -> VxlanLink | None:
+        ifname = self.by_remote.get(remote)
+        return self.links.get(ifname) if ifname else None
+
+    def owned(self) -> list[VxlanLink]:
+        """Links named with this manager's prefix."""
+        return [l for name, l in self.links.items() if name.startswith(self.prefix)]
+
+    def next_free_vni(self, first: int = 1, last: int = 499) -> int:
+        """Lowest VNI in [first, last] not used by any VXLAN on the host, -1 if none is left."""
+        with self._lock:
+            for vni in range(first, last + 1):
+                if vni not in self.by_vni:
+                    return vni
+        return -1
+
+    # ---------------- operations ----------------
+    def batch(self) -> VxlanBatch:
+        return VxlanBatch(self)
+
+    def commit(self, batch: VxlanBatch) -> list[int]:
+        """Send the batch in one netlink exchange and apply the successful operations to the index."""
+        results = self.sock.batch([request for _, _, request in batch.ops])
+        with self._lock:
+            for (op, target, _), error in zip(batch.ops, results):
+                if error:
+                    continue
+                if op == "create":
+                    self._add(target)
+                else:
+                    self._remove(target)
+        return results
+
+    def create(self, vni: int, remote: str, dev: str | None = None, port: int = DEFAULT_VXLAN_PORT,
+               replace: bool = False) -> VxlanLink:
+        """
+        Create and bring up <prefix><vni>. With replace=True, links already
+        using this name or remote are deleted first, in the same exchange.
+        Raises OSError if the link could not be created.
+        """
+        ifname = f"{self.prefix}{vni}"
+        with self.batch() as b:
+            if replace:
+                stale = {ifname} if ifname in self.links else set()
+                existing = self.find_by_remote(remote)
+                if existing is not None and existing.ifname.startswith(self.prefix):
+                    stale.add(existing.ifname)
+                for name in sorted(stale):
+                    b.delete(name)
+            b.create(vni, remote, dev=dev, port=port, ifname=ifname)
+        failed = [e for op, _, e in b.errors() if op == "create"]
+        if failed:
+            raise failed[0]
+        return self.links[ifname]
+
+    def delete(self, ifname: str):
+        """Delete one link; raises OSError (ENODEV if it does not exist)."""
+        with self.batch() as b:
+            b.delete(ifname)
+        for _, _, error in b.errors():
+            raise error
+
+    def delete_all(self) -> list[tuple[str, str, OSError]]:
+        """Delete every link with this manager's prefix in one exchange; returns the failures."""
+        with self.batch() as b:
+            for link in self.owned():
+                b.delete(link.ifname)
+        return b.errors()
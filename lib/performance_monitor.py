@@ -1,43 +1,142 @@
+import os
+import re
 import time
+import uuid
+import random
 import asyncio
+import itertools
+import contextvars
+from contextlib import contextmanager
 from functools import wraps
-from datetime import datetime
 
-def measure_performance(component_name, logger):
+from lib.metrics import exporter_for_logger, SETTINGS
+
+# Spans: every timed call knows its parent through a context variable, so the
+# time spent in nested timed calls is attributed as child time of the caller.
+# Sampling is decided once per root call; nested calls follow that decision.
+_current_span = contextvars.ContextVar("se_metrics_span", default=None)
+_UNSAMPLED = object()
+_span_ids = itertools.count(1)
+
+# Traces: a join/leave request carries a trace id (STRs.TRACE_ID in the JSON
+# control messages) from hop to hop. Every span finished while a trace is
+# active is labelled with it, so the log server can rebuild the request.
+_current_trace = contextvars.ContextVar("se_trace_id", default=None)
+_TRACE_ID_RE = re.compile(r"[0-9A-Za-z_-]{1,64}")
+_PID = os.getpid()  # span ids are per process; the pid tells the log server whose parent is whose
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def use_trace(trace_id):
+    """
+    Run the block (and asyncio tasks created in it) under `trace_id`.
+    A missing or malformed id (it ends up in the metric labels) leaves the
+    current trace untouched.
+    """
+    if not isinstance(trace_id, str) or not _TRACE_ID_RE.fullmatch(trace_id):
+        yield current_trace()
+        return
+    token = _current_trace.set(trace_id)
+    try:
+        yield trace_id
+    finally:
+        _current_trace.reset(token)
+
+
+class Span:
+    __slots__ = ("span_id", "parent", "start_ns", "child_ns")
+
+    def __init__(self, parent):
+        self.span_id = next(_span_ids)
+        self.parent = parent
+        self.child_ns = 0
+        self.start_ns = time.perf_counter_ns()
+
+
+def _start_span(sample_rate):
+    parent = _current_span.get()
+    if parent is _UNSAMPLED:
+        return None, None
+    if parent is None:
+        rate = SETTINGS.sample_rate if sample_rate is None else sample_rate
+        # traced requests are always kept, otherwise their waterfall has holes
+        if rate < 1.0 and _current_trace.get() is None and random.random() >= rate:
+            return None, _current_span.set(_UNSAMPLED)
+    span = Span(parent)
+    return span, _current_span.set(span)
+
+
+def _finish_span(span, token, exporter, component_name, name, kind=b""):
+    end_ns = time.perf_counter_ns()
+    if token is not None:
+        _current_span.reset(token)
+    if span is None:
+        return
+    duration_ns = end_ns - span.start_ns
+    parent = span.parent
+    if parent is not None:
+        parent.child_ns += duration_ns
+    self_ns = max(0, duration_ns - span.child_ns)
+    labels = b"span=%d,parent=%d,self_ns=%d" % (span.span_id, parent.span_id if parent else 0, self_ns)
+    trace_id = _current_trace.get()
+    if trace_id:
+        labels += b",trace=%s,pid=%d" % (trace_id.encode(), _PID)
+    exporter.record(component_name, name, duration_ns, labels + kind)
+    if span.child_ns:
+        exporter.histogram(component_name, name + "#self").record(self_ns)
+
+
+def measure_performance(component_name, logger, sample_rate=None):
     """
     Decorator factory with explicit logger.
-    Logs format:
-    [Metric] [Component] timestamp [INFO]: Function '...' executed ...
+    Each call records a numeric sample (component, function name, duration in ns,
+    self time excluding nested timed calls) on the metric channel (lib/metrics.py)
+    of the logger's log server; nothing is formatted on the calling thread.
+    `sample_rate` overrides the process-wide rate for root calls of this function.
+    Calls made under use_trace() are always sampled and labelled with the trace id.
+    When collection is switched off (lib.metrics.set_enabled / SIGUSR2) the
+    wrapper only does one attribute check.
     """
     def decorator(func):
+        name = func.__name__
+        exporter = None
+
+        def _exporter():
+            nonlocal exporter
+            if exporter is None:
+                exporter = exporter_for_logger(logger)
+            return exporter
+
         if asyncio.iscoroutinefunction(func):
             @wraps(func)
             async def async_wrapper(*args, **kwargs):
-                start_time = time.perf_counter()
-                result = await func(*args, **kwargs)
-                end_time = time.perf_counter()
-                duration = end_time - start_time
-                timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                logger.info(
-                    f"Function '{func.__name__}' executed in {duration:.6f} seconds "
-                    f"({duration * 1000:.2f} ms) at {timestamp}"
-                )
-                return result
+                if not SETTINGS.enabled:
+                    return await func(*args, **kwargs)
+                span, token = _start_span(sample_rate)
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    _finish_span(span, token, _exporter(), component_name, name)
             return async_wrapper
 
         else:
             @wraps(func)
             def sync_wrapper(*args, **kwargs):
-                start_time = time.perf_counter()
-                result = func(*args, **kwargs)
-                end_time = time.perf_counter()
-                duration = end_time - start_time
-                timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                logger.info(
-                    f"Function '{func.__name__}' executed in {duration:.6f} seconds "
-                    f"({duration * 1000:.2f} ms) at {timestamp}"
-                )
-                return result
+                if not SETTINGS.enabled:
+                    return func(*args, **kwargs)
+                span, token = _start_span(sample_rate)
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    _finish_span(span, token, _exporter(), component_name, name)
             return sync_wrapper
 
     return decorator
@@ -51,15 +150,14 @@ class PerformanceTimer:
         self.component_name = component_name
         self.block_name = block_name
         self.logger = logger
+        self.span = self.token = None
 
     def __enter__(self):
-        self.start_time = time.perf_counter()
+        if SETTINGS.enabled:
+            self.span, self.token = _start_span(None)
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        end_time = time.perf_counter()
-        duration = end_time - self.start_time
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        self.logger.info(
-            f"Code block '{self.block_name}' executed in {duration:.6f} seconds "
-            f"({duration * 1000:.2f} ms) at {timestamp}"
-        )
+        if self.token is not None:
+            _finish_span(self.span, self.token, exporter_for_logger(self.logger),
+                         self.component_name, self.block_name, b",kind=block")
+            self.span = self.token = None
@@ -0,0 +1,134 @@
+"""
+Station event pipeline of the access point.
+
+One long-lived event loop (own thread) receives station events and keeps a
+FIFO per station MAC: events of one station are handled strictly in order,
+different stations are handled in parallel on a bounded pool of worker
+threads. The handlers are the AP's async station handlers, which still make
+blocking database, socket and switch calls, so every event runs in a worker
+thread with its own asyncio.run().
+
+Per event kind three latencies are recorded on the metric channel:
+    station.<kind>.queue_wait   event received -> handler started
+    station.<kind>.handle       handler run time
+    station.<kind>.total        event received -> handler finished
+Queue depths and counters are served on GET /metrics/stats (lib/metrics.py).
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+import concurrent.futures
+from collections import deque
+
+import lib.metrics as metrics
+from lib.performance_monitor import use_trace, new_trace_id
+
+STATION_WORKERS = int(os.environ.get("SE_AP_STATION_WORKERS", "8"))   # stations handled at the same time
+
+logger = logging.getLogger(__name__)
+
+
+class StationPipeline:
+    def __init__(self, handlers: dict, component: str, metric_logger=None, workers: int = STATION_WORKERS):
+        """`handlers` maps an event kind to `async def handler(station_physical_mac_address)`."""
+        self.handlers = handlers
+        self.component = component
+        self.metric_logger = metric_logger
+        self.workers = max(1, workers)
+        self.queues: dict[str, deque] = {}     # mac -> pending (kind, trace_id, received)
+        self.active = 0
+        self.max_depth = 0
+        self.processed: dict[str, int] = {}
+        self.failed = 0
+        self.loop = None
+        self._slots = None
+        self._thread = None
+
+    # ---------------- lifecycle ----------------
+    def start(self):
+        ready = threading.Event()
+
+        def _run():
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            self.loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="station"))
+            self._slots = asyncio.Semaphore(self.workers)
+            ready.set()
+            self.loop.run_forever()
+
+        self._thread = threading.Thread(target=_run, name="station-pipeline", daemon=True)
+        self._thread.start()
+        ready.wait()
+        metrics.register_stats("station_pipeline", self.stats)
+        return self
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    # ---------------- producer side (any thread) ----------------
+    def submit(self, kind: str, mac: str, received: float | None = None) -> str:
+        """Queue one event; returns the trace id its handling runs under."""
+        trace_id = new_trace_id()
+        received = time.monotonic() if received is None else received
+        self.loop.call_soon_threadsafe(self._enqueue, kind, mac, trace_id, received)
+        return trace_id
+
+    # ---------------- loop side ----------------
+    def _enqueue(self, kind, mac, trace_id, received):
+        queue = self.queues.get(mac)
+        if queue is None:
+            queue = self.queues[mac] = deque()
+            queue.append((kind, trace_id, received))
+            self.loop.create_task(self._drain(mac, queue))
+        else:
+            queue.append((kind, trace_id, received))
+        depth = self.depth()
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    async def _drain(self, mac, queue):
+        # one drain task per station with pending events keeps that station's events in order
+        try:
+            while queue:
+                kind, trace_id, received = queue[0]
+                async with self._slots:
+                    started = time.monotonic()
+                    self.active += 1
+                    try:
+                        await asyncio.to_thread(self._handle, kind, mac, trace_id)
+                    except Exception as e:
+                        self.failed += 1
+                        logger.error(f"Station {kind} event of {mac} failed: {e!r}")
+                    finally:
+                        self.active -= 1
+                        queue.popleft()
+                finished = time.monotonic()
+                self.processed[kind] = self.processed.get(kind, 0) + 1
+                self._record(f"station.{kind}.queue_wait", started - received)
+                self._record(f"station.{kind}.handle", finished - started)
+                self._record(f"station.{kind}.total", finished - received)
+        finally:
+            if self.queues.get(mac) is queue:
+                del self.queues[mac]
+
+    def _handle(self, kind, mac, trace_id):
+        handler = self.handlers[kind]
+        with use_trace(trace_id):
+            asyncio.run(handler(station_physical_mac_address=mac))
+
+    def _record(self, name, seconds):
+        exporter = metrics.exporter_for_logger(self.metric_logger) if self.metric_logger else metrics.get_exporter()
+        exporter.record(self.component, name, int(seconds * 1e9))
+
+    # ---------------- stats ----------------
+    def depth(self) -> int:
+        return sum(len(q) for q in list(self.queues.values()))
+
+    def stats(self) -> dict:
+        return {"workers": self.workers, "active": self.active, "pending": self.depth(),
+                "stations": len(self.queues), "max_depth": self.max_depth,
+                "processed": dict(self.processed), "failed": self.failed}
@@ -0,0 +1,233 @@
+"""
+Pooled Thrift connections to bmv2 switches.
+
+connect_to_switch() used to open a new transport and download and parse the
+switch's P4 JSON for every AP announcement. The pool keeps one connection per
+(address, port) and hands out the same CLI instance again, so rediscovering an
+AP costs nothing. The P4 JSON is fetched only when the switch's config md5 is
+new. runtime_CLI keeps a single parsed model (its module-level TABLES,
+ACTIONS, ...): before each CLI command, load_config() makes it the model of
+the command's switch, re-parsing the cached JSON under CLI_LOCK only when the
+previous command went to a switch running a different program.
+
+Every Thrift client of a connection is wrapped: calls are timed per method,
+and a call that fails on a broken transport (TTransportException, socket
+errors) reconnects and is retried once. The CLI instance and its clients keep
+their identity across reconnects, so callers holding them need not care.
+Health and latency per switch are served on GET /metrics/stats as
+"switch_connections".
+"""
+import time
+import socket
+import logging
+import threading
+
+from lib.bmv2_pylibs.sswitch_CLI import runtime_CLI, SimpleSwitchAPI
+from thrift.transport.TTransport import TTransportException
+import lib.metrics as metrics
+
+DEFAULT_THRIFT_PORT = 9090
+RETRY_ERRORS = (TTransportException, socket.error, EOFError)
+
+logger = logging.getLogger(__name__)
+
+# the CLI prints its answers, so commands are captured through redirect_stdout,
+# which swaps the process-wide sys.stdout: one command at a time. The lock is
+# reentrant so read-modify-write sequences can hold it across several commands.
+# It also guards runtime_CLI's parsed model. bmv2_thrift_lib re-exports it.
+CLI_LOCK = threading.RLock()
+
+
+# ---------------- P4 JSON config ----------------
+class ConfigCache:
+    """P4 JSON by md5 and which md5 runtime_CLI's global model was parsed from."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.json_by_md5 = {}
+        self.loaded_md5 = None
+        self.downloads = 0
+        self.parses = 0
+        self.hits = 0
+
+    def fetch(self, standard_client):
+        """The switch's config md5, downloading its P4 JSON if that md5 is new."""
+        md5 = standard_client.bm_get_config_md5()
+        with self.lock:
+            if md5 in self.json_by_md5:
+                self.hits += 1
+                return md5
+        json_str = standard_client.bm_get_config()
+        with self.lock:
+            if self.json_by_md5.setdefault(md5, json_str) is json_str:
+                self.downloads += 1
+        return md5
+
+    def ensure(self, md5):
+        """Make runtime_CLI's model the one parsed from `md5`."""
+        with CLI_LOCK:
+            if md5 is None or md5 == self.loaded_md5:
+                return
+            with self.lock:
+                json_str = self.json_by_md5.get(md5)
+            if json_str is None:
+                logger.warning(f"No P4 JSON for config md5 {md5!r}, CLI model not changed")
+                return
+            runtime_CLI.load_json_str(json_str)
+            self.loaded_md5 = md5
+            self.parses += 1
+
+    def stats(self) -> dict:
+        return {"configs": len(self.json_by_md5), "downloads": self.downloads, "parses": self.parses,
+                "hits": self.hits}
+
+
+CONFIGS = ConfigCache()
+
+
+def load_config(instance):
+    """Parse the P4 model of the switch behind `instance` if another one is loaded; run under CLI_LOCK."""
+    connection = getattr(instance, "connection", None)
+    if connection is not None:
+        CONFIGS.ensure(connection.config_md5)
+
+
+# ---------------- one switch ----------------
+class _TimedClient:
+    """Stands in for a Thrift client: times its calls and reconnects on transport errors."""
+    def __init__(self, connection, index):
+        self._connection = connection
+        self._index = index
+
+    def __getattr__(self, name):
+        attr = getattr(self._connection.clients[self._index], name)
+        if not callable(attr) or name.startswith(("send_", "recv_", "_")):
+            return attr
+        connection, index = self._connection, self._index
+
+        def call(*args, **kwargs):
+            return connection.call(index, name, args, kwargs)
+        return call
+
+
+class SwitchConnection:
+    def __init__(self, address, port=DEFAULT_THRIFT_PORT):
+        self.address = address
+        self.port = port
+        self.pre = runtime_CLI.PreType.SimplePreLAG
+        self.services = runtime_CLI.RuntimeAPI.get_thrift_services(self.pre)
+        self.services.extend(SimpleSwitchAPI.get_thrift_services())
+        self.lock = threading.RLock()
+        self.clients = None
+        self.config_md5 = None
+        self.connected = False
+        self.connects = 0
+        self.reconnects = 0
+        self.last_ok = None
+        self.last_error = None
+        self.latency = {}     # method -> [calls, errors, total seconds, max seconds]
+        self.connect()
+        standard_client, mc_client, sswitch_client = (_TimedClient(self, i) for i in range(3))
+        self.instance = SimpleSwitchAPI(self.pre, standard_client, mc_client, sswitch_client)
+        self.instance.connection = self
+
+    def connect(self):
+        with self.lock:
+            self.connected = False
+            self.clients = runtime_CLI.thrift_connect(self.address, self.port, self.services)
+            # a restarted switch may run another program; it is parsed on its next CLI command
+            self.config_md5 = CONFIGS.fetch(self.clients[0])
+            self.connected = True
+            self.connects += 1
+            self.last_ok = time.time()
+
+    def close(self):
+        with self.lock:
+            for client in self.clients or []:
+                try:
+                    client._iprot.trans.close()
+                    break
+                except Exception:
+                    pass
+            self.connected = False
+
+    def call(self, index, name, args, kwargs):
+        with self.lock:
+            for attempt in (0, 1):
+                started = time.perf_counter()
+                try:
+                    result = getattr(self.clients[index], name)(*args, **kwargs)
+                except RETRY_ERRORS as e:
+                    self._record(name, time.perf_counter() - started, error=True)
+                    self.last_error = f"{name}: {e!r}"
+                    self.connected = False
+                    if attempt:
+                        raise
+                    logger.warning(f"Thrift connection to {self.address}:{self.port} broken ({e!r}), reconnecting")
+                    self.close()
+                    self.reconnects += 1
+                    self.connect()
+                    continue
+                self._record(name, time.perf_counter() - started)
+                self.last_ok = time.time()
+                return result
+
+    def _record(self, name, seconds, error=False):
+        entry = self.latency.setdefault(name, [0, 0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += error
+        entry[2] += seconds
+        entry[3] = max(entry[3], seconds)
+        metrics.get_exporter().record("Thrift", "thrift.rpc", int(seconds * 1e9), f"method={name}".encode())
+
+    def health(self) -> dict:
+        with self.lock:
+            return {"connected": self.connected, "connects": self.connects, "reconnects": self.reconnects,
+                    "config_md5": self.config_md5.hex() if isinstance(self.config_md5, bytes) else self.config_md5,
+                    "last_ok": self.last_ok, "last_error": self.last_error,
+                    "rpc": {name: {"calls": calls, "errors": errors,
+                                   "avg_ms": round(total / calls * 1000, 3) if calls else 0.0,
+                                   "max_ms": round(worst * 1000, 3)}
+                            for name, (calls, errors, total, worst) in self.latency.items()}}
+
+
+# ---------------- the pool ----------------
+class SwitchPool:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connections = {}     # (address, port) -> SwitchConnection
+        self.reused = 0
+        self._registered = False
+
+    def get(self, address, port=DEFAULT_THRIFT_PORT):
+        """The CLI instance of a switch, connecting on first use; None if it cannot be reached."""
+        key = (address, port)
+        with self.lock:
+            connection = self.connections.get(key)
+            if connection is not None:
+                self.reused += 1
+                return connection.instance
+        try:
+            connection = SwitchConnection(address, port)
+        except Exception as e:
+            logger.warning(f"Could not connect to switch {address}:{port}: {e!r}")
+            return None
+        with self.lock:
+            # another thread may have connected meanwhile; keep the first
+            first = self.connections.setdefault(key, connection)
+            if first is not connection:
+                connection.close()
+                connection = first
+            if not self._registered:
+                metrics.register_stats("switch_connections", self.stats)
+                self._registered = True
+        logger.debug(f"thrift connected to {address}:{port}")
+        return connection.instance
+
+    def stats(self) -> dict:
+        with self.lock:
+            connections = dict(self.connections)
+        return {"reused": self.reused, "config": CONFIGS.stats(),
+                "switches": {f"{address}:{port}": c.health() for (address, port), c in connections.items()}}
+
+
+SWITCHES = SwitchPool()
@@ -0,0 +1,172 @@
+"""
+Batched switch-port and broadcast-membership state of one bmv2 instance.
+
+Station handlers no longer talk to the switch CLI for their ports: they record
+the ports they want attached or detached and the ports they want in the swarm
+broadcast node, and a flusher thread applies whatever accumulated during one
+short interval (SE_AP_SWITCH_FLUSH_INTERVAL) in a single batch under the CLI
+lock. The broadcast node's ports come from the switch's multicast model
+(bmv2.mc_state), so a batch costs at most one bm_mc_node_update however many
+stations joined or left in it, instead of an mc_dump and an mc_node_update per
+station:
+
+    state = SwitchState(instance, mc_node=0).start()
+    state.attach_port(7, "se_vxlan7")
+    state.add_broadcast_port(7)
+    state.wait_applied()          # both are on the switch once this returns
+"""
+import os
+import time
+import logging
+import threading
+
+import lib.bmv2_thrift_lib as bmv2
+import lib.metrics as metrics
+
+FLUSH_INTERVAL = float(os.environ.get("SE_AP_SWITCH_FLUSH_INTERVAL", "0.05"))   # seconds changes are collected for
+APPLY_TIMEOUT = 10.0
+
+logger = logging.getLogger(__name__)
+
+
+class SwitchState:
+    def __init__(self, instance, mc_node: int = 0, interval: float = FLUSH_INTERVAL):
+        self.instance = instance
+        self.mc_node = mc_node
+        self.interval = interval
+        self.ports: dict[int, str] = {}            # desired attached ports -> interface name
+        self._port_changes: dict[int, str | None] = {}   # port -> interface to (re)attach, None to detach
+        self._broadcast_changes: dict[int, bool] = {}    # port -> member or not
+        self._cond = threading.Condition()
+        self.version = 0
+        self.applied = 0
+        self.batches = 0
+        self.port_commands = 0
+        self.mc_updates = 0
+        self.coalesced = 0
+        self.last_batch_ms = 0.0
+        self._thread = None
+
+    # ---------------- lifecycle ----------------
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="switch-state", daemon=True)
+        self._thread.start()
+        metrics.register_stats("switch_state", self.stats)
+        return self
+
+    # ---------------- desired state (any thread) ----------------
+    def _changed(self):
+        self.version += 1
+        self._cond.notify_all()
+
+    def attach_port(self, port: int, ifname: str):
+        """(Re)attach `ifname` as `port`; the port is re-added even if it exists, as its link may be new."""
+        with self._cond:
+            if port in self._port_changes:
+                self.coalesced += 1
+            self.ports[port] = ifname
+            self._port_changes[port] = ifname
+            self._changed()
+
+    def detach_port(self, port: int):
+        with self._cond:
+            if port in self._port_changes:
+                self.coalesced += 1
+            self.ports.pop(port, None)
+            self._port_changes[port] = None
+            self._changed()
+
+    def is_attached(self, port: int) -> bool:
+        with self._cond:
+            return port in self.ports
+
+    def add_broadcast_port(self, port: int):
+        self._set_broadcast(port, True)
+
+    def remove_broadcast_port(self, port: int):
+        self._set_broadcast(port, False)
+
+    def _set_broadcast(self, port, member):
+        with self._cond:
+            if port in self._broadcast_changes:
+                self.coalesced += 1
+            self._broadcast_changes[port] = member
+            self._changed()
+
+    def wait_applied(self, timeout: float = APPLY_TIMEOUT) -> bool:
+        """Block until every change made before this call is on the switch."""
+        with self._cond:
+            target = self.version
+            return self._cond.wait_for(lambda: self.applied >= target, timeout)
+
+    # ---------------- flusher ----------------
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self.applied < self.version)
+            # let the changes of stations handled at the same time join this batch
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Applying switch state failed: {e!r}")
+                time.sleep(1)
+
+    def flush(self):
+        """Apply the accumulated changes now, in one batch."""
+        with self._cond:
+            version = self.version
+            port_changes, self._port_changes = self._port_changes, {}
+            broadcast_changes, self._broadcast_changes = self._broadcast_changes, {}
+        started = time.perf_counter()
+        try:
+            with bmv2.CLI_LOCK:
+                for port, ifname in port_changes.items():
+                    self._command(f"port_remove {port}")
+                    if ifname is not None:
+                        self._command(f"port_add {ifname} {port}")
+                if broadcast_changes:
+                    self._apply_broadcast(broadcast_changes)
+        except Exception:
+            # keep the batch for the next attempt unless newer changes replaced it
+            with self._cond:
+                for port, ifname in port_changes.items():
+                    self._port_changes.setdefault(port, ifname)
+                for port, member in broadcast_changes.items():
+                    self._broadcast_changes.setdefault(port, member)
+            raise
+        with self._cond:
+            self.batches += 1
+            self.last_batch_ms = (time.perf_counter() - started) * 1000
+            self.applied = version
+            self._cond.notify_all()
+
+    def _apply_broadcast(self, changes):
+        mc = bmv2.mc_state(self.instance)
+        ports = mc.node_ports(self.mc_node)
+        if ports is None:
+            logger.warning(f"Multicast node {self.mc_node} not found on the switch, broadcast ports not updated")
+            return
+        wanted = set(ports)
+        for port, member in changes.items():
+            if member:
+                wanted.add(port)
+            else:
+                wanted.discard(port)
+        if wanted != ports and mc.set_node_ports(self.mc_node, wanted):
+            self.mc_updates += 1
+
+    def _command(self, command):
+        self.port_commands += 1
+        return bmv2.send_cli_command_to_bmv2(cli_command=command, instance=self.instance)
+
+    # ---------------- stats ----------------
+    def stats(self) -> dict:
+        multicast = bmv2.mc_state(self.instance).stats()
+        with self._cond:
+            return {"ports": len(self.ports), "pending_ports": len(self._port_changes),
+                    "pending_broadcast": len(self._broadcast_changes),
+                    "multicast": multicast,
+                    "batches": self.batches, "port_commands": self.port_commands,
+                    "mc_updates": self.mc_updates, "coalesced": self.coalesced,
+                    "last_batch_ms": round(self.last_batch_ms, 3)}
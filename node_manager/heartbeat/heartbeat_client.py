@@ -9,10 +9,16 @@ import argparse
 import tempfile
 import logging
 import binascii
+import threading
 
 # ---------------- Config ----------------
 DEFAULT_CHAIN_LENGTH = 100
 DEFAULT_HASH_FUNCTION = hashlib.sha256
+DEFAULT_ROLLOVER_MARGIN = 3      # last N chain elements that announce the next public key
+ROLLOVER_REGISTER_RETRY = 10.0   # seconds between TCP registrations of a rolled-over key that failed
+ROLLOVER_REGISTER_TIMEOUT = 1.0  # short, the heartbeat loop waits for it
+NEXT_CHAIN_SUBDIR = "next"
+CHAIN_FILES = ("private_key.bin", "winternitz_chain.bin", "public_key.bin")
 # ----------------------------------------
 
 logging.basicConfig(
@@ -89,7 +95,7 @@ def send_public_key(coord_ip: str, tcp_port: int, client_id: str, output_dir: st
     with open(pk_path, "rb") as f:
         pk_hex = binascii.hexlify(f.read()).decode()
 
-    payload = f"{client_id}|{pk_hex}".encode()
+    payload = f"{client_id}|{pk_hex}\n".encode()
 
     try:
         with socket.create_connection((coord_ip, tcp_port), timeout=timeout) as s:
@@ -104,8 +110,46 @@ def send_public_key(coord_ip: str, tcp_port: int, client_id: str, output_dir: st
         logging.error(f"[PK] Failed to deliver public key to {coord_ip}:{tcp_port}: {e}")
         return False
 
+# ---------- Chain Rollover ----------
+class NextChain:
+    """
+    Successor chain generated in a background thread while the current one is
+    still in use. Its public key is announced over the heartbeat channel on the
+    last elements of the current chain; as those datagrams may all be lost, it is
+    also registered over TCP once the client has moved over.
+    """
+    def __init__(self, output_dir, chain_length):
+        self.output_dir = output_dir
+        self.next_dir = os.path.join(output_dir, NEXT_CHAIN_SUBDIR)
+        self.chain_length = chain_length
+        self.points = None
+        self._thread = threading.Thread(target=self._generate, daemon=True)
+        self._thread.start()
+
+    def _generate(self):
+        try:
+            self.points = generate_winternitz_chain(self.next_dir, chain_length=self.chain_length)
+        except Exception as e:
+            logging.error(f"[ROLL] Next chain generation failed: {e}")
+
+    def wait(self, timeout=None):
+        self._thread.join(timeout)
+        return self.points is not None
+
+    @property
+    def public_key(self):
+        return self.points[-1]
+
+    def promote(self):
+        """Move the successor chain files over the current ones and return its points."""
+        for name in CHAIN_FILES:
+            os.replace(os.path.join(self.next_dir, name), os.path.join(self.output_dir, name))
+        try: os.rmdir(self.next_dir)
+        except OSError: pass
+        return self.points
+
 # ---------- Heartbeat Sending ----------
-def send_heartbeat(sock, server_address, client_id, chain_points, i):
+def send_heartbeat(sock, server_address, client_id, chain_points, i, next_public_key=None):
     if i >= len(chain_points):
         logging.error("Chain exhausted. Cannot send more heartbeats.")
         return False
@@ -115,13 +159,17 @@ def send_heartbeat(sock, server_address, client_id, chain_points, i):
     w_i = chain_points[-(i + 1)]
 
     payload = client_id.encode() + b"|" + timestamp + b"|" + str(i).encode()
+    if next_public_key is not None:
+        # payload := client_id|timestamp|i|<next_public_key_hex>, bound to w_i by the authenticator
+        payload += b"|" + binascii.hexlify(next_public_key)
     authenticator = DEFAULT_HASH_FUNCTION(payload + w_i).digest()
 
     message = payload + b"||" + w_i + b"||" + authenticator
 
     try:
         sock.sendto(message, server_address)
-        logging.info(f"Sent heartbeat {i}/{len(chain_points)-1} - Timestamp={timestamp.decode()}")
+        logging.info(f"Sent heartbeat {i}/{len(chain_points)-1} - Timestamp={timestamp.decode()}"
+                     + (" (rollover announce)" if next_public_key is not None else ""))
     except Exception as e:
         logging.error(f"Failed to send heartbeat {i}: {e}")
         return False
@@ -138,6 +186,8 @@ def main():
     parser.add_argument("--pubkey-port", type=int, default=5007, help="Coordinator TCP port for public key registration")
     parser.add_argument("--client-id", required=True, help="Unique client ID (UUID)")
     parser.add_argument("--interval", type=float, default=1.0, help="Heartbeat interval in seconds")
+    parser.add_argument("--rollover-margin", type=int, default=DEFAULT_ROLLOVER_MARGIN,
+                        help="Number of final chain elements that announce the next chain (0 disables rollover)")
     parser.add_argument("--debug", action="store_true", help="Enable debug output")
     args = parser.parse_args()
 
@@ -167,9 +217,41 @@ def main():
 
     with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
         i = 1
-        while RUNNING and i < len(chain_points):
-            if not send_heartbeat(sock, server_address, args.client_id, chain_points, i):
+        next_chain = None
+        announced = False
+        register_at = None      # when to (re)register the rolled-over public key over TCP
+        while RUNNING:
+            last = len(chain_points) - 1
+            if i > last:
+                if not announced:
+                    break
+                # The Coordinator switched anchors on the first announcement it verified,
+                # if any got through; the TCP registration below covers the case none did
+                chain_points = next_chain.promote()
+                logging.info(f"[ROLL] Rolled over to next chain, public key {chain_points[-1].hex()[:16]}...")
+                i, next_chain, announced = 1, None, False
+                register_at = 0.0
+                continue
+
+            if register_at is not None and time.monotonic() >= register_at:
+                # a no-op for the Coordinator if it already switched on an announcement
+                if send_public_key(args.receiver_ip, args.pubkey_port, args.client_id, args.output_dir,
+                                   timeout=ROLLOVER_REGISTER_TIMEOUT):
+                    register_at = None
+                else:
+                    logging.error(f"[ROLL] Next public key not registered, retrying in {ROLLOVER_REGISTER_RETRY:.0f} s")
+                    register_at = time.monotonic() + ROLLOVER_REGISTER_RETRY
+
+            if args.rollover_margin > 0 and next_chain is None and i >= last // 2:
+                next_chain = NextChain(args.output_dir, last)
+
+            next_pk = None
+            if next_chain is not None and i > last - args.rollover_margin and next_chain.wait():
+                next_pk = next_chain.public_key
+
+            if not send_heartbeat(sock, server_address, args.client_id, chain_points, i, next_pk):
                 break
+            announced = announced or next_pk is not None
             i += 1
             time.sleep(args.interval)
 
@@ -122,7 +122,7 @@ def send_public_key(coord_ip, tcp_port, client_id, timeout=5):
         return False
     with open(PUBLIC_KEY, "rb") as f:
         pk_hex = binascii.hexlify(f.read()).decode()
-    payload = f"{client_id}|{pk_hex}".encode()
+    payload = f"{client_id}|{pk_hex}\n".encode()
 
     try:
         with socket.create_connection((coord_ip, tcp_port), timeout=timeout) as s:
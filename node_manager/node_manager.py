@@ -20,6 +20,7 @@ import lib.global_config as cfg
 from lib.helper_functions import *
 import lib.global_constants as cts
 import lib.helper_functions as utils
+from lib.performance_monitor import measure_performance, use_trace
 from pathlib import Path
 
 STRs = cts.String_Constants 
@@ -108,6 +109,7 @@ def stop_heartbeat_service_if_running():
     hb_process = None
 
 
+@measure_performance("Node Manager", logger)
 def handle_successful_join(config_data: dict, ap_address: tuple, client_id: str = None):
     if client_id is None:
         client_id = SELF_UUID
@@ -172,58 +174,61 @@ def handle_communication():
             config_data = json.loads(comm_buffer)
             logger.debug(f'config_data: {config_data}')                                         
 
-            if config_data[STRs.TYPE.name] == STRs.SET_CONFIG.name:
-                logger.debug(f'Handling Join Type {STRs.SET_CONFIG.name}')
-                try:
-                    if STRs.VXLAN_ID.name in config_data.keys():
-                        install_swarmNode_config(config_data)
-                    else:
-                        install_config_no_update_vxlan(config_data)
-
-                    # ✅ Heartbeat handling directly here
-                    hb_enabled = bool(config_data.get("heartbeat", False))
-                    if hb_enabled:
-                        ap_ip = config_data.get("AP_SWARM_IP") or config_data.get("HB_DST_IP") or ap_address[0]
-                        coord_ip = ap_ip.replace("10.0.", "10.1.") if ap_ip.startswith("10.0.") else ap_ip
-                        logger.info(f"[HB] Heartbeat ENABLED by Coordinator. Using coord_ip={coord_ip}")
-                        start_heartbeat_service(
-                            client_id=SELF_UUID,
-                            coord_ip=coord_ip,
-                            pubkey_port=5007,
-                            hb_port=5008,
-                            interval=1.0
-                        )
-                    else:
-                        logger.info("[HB] Heartbeat DISABLED by Coordinator.")
-                        stop_heartbeat_service_if_running()
-
-                    handle_successful_join(config_data, ap_address, client_id=SELF_UUID)
-                except Exception as e:
-                    logger.error(repr(e))
-                    return
-
-            elif config_data[STRs.TYPE.name] == 'go_away':
-                print('Leaving Swarm')
-                cli_command = f'nmcli connection show --active'
-                res = subprocess.run(cli_command.split(), text=True, stdout=subprocess.PIPE)
-                ap_ssid = ''
-                for line in res.stdout.strip().splitlines():
-                    if DEFAULT_IFNAME in line:
-                        ap_ssid = line.split()[0]
-                cli_command = f'nmcli connection down id {ap_ssid}'
-                subprocess.run(cli_command.split(), text=True)
-                time.sleep(1)
-                cli_command = f'nmcli connection up id {ap_ssid}'
-                subprocess.run(cli_command.split(), text=True)
-
-                # ✅ Stop heartbeat when leaving
-                stop_heartbeat_service_if_running()
-                pass
+            # the trace id comes from the AP or the Coordinator, whichever started the join/leave
+            with use_trace(config_data.get(STRs.TRACE_ID.name)):
+                if config_data[STRs.TYPE.name] == STRs.SET_CONFIG.name:
+                    logger.debug(f'Handling Join Type {STRs.SET_CONFIG.name}')
+                    try:
+                        if STRs.VXLAN_ID.name in config_data.keys():
+                            install_swarmNode_config(config_data)
+                        else:
+                            install_config_no_update_vxlan(config_data)
+
+                        # ✅ Heartbeat handling directly here
+                        hb_enabled = bool(config_data.get("heartbeat", False))
+                        if hb_enabled:
+                            ap_ip = config_data.get("AP_SWARM_IP") or config_data.get("HB_DST_IP") or ap_address[0]
+                            coord_ip = ap_ip.replace("10.0.", "10.1.") if ap_ip.startswith("10.0.") else ap_ip
+                            logger.info(f"[HB] Heartbeat ENABLED by Coordinator. Using coord_ip={coord_ip}")
+                            start_heartbeat_service(
+                                client_id=SELF_UUID,
+                                coord_ip=coord_ip,
+                                pubkey_port=5007,
+                                hb_port=5008,
+                                interval=1.0
+                            )
+                        else:
+                            logger.info("[HB] Heartbeat DISABLED by Coordinator.")
+                            stop_heartbeat_service_if_running()
+
+                        handle_successful_join(config_data, ap_address, client_id=SELF_UUID)
+                    except Exception as e:
+                        logger.error(repr(e))
+                        return
+
+                elif config_data[STRs.TYPE.name] == 'go_away':
+                    print('Leaving Swarm')
+                    cli_command = f'nmcli connection show --active'
+                    res = subprocess.run(cli_command.split(), text=True, stdout=subprocess.PIPE)
+                    ap_ssid = ''
+                    for line in res.stdout.strip().splitlines():
+                        if DEFAULT_IFNAME in line:
+                            ap_ssid = line.split()[0]
+                    cli_command = f'nmcli connection down id {ap_ssid}'
+                    subprocess.run(cli_command.split(), text=True)
+                    time.sleep(1)
+                    cli_command = f'nmcli connection up id {ap_ssid}'
+                    subprocess.run(cli_command.split(), text=True)
+
+                    # ✅ Stop heartbeat when leaving
+                    stop_heartbeat_service_if_running()
+                    pass
 
             remote_socket.sendall(bytes("OK!".encode()))
             remote_socket.close()
 
 
+@measure_performance("Node Manager", logger)
 def install_config_no_update_vxlan(config_data):
     swarm_veth1_vip = config_data[STRs.VETH1_VIP.name]
     swarm_veth1_vmac = config_data[STRs.VETH1_VMAC.name]
@@ -252,6 +257,7 @@ def install_config_no_update_vxlan(config_data):
                 f"MTU=1400, default route via veth1")
 
 
+@measure_performance("Node Manager", logger)
 def install_swarmNode_config(swarmNode_config):
     global last_request_id, gb_swarmNode_config, ACCESS_POINT_IP
 
@@ -1,7 +1,9 @@
 import socket
 import json
 import sys
+import os
 import argparse
+import secrets
 
 # === Constants ===
 str_TYPE = 'Type'
@@ -13,6 +15,7 @@ str_HEARTBEAT = 'heartbeat'
 str_HB_LENGTH = 'hb_length'
 str_HB_WINDOW = 'hb_window'
 str_HB_INTERVAL = 'hb_interval'
+str_TRACE_ID = 'TRACE_ID'
 
 # === STEP 1: Parse arguments ===
 parser = argparse.ArgumentParser(description="Send join request to Coordinator")
@@ -27,19 +30,23 @@ parser.add_argument("--heartbeat", choices=["true", "false"], default="false", h
 parser.add_argument("--length", type=int, help="Heartbeat chain length (e.g., 100, 500, 1000, ...)")
 parser.add_argument("--window", type=int, help="Heartbeat verification window (e.g., 2, 3, 4, 5)")
 parser.add_argument("--interval", type=float, help="Heartbeat interval in seconds (e.g., 1, 2, 3)")
+parser.add_argument("--trace-id", default=os.environ.get("SE_TRACE_ID"),
+                    help="Trace id to follow this join in the GUI (generated if omitted)")
 
 args = parser.parse_args()
 
 uuid = args.uuid
 swarm = args.swarm
 heartbeat_enabled = args.heartbeat.lower() == "true"
+trace_id = args.trace_id or secrets.token_hex(8)
 
 # === STEP 2: Build message with dynamic UUID, swarm, and heartbeat ===
 message = {
     str_TYPE: str_NODE_JOIN_LIST,
     str_NODE_IDS: [uuid],
     str_SWARM: swarm,
-    str_HEARTBEAT: heartbeat_enabled
+    str_HEARTBEAT: heartbeat_enabled,
+    str_TRACE_ID: trace_id
 }
 
 # Add heartbeat parameters only if heartbeat is enabled
@@ -53,6 +60,7 @@ if heartbeat_enabled:
 
 # Serialize
 str_message = json.dumps(message)
+print(f"trace id: {trace_id}")
 print("message is: ")
 print(str_message)
 # === STEP 3: Send message to Coordinator over TCP ===
@@ -1,10 +1,13 @@
 import socket
 import json
 import sys
+import os
+import secrets
 
 str_TYPE = 'Type'
 str_NODE_LEAVE_LIST = 'nll'
 str_NODE_IDS = 'nids'
+str_TRACE_ID = 'TRACE_ID'
 
 # === STEP 1: Parse UUID from command-line args ===
 if len(sys.argv) < 2:
@@ -12,15 +15,18 @@ if len(sys.argv) < 2:
     sys.exit(1)
 
 uuid = sys.argv[1]
+trace_id = os.environ.get("SE_TRACE_ID") or secrets.token_hex(8)
 
 # === STEP 2: Build message with dynamic UUID ===
 message = {
     str_TYPE: str_NODE_LEAVE_LIST,
-    str_NODE_IDS: [uuid]
+    str_NODE_IDS: [uuid],
+    str_TRACE_ID: trace_id
 }
 
 str_message = json.dumps(message)
 
+print(f"trace id: {trace_id}")
 print("message is: ")
 print(str_message)
 
@@ -0,0 +1,109 @@
+"""
+Throughput of the GUI log server's ingestion path (GUI/backend/log_ingest.py),
+without the WebSocket fan-out: regex vs prefix parsing, and readline-per-line
+vs chunked reads through an asyncio StreamReader.
+
+    python3 tests/bench_log_ingest.py --lines 200000
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'GUI', 'backend')))
+from log_parser import LOG_PATTERN, parse_log_line
+from log_ingest import ingest_stream, parse_batch, IngestStats
+
+
+def make_lines(count: int, malformed: float) -> list[str]:
+    rnd = random.Random(1)
+    lines = []
+    for n in range(count):
+        if rnd.random() < malformed:
+            lines.append(f"Traceback line {n} from Access Point")
+        elif n % 2:
+            lines.append(f"[Metric] [Coordinator] 2025-07-29 11:03:42 [INFO]: Function 'insert_into_art' "
+                         f"executed in 0.00{n % 1000:03d} seconds ({n % 1000 / 100:.2f} ms) at 2025-07-29 11:03:42")
+        else:
+            lines.append(f"[Console] [Access Point] 2025-07-29 11:03:42 [DEBUG]: Added entry with handle {n}")
+    return lines
+
+
+def report(name: str, count: int, elapsed: float):
+    print(f"{name:<28} {count:>9} lines  {elapsed * 1e3:>9.1f} ms  {count / elapsed:>12.0f} lines/s")
+
+
+async def feed(data: bytes, chunk: int) -> asyncio.StreamReader:
+    reader = asyncio.StreamReader(limit=2 ** 20)
+    for i in range(0, len(data), chunk):
+        reader.feed_data(data[i:i + chunk])
+    reader.feed_eof()
+    return reader
+
+
+async def bench_readline(data: bytes, chunk: int) -> int:
+    """The previous handler: one readline(), regex match and await per line."""
+    reader = await feed(data, chunk)
+    count = 0
+    while True:
+        raw = await reader.readline()
+        if not raw:
+            break
+        line = raw.decode().strip()
+        if line:
+            match = LOG_PATTERN.match(line)
+            _ = match.groupdict() if match else {"type": "Console", "message": line}
+            count += 1
+    return count
+
+
+async def bench_chunked(data: bytes, chunk: int) -> int:
+    reader = await feed(data, chunk)
+    stats = IngestStats()
+    count = 0
+
+    async def sink(entries):
+        nonlocal count
+        count += len(entries)
+
+    await ingest_stream(reader, sink, stats)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="log ingestion benchmark")
+    parser.add_argument("--lines", type=int, default=200000)
+    parser.add_argument("--malformed", type=float, default=0.01, help="fraction of lines not in the log format")
+    parser.add_argument("--chunk", type=int, default=16384, help="bytes per TCP segment fed to the reader")
+    args = parser.parse_args()
+
+    lines = make_lines(args.lines, args.malformed)
+    data = ("\n".join(lines) + "\n").encode()
+
+    t0 = time.perf_counter()
+    for line in lines:
+        LOG_PATTERN.match(line)
+    report("regex match", len(lines), time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    for line in lines:
+        parse_log_line(line)
+    report("prefix parser (+fallback)", len(lines), time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    parse_batch(lines)
+    report("parse_batch", len(lines), time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    count = asyncio.run(bench_readline(data, args.chunk))
+    report("readline + regex", count, time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    count = asyncio.run(bench_chunked(data, args.chunk))
+    report("chunked ingest_stream", count, time.perf_counter() - t0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Record nl80211 station events of an interface as JSON lines, for replay by the
+access point (SE_AP_STATION_EVENTS=<file>) or by lib.netlink.nl80211.FakeStationEvents.
+
+    sudo python3 tests/record_station_events.py --ifname wlan0 --out stations.jsonl
+    python3 tests/record_station_events.py --replay stations.jsonl --speed 10
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from lib.netlink.nl80211 import Nl80211Listener, FakeStationEvents
+
+
+def main():
+    parser = argparse.ArgumentParser(description="record or replay nl80211 station events")
+    parser.add_argument("--ifname", default=None, help="interface to follow (default: all)")
+    parser.add_argument("--out", default=None, help="append recorded events to this file")
+    parser.add_argument("--replay", default=None, help="print the events of a recorded file instead")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed factor")
+    args = parser.parse_args()
+
+    if args.replay:
+        source = FakeStationEvents.load(args.replay, realtime=True, speed=args.speed)
+    else:
+        source = Nl80211Listener(ifname=args.ifname)
+    out = open(args.out, "a") if args.out else None
+    try:
+        for event in source.events():
+            print(f"{time.strftime('%H:%M:%S', time.localtime(event.timestamp))} "
+                  f"{event.ifname}: {event.kind} station {event.mac}")
+            if out:
+                out.write(event.to_json() + "\n")
+                out.flush()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if out:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()